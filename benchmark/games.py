@@ -0,0 +1,19 @@
+import pydealer
+
+from game.kuhn import KuhnGame
+from game.player import create_player_set
+from ld.liarsdice import LDGame
+
+
+def kuhn_game(num_players):
+    """Kuhn poker for num_players with one card each, dealt from the highest
+    num_players + 1 spades, and its players."""
+    names = ['10 of Spades', 'Jack of Spades', 'Queen of Spades', 'King of Spades']
+    cards = pydealer.Deck().get_list(names[-(num_players + 1):])
+    players = create_player_set(num_players)
+    return KuhnGame(players, cards, 1), players
+
+
+def liars_dice(num_die, max_cached_nodes=None):
+    players = create_player_set(2)
+    return LDGame(players, num_die, max_cached_nodes), players
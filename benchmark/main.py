@@ -0,0 +1,42 @@
+import argparse
+import fnmatch
+import sys
+
+from benchmark.runner import run_benchmarks, save_report, load_report, compare
+from benchmark.scenarios import scenario_names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures solver throughput, memory and convergence.")
+    parser.add_argument('scenarios', nargs='*', default=['*'],
+                        help="'game/solver' patterns, e.g. 'kuhn*/external_sampling' (default: all)")
+    parser.add_argument('--budget', type=float, default=10., help="wall clock seconds per scenario")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON report here")
+    parser.add_argument('--baseline', help="compare against the JSON report of an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="relative change of a metric that counts as a regression")
+    parser.add_argument('--list', action='store_true', help="list the scenarios and exit")
+    args = parser.parse_args(argv)
+
+    names = [name for name in scenario_names() if any(fnmatch.fnmatch(name, pattern) for pattern in args.scenarios)]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    report = run_benchmarks(names, args.budget, args.seed)
+    for result in report['results']:
+        print("{scenario:32} {iterations_per_sec:12.1f} it/s {nodes_per_sec:14.0f} nodes/s "
+              "{peak_rss_bytes:>12} B peak {bytes_per_infoset:8.0f} B/infoset exploitability {exploitability}".format(**result))
+    if args.output:
+        save_report(report, args.output)
+
+    if args.baseline:
+        regressions = [row for row in compare(report, load_report(args.baseline), args.tolerance) if row['regression']]
+        for row in regressions:
+            print("regression: {scenario} {metric} {value:.4g} vs {baseline:.4g} ({ratio:.2f}x)".format(**row))
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
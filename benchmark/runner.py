@@ -0,0 +1,156 @@
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+
+import numpy as np
+
+from benchmark.scenarios import create_scenario
+from optimizer.exploitability import BestResponse
+
+# metric: True where higher is better
+METRICS = {
+    'iterations_per_sec': True,
+    'nodes_per_sec': True,
+    'peak_rss_bytes': False,
+    'bytes_per_infoset': False,
+    'exploitability': False,
+}
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _count_decision_visits(solver, iterations):
+    # every visit of a decision node looks up one current strategy
+    infosets = solver.infosets
+    visits = [0]
+
+    def counting(lookup):
+        def counted(iid):
+            visits[0] += 1
+            return lookup(iid)
+        return counted
+
+    infosets.current_strategy = counting(infosets.current_strategy)
+    infosets.cached_strategy = counting(infosets.cached_strategy)
+    try:
+        solver.run(iterations=iterations)
+    finally:
+        del infosets.current_strategy
+        del infosets.cached_strategy
+    return visits[0]
+
+
+def run_scenario(name, budget, seed=0):
+    """Runs scenario 'game/solver' for budget seconds of wall clock time and
+    returns its measurements as a dict.
+
+    Iterations run in doubling chunks until the budget is spent; building the
+    game and solver is not timed. Exploitability is that of the average
+    strategy at the end of the budget, None where the best response is too
+    large to compute (two dice Liar's dice). Nodes are decision node visits,
+    counted on a few extra iterations after the timed ones; the
+    vectorized solvers touch every node once per iteration without looking up
+    strategies one by one, so their node counts are the tree's size.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    game, players, solver, exploitability_available = create_scenario(name)
+
+    iterations, chunk = 0, 1
+    start = time.perf_counter()
+    while time.perf_counter() - start < budget:
+        solver.run(iterations=chunk)
+        iterations += chunk
+        if time.perf_counter() - start < budget / 4:
+            chunk *= 2
+    seconds = time.perf_counter() - start
+
+    num_infosets = len(solver.infosets)
+    exploitability = None
+    if exploitability_available:
+        exploitability = BestResponse(game, players).exploitability(solver.infosets)
+
+    counted_iterations = max(1, min(iterations, 10))
+    visits = _count_decision_visits(solver, counted_iterations)
+    if visits == 0 and solver.tree is not None:
+        visits = solver.tree.num_nodes * counted_iterations
+    elif visits == 0 and hasattr(solver, 'public_tree'):
+        visits = solver.public_tree.num_nodes * counted_iterations
+    nodes_per_iteration = visits / counted_iterations
+    return {
+        'scenario': name,
+        'iterations': iterations,
+        'seconds': seconds,
+        'iterations_per_sec': iterations / seconds,
+        'nodes_per_iteration': nodes_per_iteration,
+        'nodes_per_sec': nodes_per_iteration * iterations / seconds,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'num_infosets': num_infosets,
+        'bytes_per_infoset': solver.infosets.used_nbytes() / max(num_infosets, 1),
+        'exploitability': exploitability,
+    }
+
+
+def _run_isolated(arguments):
+    return run_scenario(*arguments)
+
+
+def run_benchmarks(names, budget, seed=0, isolate=True):
+    """Runs every scenario in names and returns the report: machine and
+    library versions and one result per scenario. With isolate, every scenario
+    runs in a fresh process so peak RSS is its own."""
+    results = []
+    for name in names:
+        if isolate:
+            with multiprocessing.get_context('spawn').Pool(1) as pool:
+                results.append(pool.apply(_run_isolated, ((name, budget, seed),)))
+        else:
+            results.append(run_scenario(name, budget, seed))
+    return {
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__,
+                    'platform': platform.platform(), 'processor': platform.processor()},
+        'budget': budget,
+        'seed': seed,
+        'results': results,
+    }
+
+
+def save_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(report, baseline, tolerance=0.1):
+    """Compares the results of report against those of baseline for the
+    scenarios they share. Returns one dict per scenario and metric with both
+    values, their ratio and whether the change is a regression, i.e. worse by
+    more than tolerance (a fraction of the baseline value)."""
+    baseline_results = {result['scenario']: result for result in baseline['results']}
+    comparison = []
+    for result in report['results']:
+        expected = baseline_results.get(result['scenario'])
+        if expected is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            value, reference = result.get(metric), expected.get(metric)
+            if value is None or reference is None:
+                continue
+            ratio = value / reference if reference else float('inf') if value else 1.
+            worse = ratio < 1. - tolerance if higher_is_better else ratio > 1. + tolerance
+            comparison.append({'scenario': result['scenario'], 'metric': metric, 'value': value,
+                               'baseline': reference, 'ratio': ratio, 'regression': worse})
+    return comparison
@@ -0,0 +1,48 @@
+from benchmark.games import kuhn_game, liars_dice
+from optimizer.cfr import VanillaCFR, ChanceSamplingCFR, ExternalSamplingCFR, OutcomeSamplingCFR, CFRPlusSolver, \
+    DiscountedCFR, VectorizedCFR, VectorFormCFR
+from optimizer.compiled import compile_game_tree
+
+
+# game name: (create game and players, whether exploitability can be computed)
+GAMES = {
+    'kuhn2': (lambda: kuhn_game(2), True),
+    'kuhn3': (lambda: kuhn_game(3), True),
+    'ld1': (lambda: liars_dice(1), True),
+    # the full two dice tree does not fit in memory, only the solvers sampling actions run on it, transient
+    'ld2': (lambda: liars_dice(2, max_cached_nodes=0), False),
+}
+
+# solver name: create the solver from (game, players)
+SOLVERS = {
+    'vanilla': lambda game, players: VanillaCFR(game.create_root_node(), players),
+    'cfr_plus': lambda game, players: CFRPlusSolver(game.create_root_node(), players),
+    'dcfr': lambda game, players: DiscountedCFR(game.create_root_node(), players),
+    'vectorized': lambda game, players: VectorizedCFR(compile_game_tree(game.create_root_node(), players), players),
+    'vector_form': lambda game, players: VectorFormCFR(game, players),
+    'chance_sampling': lambda game, players: ChanceSamplingCFR(game.create_root_node(), players),
+    'external_sampling': lambda game, players: ExternalSamplingCFR(game.create_root_node(), players),
+    'outcome_sampling': lambda game, players: OutcomeSamplingCFR(game.create_root_node(), players),
+}
+
+FULL_WIDTH = ('vanilla', 'cfr_plus', 'dcfr', 'vectorized', 'vector_form')
+SAMPLED = ('chance_sampling', 'external_sampling', 'outcome_sampling')
+# chance sampling still walks every betting sequence, too many with two dice
+ACTION_SAMPLED = ('external_sampling', 'outcome_sampling')
+
+
+def scenario_names():
+    """Every game and solver combination that fits in memory, as 'game/solver'."""
+    names = []
+    for game in GAMES:
+        solvers = ACTION_SAMPLED if game == 'ld2' else FULL_WIDTH + SAMPLED
+        names.extend('{}/{}'.format(game, solver) for solver in solvers)
+    return names
+
+
+def create_scenario(name):
+    """Returns (game, players, solver, exploitability_available) of scenario 'game/solver'."""
+    game_name, solver_name = name.split('/')
+    create_game, exploitability = GAMES[game_name]
+    game, players = create_game()
+    return game, players, SOLVERS[solver_name](game, players), exploitability
@@ -1,16 +1,20 @@
 from game.poker import PokerActions
 from game.player import ChancePlayer
 import itertools
+import operator
 import random
 import numpy as np
 
 class GameStateBase:
+    """A node of the game tree. Nodes are slotted and hold only what differs
+    between siblings; players, card counts and betting sequences are shared
+    through the game and its interned histories. Subclasses provide actions
+    and get_player_to_move."""
 
-    def __init__(self, parent, player_to_move, actions):
-        self.parent = parent
-        self._player_to_move = player_to_move
+    __slots__ = ('_children',)
+
+    def __init__(self):
         self._children = None
-        self.actions = actions
 
     def get_children(self):
         if not self._children:
@@ -28,28 +32,133 @@ class GameStateBase:
         return self._children[action]
 
     def is_chance(self):
-        return self._player_to_move == ChancePlayer
+        return self.get_player_to_move() == ChancePlayer
 
     def get_player_to_move(self):
-        return self._player_to_move
+        raise NotImplementedError("Abstract Method")
 
     def inf_set(self):
         raise NotImplementedError("Please implement information_set method")
 
+def _information_set(known_card, actions_history):
+    action_list = ".".join([str(a) for _, a in actions_history])
+    return "{0}.{1}".format(known_card, action_list)
+
+_OPENING_ACTIONS = [PokerActions.RAISE_1, PokerActions.CHECK]
+_FACING_RAISE_ACTIONS = [PokerActions.FOLD, PokerActions.CALL]
+_NO_ACTIONS = []
+
+class BettingHistory:
+    """An immutable betting sequence, stored as its last action and a link to
+    the sequence before it, with the running state of the hand.
+
+    Histories are interned: extending a history by the same action always
+    returns the same object, shared by every deal, and each history has a
+    small integer index, so information sets are keyed by
+    ``index * num_cards + card``. KuhnGame interns every history up front in
+    breadth first order, so indices only depend on the number of players.
+    """
+
+    __slots__ = ('previous', 'player_index', 'action', 'index', '_histories', '_next', 'length', 'raiser', 'pot',
+                 'contributions', 'folded', 'actions', 'to_move')
+
+    def __init__(self, previous, player_index, action, num_players, histories):
+        self.previous = previous
+        self.player_index = player_index
+        self.action = action
+        self.index = len(histories)
+        self._histories = histories
+        self._next = {}
+        histories.append(self)
+        # index of the player to move after this sequence
+        self.to_move = (player_index + 1) % num_players if previous is not None else 0
+
+        if previous is None:
+            self.length = 0
+            self.raiser = None
+            self.pot = num_players
+            self.contributions = (1,) * num_players
+            self.folded = frozenset()
+            self.actions = _OPENING_ACTIONS
+            return
+
+        self.length = previous.length + 1
+        self.raiser = player_index if previous.raiser is None and action == PokerActions.RAISE_1 else previous.raiser
+        self.pot = previous.pot
+        self.contributions = previous.contributions
+        if action == PokerActions.RAISE_1 or action == PokerActions.CALL:
+            self.pot += 1
+            self.contributions = previous.contributions[:player_index] + (2,) + previous.contributions[player_index + 1:]
+        self.folded = previous.folded | {player_index} if action == PokerActions.FOLD else previous.folded
+
+        next_player = (player_index + 1) % num_players
+        if self.raiser is not None:
+            self.actions = _FACING_RAISE_ACTIONS if self.raiser != next_player else _NO_ACTIONS
+        else:
+            # all checks
+            self.actions = _NO_ACTIONS if self.length == num_players else _OPENING_ACTIONS
+
+    def play(self, action):
+        history = self._next.get(action)
+        if history is None:
+            history = self._next[action] = BettingHistory(self, self.to_move, action, len(self.contributions),
+                                                          self._histories)
+        return history
+
+    def actions_history(self):
+        """The sequence as a list of (player index, action)."""
+        history, actions = self, []
+        while history.previous is not None:
+            actions.append((history.player_index, history.action))
+            history = history.previous
+        return actions[::-1]
+
 class KuhnGame:
+    """Kuhn poker for any number of players, num_deal cards each.
+
+    card_set may hold pydealer cards or any other comparable cards. The game
+    works on integer ranks, 0 for the lowest card of card_set: deals,
+    KuhnPlayerMoveGameState.cards and information set keys all use ranks, and
+    cards are only mapped to ranks by ranks_of, when a deal of cards is played
+    with ChanceGameState.play_cards, and back when an information set is decoded.
+    """
+
     def __init__(self, players, card_set, num_deal):
         self._players = players
-        self._cards = card_set
+        self._card_set = sorted(card_set)
+        self._cards = list(range(len(card_set)))
+        self._rank_of = {card: rank for rank, card in enumerate(self._card_set)}
         self._num_deal = num_deal
+        # every betting sequence ever played, by index
+        self._histories = []
+        self._root_history = BettingHistory(None, None, None, len(players), self._histories)
+        # intern the whole betting tree in a fixed order, so that information set keys
+        # do not depend on the order this game happens to be played in
+        for history in self._histories:
+            for action in history.actions:
+                history.play(action)
 
     def create_root_node(self):
-        possible_hands = list(self.enumerate_possible_hands())
-        children = {
-            cards: KuhnPlayerMoveGameState(
-                self, self._players, self._players[0], [],  cards, [PokerActions.RAISE_1, PokerActions.CHECK]
-            ) for cards in possible_hands
-        }
-        return ChanceGameState(children, possible_hands)
+        return ChanceGameState(self, list(self.enumerate_possible_hands()))
+
+    def create_deal_node(self, ranks):
+        """The first player's state after dealing cards of the given ranks, one per player."""
+        return KuhnPlayerMoveGameState(self, self._root_history, ranks)
+
+    def ranks_of(self, cards):
+        """The deal of ranks for a deal of cards of the card set."""
+        return tuple(self._rank_of[card] for card in cards)
+
+    def card(self, rank):
+        return self._card_set[rank]
+
+    def decode_information_set(self, key):
+        """The readable form of an information set key, 'card.action.action'."""
+        history = self._histories[key // len(self._cards)]
+        return _information_set(self._card_set[key % len(self._cards)], history.actions_history())
+
+    def sample_deal(self):
+        return tuple(random.sample(self._cards, len(self._players) * self._num_deal))
 
     def enumerate_possible_hands(self):
         return itertools.permutations(self._cards, len(self._players) * self._num_deal)
@@ -57,118 +166,176 @@ class KuhnGame:
     def get_players(self):
         return self._players
 
+    # public tree interface, used by vector form solvers which walk every betting
+    # sequence once for all private hands instead of once per deal
+
+    def private_hands(self):
+        # every player only ever sees the card at its own index of the deal
+        return list(self._cards)
+
+    def deal_probabilities(self):
+        num_players = len(self._players)
+        num_cards = len(self._cards)
+        probabilities = np.zeros((num_cards,) * num_players)
+        for deal in itertools.permutations(range(num_cards), num_players):
+            probabilities[deal] = 1.
+        return probabilities / probabilities.sum()
+
+    def create_public_root(self):
+        # betting does not depend on the cards, any deal describes the public tree
+        return self.create_deal_node(next(iter(self.enumerate_possible_hands())))
+
+    def information_set(self, state, player_index, hand):
+        return state.history.index * len(self._cards) + hand
+
+    def information_set_actions(self, key):
+        """Legal actions at the information set with integer key."""
+        index = key // len(self._cards)
+        if not 0 <= index < len(self._histories):
+            raise KeyError(key)
+        return self._histories[index].actions
+
+    def terminal_utilities(self, state):
+        """Utilities of terminal betting sequence state for every combination of
+        private hands, shape (num_players,) + (num_hands,) * num_players."""
+        num_players = len(self._players)
+        hands = np.indices((len(self._cards),) * num_players)
+
+        folded = state.history.folded
+        hand_ranks = np.stack([hands[i] if i not in folded else np.full(hands[i].shape, -1)
+                               for i in range(num_players)])
+        winner = np.argmax(hand_ranks, axis=0)
+
+        pot = state.history.pot
+        utilities = np.empty((num_players,) + hands.shape[1:])
+        for i, contribution in enumerate(state.history.contributions):
+            utilities[i] = np.where(winner == i, pot - contribution, -contribution)
+        return utilities
+
 class ChanceGameState(GameStateBase):
-    def __init__(self, children, actions):
-        super().__init__(self, player_to_move=ChancePlayer, actions=actions)
-        self._children = children
-        self._chance_prob = 1. / len(self._children)
+    """The deal. Its actions are all possible deals; deal states are only built
+    when they are played or sampled, or when all children are asked for."""
+
+    __slots__ = ('_game', 'actions', '_sampled_children')
+
+    def __init__(self, game, actions):
+        super().__init__()
+        self._game = game
+        self.actions = actions
+        self._sampled_children = {}
+
+    def _create_children(self):
+        sampled = self._sampled_children
+        self._children = {deal: sampled[deal] if deal in sampled else self._game.create_deal_node(deal)
+                          for deal in self.actions}
+        self._sampled_children = {}
+
+    def play(self, action):
+        """The state after deal action, a tuple of ranks as in actions."""
+        try:
+            ranks = tuple(operator.index(rank) for rank in action)
+        except TypeError:
+            raise KeyError(action)
+        return self._deal(ranks)
+
+    def play_cards(self, cards):
+        """The state after dealing cards of the card set, one per player."""
+        return self._deal(self._game.ranks_of(cards))
+
+    def _deal(self, ranks):
+        if self._children is not None:
+            return self._children[ranks]
+        child = self._sampled_children.get(ranks)
+        if child is None:
+            if ranks not in self.actions:
+                raise KeyError(ranks)
+            child = self._sampled_children[ranks] = self._game.create_deal_node(ranks)
+        return child
 
     def is_terminal(self):
         return False
 
+    def is_chance(self):
+        return True
+
+    def get_player_to_move(self):
+        return ChancePlayer
+
     def inf_set(self):
         return "."
 
-    def chance_prob(self):
-        return self._chance_prob
+    def sample_outcome(self):
+        """A deal drawn directly from the random generator."""
+        return self._game.sample_deal()
+
+    def play_outcome(self, outcome):
+        # outcomes are deals of ranks already
+        return self._deal(outcome)
+
+    def chance_probability(self, outcome):
+        # every deal is equally likely
+        return 1. / len(self.actions)
 
     def sample_one(self):
-        return random.choice(list(self.get_children().values()))
+        return self._deal(self.sample_outcome())
 
 
 class KuhnPlayerMoveGameState(GameStateBase):
+    """A betting state of one deal: the interned betting sequence, the deal
+    (shared by every state of the deal) and the information set key."""
 
-    def __init__(self, parent, players, player_to_move, actions_history, cards, actions):
-        super().__init__(parent=parent, player_to_move=player_to_move, actions=actions)
+    __slots__ = ('_game', 'history', 'cards', '_information_set')
 
-        self.actions_history = actions_history
+    def __init__(self, game, history, cards):
+        super().__init__()
+        self._game = game
+        self.history = history
+        # ranks of the dealt cards, by player index
         self.cards = cards
-        self._children = None
-        self._players = players
-
+        self._information_set = history.index * len(game._cards) + cards[history.to_move]
 
-        known_card = self.cards[self.get_player_to_move().get_index()]
-        action_list = ".".join([str(a) for _, a in self.actions_history])
-        self._information_set = "{0}.{1}".format(known_card, action_list)
+    @property
+    def actions(self):
+        return self.history.actions
 
     def _create_children(self):
-        next_player = self.get_player_to_move().get_next()
-        self._children = {
-            a : KuhnPlayerMoveGameState(
-                self,
-                self._players,
-                next_player,
-                self.actions_history + [(self.get_player_to_move(), a)],
-                self.cards,
-                self.__get_actions_in_next_round(a)
-            ) for a in self.actions
-        }
-
-    def __get_actions_in_next_round(self, a):
-        if self.__action_has_been_played(PokerActions.RAISE_1) or a == PokerActions.RAISE_1:
-            if self.__player_who_played(PokerActions.RAISE_1) != self.get_player_to_move().get_next():
-                return [PokerActions.FOLD, PokerActions.CALL]
-            return []
-        elif not self.__action_has_been_played(PokerActions.RAISE_1) and a != PokerActions.RAISE_1:
-            # all checks
-            if len(self.actions_history) + 1 == len(self._players):
-                return []
-            return [PokerActions.RAISE_1, PokerActions.CHECK]
-        else:
-            return []
+        game, history, cards = self._game, self.history, self.cards
+        self._children = {a: KuhnPlayerMoveGameState(game, history.play(a), cards) for a in history.actions}
 
-    def __action_has_been_played(self, a):
-        for player, action in self.actions_history:
-            if action == a:
-                return True
+    def is_chance(self):
         return False
 
-    def __player_who_played(self, a):
-        for player, action in self.actions_history:
-            if action == a:
-                return player
-        return None
+    def get_player_to_move(self):
+        return self._game._players[self.history.to_move]
+
+    @property
+    def actions_history(self):
+        players = self._game._players
+        return [(players[player_index], action) for player_index, action in self.history.actions_history()]
 
     def inf_set(self):
         return self._information_set
 
     def is_terminal(self):
-        return self.actions == []
+        return not self.history.actions
 
     def pot_size(self):
-        pot = len(self._players)
-        for player, action in self.actions_history:
-            if action == PokerActions.RAISE_1 or action == PokerActions.CALL:
-                pot += 1
-        return pot
+        return self.history.pot
 
     def pot_contribution(self, which_player):
-        for player, action in self.actions_history:
-            if player == which_player:
-                if action == PokerActions.RAISE_1 or action == PokerActions.CALL:
-                    return 2
-        return 1
+        return self.history.contributions[which_player.get_index()]
 
     def evaluation(self):
         if not self.is_terminal():
             raise RuntimeError("trying to evaluate non-terminal node")
 
-        result_vector = np.repeat(-1, len(self._players))
-
-        pot = self.pot_size()
-
-        active_players = self._players.copy()
-        for player, action in self.actions_history:
-            if action == PokerActions.FOLD:
-                active_players.remove(player)
-
-        winner_index = np.argmax([self.cards[player.get_index()] for player in active_players])
-        winner_player_index = active_players[int(winner_index)]
+        history = self.history
+        cards = self.cards
+        winner = max((i for i in range(len(history.contributions)) if i not in history.folded), key=cards.__getitem__)
 
-        for player in self._players:
-            if player == winner_player_index:
-                result_vector[player.get_index()] = pot - self.pot_contribution(player)
-            else:
-                result_vector[player.get_index()] = - self.pot_contribution(player)
+        result_vector = -np.array(history.contributions)
+        result_vector[winner] += history.pot
+        return result_vector
 
-        return result_vector
\ No newline at end of file
+# the classes of game states, whose methods optimizer.instrumentation times
+STATE_CLASSES = (ChanceGameState, KuhnPlayerMoveGameState)
@@ -9,6 +9,8 @@ def create_player_set(num):
     return players
 
 class Player:
+    __slots__ = ('_name', '_index', 'next_player')
+
     def __init__(self, index):
         self._name = str(index)
         self._index = index
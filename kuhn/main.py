@@ -1,10 +1,10 @@
 from game.kuhn import KuhnGame
 from game.player import create_player_set
 import pydealer
-from tqdm import tqdm
 from game.poker import PokerActions
 
 from optimizer.cfr import ChanceSamplingCFR, VanillaCFR
+from optimizer.training import AnytimeTrainer
 
 import random
 
@@ -34,13 +34,14 @@ def run_game():
     root = game.create_root_node()
     j, q, k = cards
 
-    KQ_node = root.get_children()[(k, q)]
+    KQ_node = root.play_cards((k, q))
 
     vanilla_cfr._cfr_utility_recursive(KQ_node.play(PokerActions.CHECK).play(PokerActions.CHECK), [1, 1])
-    for i in tqdm(range(10)):
-        vanilla_cfr.run(iterations=100)
+    def print_value(check):
         vanilla_cfr.compute_nash_equilibrium()
-        print(vanilla_cfr.value_of_the_game())
+        print(check['iteration'], vanilla_cfr.value_of_the_game())
+
+    AnytimeTrainer(vanilla_cfr, time_budget=5., target_strategy_change=1e-4, on_check=print_value).train()
 
 if __name__ == "__main__":
     run_game()
\ No newline at end of file
@@ -50,7 +50,7 @@ def fresh_tkq_node():
     vanilla_cfr = VanillaCFR(root, players)
     t, j, q, k = cards
 
-    TKQ_node = root.get_children()[(t, k, q)]
+    TKQ_node = root.play_cards((t, k, q))
     return vanilla_cfr, TKQ_node
 
 def run_test():
@@ -1,13 +1,18 @@
 from game.player import ChancePlayer
 import itertools
+import math
 import random
+from collections import OrderedDict
 import numpy as np
 from enum import Enum
 
 DIE_SIDES = 6
 MAX_DIES = 5
+_FACES = range(1, DIE_SIDES + 1)
 
 class LDAction:
+    __slots__ = ('_is_call', '_is_spot_on', 'die', 'count')
+
     def __init__(self, is_call, is_spot_on, die, count):
         self._is_call = is_call
         self._is_spot_on = is_spot_on
@@ -59,7 +64,17 @@ CALL = LDAction(True, False, 0, 0)
 SPOT_ON = LDAction(False, True, 0, 0)
 NO_BET = LDAction(False, False, 0, 0)
 
+# (bet, max_count) -> legal actions after it; states share these lists, they are never modified
+_ld_actions = {}
+_NO_ACTIONS = []
+
 def _get_ld_actions(current_bet, max_count):
+    key = (current_bet.get_bet(), current_bet == NO_BET, max_count)
+    if key not in _ld_actions:
+        _ld_actions[key] = _create_ld_actions(current_bet, max_count)
+    return _ld_actions[key]
+
+def _create_ld_actions(current_bet, max_count):
     current_number, current_quantity = current_bet.get_bet()
     bet_actions = []
     for i in range(max(current_quantity, 1), max_count + 1):
@@ -85,182 +100,498 @@ def get_information_set_features(dice, history, num_players, tabular_info=True):
         return tuple(np.concatenate(feature_set))
     return feature_set
 
+# information sets are keyed by integers: the bet history as a bit mask over every possible
+# bet (bets only ever increase, so the mask determines the order) and, in the low bits, the
+# position of the player's dice among LDGame.private_hands()
+
+# dice roll -> hand index, per number of dice
+_hand_indexes = {}
+
+def hand_index(dice):
+    """Position of the multiset of dice among LDGame.private_hands()."""
+    indexes = _hand_indexes.setdefault(len(dice), {})
+    index = indexes.get(dice)
+    if index is None:
+        hands = itertools.combinations_with_replacement(range(1, DIE_SIDES + 1), len(dice))
+        index = indexes[dice] = list(hands).index(tuple(sorted(dice)))
+    return index
+
+def _hand_bits(num_die):
+    return (math.comb(DIE_SIDES + num_die - 1, num_die) - 1).bit_length()
+
+def _action_bit(action, max_bet):
+    if action.is_call():
+        return DIE_SIDES * max_bet
+    if action.is_spot_on():
+        return DIE_SIDES * max_bet + 1
+    return (action.get_count() - 1) * DIE_SIDES + action.get_die() - 1
+
+def encode_history(history, max_bet):
+    bits = 0
+    for action in history:
+        bits |= 1 << _action_bit(action, max_bet)
+    return bits
+
+def decode_history(bits, max_bet):
+    """The bet history of mask bits (see encode_history), in the order it was
+    played: bets only ever increase and a challenge ends the game."""
+    history = [LDAction(False, False, bit % DIE_SIDES + 1, bit // DIE_SIDES + 1)
+               for bit in range(DIE_SIDES * max_bet) if bits >> bit & 1]
+    if bits >> (DIE_SIDES * max_bet) & 1:
+        history.append(CALL)
+    if bits >> (DIE_SIDES * max_bet + 1) & 1:
+        history.append(SPOT_ON)
+    return history
+
+def _history_length(bits):
+    return bin(bits).count('1')
+
+def encode_information_set(hand, bits, num_die):
+    """Integer key of the information set of a player holding the hand with
+    index hand, after the bet history with mask bits (see encode_history)."""
+    return (bits << _hand_bits(num_die)) | hand
+
+def decode_information_set(key, num_players, num_die):
+    """The (sorted) dice and the bet history of an integer information set key,
+    for debugging."""
+    hand_bits = _hand_bits(num_die)
+    hands = itertools.combinations_with_replacement(range(1, DIE_SIDES + 1), num_die)
+    dice = next(itertools.islice(hands, key & ((1 << hand_bits) - 1), None))
+    return dice, decode_history(key >> hand_bits, num_players * num_die)
+
+def face_counts(dice_states):
+    """Histogram of the faces of every player's dice, counts[face - 1]."""
+    counts = np.zeros(DIE_SIDES, dtype=np.int64)
+    for dice in dice_states:
+        for die in dice:
+            counts[die - 1] += 1
+    return counts
+
+# num_players -> read only payoff tables, see _payoff_tables
+_payoffs = {}
+
+def _payoff_tables(num_players):
+    """Utilities after a CALL, indexed by the losing player, and after a SPOT_ON,
+    indexed by the challenger and whether the count was exact. The loser pays
+    1 (the spot on caller wins 1), shifted so that utilities sum to zero."""
+    if num_players not in _payoffs:
+        call = -np.eye(num_players)
+        spot_on = np.stack([-np.eye(num_players), np.eye(num_players)], axis=1)
+        tables = call - call.mean(axis=-1, keepdims=True), spot_on - spot_on.mean(axis=-1, keepdims=True)
+        for table in tables:
+            table.setflags(write=False)
+        _payoffs[num_players] = tables
+    return _payoffs[num_players]
+
+def terminal_payoffs(counts, challenged_bet, challenge, ones_valid, num_players, challenged_player, challenger_player):
+    """Utilities of challenging challenged_bet with challenge (CALL or SPOT_ON)
+    for a batch of joint rolls given by their face counts, shape
+    (..., DIE_SIDES). Returns shape (..., num_players). When ones_valid, ones
+    are wild and count towards the bet."""
+    die, count = challenged_bet.get_bet()
+    number_of_dice = counts[..., die - 1]
+    if ones_valid:
+        number_of_dice = number_of_dice + counts[..., 0]
+    call, spot_on = _payoff_tables(num_players)
+    if challenge.is_call():
+        return call[np.where(number_of_dice >= count, challenger_player, challenged_player)]
+    return spot_on[challenger_player][(number_of_dice == count).astype(np.int64)]
+
+class NodeCache:
+    """Bounds the number of child states kept by the states of a game.
+
+    By default every state keeps the children it expanded for as long as it
+    lives, so a long sampled run slowly materializes the whole game tree.
+    States sharing a NodeCache instead keep at most about max_nodes children
+    between them: when a state expands its children, or a roll state samples
+    one more child, it is registered as the most recently used, and once the budget is exceeded the least recently used
+    states drop theirs, to be rebuilt if they are visited again. max_nodes=0 is
+    the transient mode, where nothing is kept and play builds only the child
+    that is asked for; a sampled traversal then only holds the states on its
+    current path.
+    """
+
+    def __init__(self, max_nodes=0):
+        self.max_nodes = max_nodes
+        self.num_nodes = 0
+        # expanded state -> number of children it holds, least recently used first
+        self._expanded = OrderedDict()
+
+    def __len__(self):
+        return len(self._expanded)
+
+    def keep(self, state, children):
+        if self.max_nodes == 0:
+            return
+        state._children = children
+        # children sampled before, if any, are part of children now
+        self.num_nodes -= self._expanded.pop(state, 0)
+        self._expanded[state] = len(children)
+        self.num_nodes += len(children)
+        self._evict()
+
+    def keep_sampled(self, state):
+        """Counts the child state just sampled, see RollDieGameState.play_outcome."""
+        self._expanded[state] = self._expanded.get(state, 0) + 1
+        self._expanded.move_to_end(state)
+        self.num_nodes += 1
+        self._evict()
+
+    def _evict(self):
+        while self.num_nodes > self.max_nodes and len(self._expanded) > 1:
+            evicted, num_children = self._expanded.popitem(last=False)
+            evicted._drop_children()
+            self.num_nodes -= num_children
+
+    def touch(self, state):
+        if state in self._expanded:
+            self._expanded.move_to_end(state)
+
 class LDGame:
-    def __init__(self, players, num_die):
+    def __init__(self, players, num_die, max_cached_nodes=None):
+        """max_cached_nodes bounds the number of expanded child states kept in
+        memory, see NodeCache; 0 keeps none. The default keeps all of them."""
         self._players = players
         self._num_die = num_die
+        self._max_cached_nodes = max_cached_nodes
 
     def create_root_node(self):
-        return RollDieGameState(self._players, self._players[0],
-                                self._num_die,
-                                dice_states=[], actions=[])
+        node_cache = NodeCache(self._max_cached_nodes) if self._max_cached_nodes is not None else None
+        return RollDieGameState(_TreeData(self._players, self._num_die, node_cache), ())
 
     def get_players(self):
         return self._players
 
+    # public tree interface, used by vector form solvers which walk every betting
+    # sequence once for all private rolls instead of once per joint roll
+
+    def private_hands(self):
+        # information sets only depend on the dice counts, so rolls are merged into multisets
+        return list(itertools.combinations_with_replacement(range(1, DIE_SIDES + 1), self._num_die))
+
+    def deal_probabilities(self):
+        hands = self.private_hands()
+        orderings = np.array([math.factorial(self._num_die) / np.prod([math.factorial(hand.count(d)) for d in set(hand)])
+                              for hand in hands])
+        hand_probabilities = orderings / DIE_SIDES ** self._num_die
+        probabilities = np.ones(())
+        for _ in self._players:
+            probabilities = np.multiply.outer(probabilities, hand_probabilities)
+        return probabilities
+
+    def create_public_root(self):
+        # betting does not depend on the dice, any roll describes the public tree
+        dice_states = tuple((1,) * self._num_die for _ in self._players)
+        actions = _get_ld_actions(NO_BET, len(self._players) * self._num_die)
+        return LDMoveGameState(_TreeData(self._players, self._num_die), dice_states, actions, 0, face_counts(dice_states))
+
+    def information_set(self, state, player_index, hand):
+        return encode_information_set(hand, state.history_bits, self._num_die)
+
+    def decode_information_set(self, key):
+        return decode_information_set(key, len(self._players), self._num_die)
+
+    def information_set_actions(self, key):
+        """Legal actions at the information set with integer key."""
+        max_bet = len(self._players) * self._num_die
+        bits = key >> _hand_bits(self._num_die)
+        if key < 0 or bits >> (DIE_SIDES * max_bet + 2):
+            raise KeyError(key)
+        history = decode_history(bits, max_bet)
+        if history and (history[-1].is_call() or history[-1].is_spot_on()):
+            return _NO_ACTIONS
+        return _get_ld_actions(history[-1] if history else NO_BET, max_bet)
+
+    def hand_face_counts(self):
+        """Face count histogram of every private hand, shape (num_hands, DIE_SIDES)."""
+        return np.array([face_counts([hand]) for hand in self.private_hands()])
+
+    def joint_face_counts(self):
+        """Face count histogram of every combination of private hands, shape
+        (num_hands,) * num_players + (DIE_SIDES,), laid out like deal_probabilities."""
+        num_players = len(self._players)
+        hand_counts = self.hand_face_counts()
+        counts = np.zeros((len(hand_counts),) * num_players + (DIE_SIDES,), dtype=np.int64)
+        for i in range(num_players):
+            counts = counts + hand_counts.reshape((-1,) + (1,) * (num_players - 1 - i) + (DIE_SIDES,))
+        return counts
+
+    def terminal_utilities(self, state):
+        """Utilities of terminal betting sequence state for every combination of
+        private hands, shape (num_players,) + (num_hands,) * num_players."""
+        num_players = len(self._players)
+        actions_history = state.actions_history
+        challenged_player_index = (len(actions_history) - 2) % num_players
+        challenger_player_index = (len(actions_history) - 1) % num_players
+        utilities = terminal_payoffs(self.joint_face_counts(), actions_history[-2], actions_history[-1],
+                                     state.is_ones_valid(), num_players, challenged_player_index, challenger_player_index)
+        return np.moveaxis(utilities, -1, 0)
+
+class _TreeData:
+    """What every state of one game tree shares: the players, the dice per
+    player, the highest count a bet can have and the tree's NodeCache."""
+
+    __slots__ = ('players', 'dice_per_player', 'max_bet', 'node_cache')
+
+    def __init__(self, players, dice_per_player, node_cache=None):
+        self.players = players
+        self.dice_per_player = dice_per_player
+        self.max_bet = len(players) * dice_per_player
+        self.node_cache = node_cache
+
 class LDGameStateBase:
+    """A node of the game tree. Nodes are slotted and hold only what differs
+    between siblings, everything else lives in the tree's _TreeData. States
+    do not keep their parent alive, so a NodeCache can drop any subtree."""
 
-    def __init__(self, parent, player_to_move, dice_states, actions):
-        self.parent = parent
-        self._player_to_move = player_to_move
-        self._dice_states = dice_states
+    __slots__ = ('_children', '_tree')
+
+    def __init__(self, tree):
         self._children = None
-        self.actions = actions
+        self._tree = tree
 
-    def get_children(self):
-        if not self._children:
-            self._create_children()
+    @property
+    def _node_cache(self):
+        return self._tree.node_cache
 
-        return self._children
+    def get_children(self):
+        node_cache = self._tree.node_cache
+        if self._children is not None:
+            if node_cache is not None:
+                node_cache.touch(self)
+            return self._children
+
+        children = self._create_children()
+        if node_cache is None:
+            self._children = children
+        else:
+            node_cache.keep(self, children)
+        return children
 
     def _create_children(self):
         raise NotImplementedError("Abstract Method")
 
-    def play(self, action):
-        if not self._children:
-            self._create_children()
+    def _drop_children(self):
+        self._children = None
+
+    def _create_child(self, key):
+        raise NotImplementedError("Abstract Method")
 
-        return self._children[action]
+    def _is_child_key(self, key):
+        raise NotImplementedError("Abstract Method")
+
+    def play(self, action):
+        node_cache = self._tree.node_cache
+        if self._children is None and node_cache is not None and node_cache.max_nodes == 0:
+            # transient, build only the child played
+            if not self._is_child_key(action):
+                raise KeyError(action)
+            return self._create_child(action)
+        return self.get_children()[action]
 
     def is_chance(self):
-        return self._player_to_move == ChancePlayer
+        return self.get_player_to_move() == ChancePlayer
 
     def get_player_to_move(self):
-        return self._player_to_move
+        raise NotImplementedError("Abstract Method")
 
     def inf_set(self):
         raise NotImplementedError("Please implement information_set method")
 
 class RollDieGameState(LDGameStateBase):
-    def __init__(self, players, rolling_for_player, dice_per_player, dice_states, actions):
-        super().__init__(self, player_to_move=ChancePlayer, dice_states=dice_states, actions=actions)
-        self._players = players
-        self._rolling_for_player = rolling_for_player
+    """The roll of the next player's dice, given the rolls before it."""
+
+    __slots__ = ('_dice_states', '_sampled_children')
+    actions = _NO_ACTIONS
+
+    def __init__(self, tree, dice_states):
+        super().__init__(tree)
+        # the dice of every player rolled so far, a tuple of tuples
         self._dice_states = dice_states
-        self._dice_per_player = dice_per_player
+        # children built one at a time by play_outcome, until get_children expands them all
+        self._sampled_children = None
 
     def _create_children(self):
-        next_player = self._rolling_for_player.get_next()
-
-        # not first player's move yet, create more dice roll children
-        self._children = {}
-
-        # first player's move
-        max_quantity = len(self._players) * self._dice_per_player
-        if next_player == self._players[0]:
-            actions = _get_ld_actions(NO_BET, max_quantity)
-            for dice in self.enumerate_possible_rolls():
-                self._children[dice] = LDMoveGameState(self, self._players, next_player,
-                                                       [], self._dice_states + [dice], actions=actions)
-        if next_player != self._players[0]:
-            for dice in self.enumerate_possible_rolls():
-                self._children[dice] = RollDieGameState(
-                    self._players,
-                    next_player,
-                    self._dice_per_player,
-                    self._dice_states + [dice],
-                    actions=[])
+        sampled = self._sampled_children or {}
+        self._sampled_children = None
+        return {dice: sampled[dice] if dice in sampled else self._create_child(dice)
+                for dice in self.enumerate_possible_rolls()}
+
+    def _drop_children(self):
+        self._children = None
+        self._sampled_children = None
 
+    def _is_child_key(self, dice):
+        return len(dice) == self._tree.dice_per_player and all(1 <= die <= DIE_SIDES for die in dice)
+
+    def _create_child(self, dice):
+        tree = self._tree
+        dice_states = self._dice_states + (tuple(dice),)
+
+        # everyone rolled, first player's move
+        if len(dice_states) == len(tree.players):
+            return LDMoveGameState(tree, dice_states, _get_ld_actions(NO_BET, tree.max_bet), 0, face_counts(dice_states))
+
+        # not first player's move yet, roll for the next player
+        return RollDieGameState(tree, dice_states)
 
     def enumerate_possible_rolls(self):
-        return itertools.product(range(1, DIE_SIDES + 1), repeat=self._dice_per_player)
+        return itertools.product(range(1, DIE_SIDES + 1), repeat=self._tree.dice_per_player)
 
     def is_terminal(self):
         return False
 
+    def is_chance(self):
+        return True
+
+    def get_player_to_move(self):
+        return ChancePlayer
+
     def inf_set(self):
         return "."
 
-    def chance_prob(self):
-        self._chance_prob = 1. / len(self.get_children())
-        return self._chance_prob
+    def _roll(self, dice):
+        # the child after dice, built on its own unless the children are expanded already
+        if self._children is not None:
+            return self.get_children()[dice]
+        if not self._is_child_key(dice):
+            raise KeyError(dice)
+        node_cache = self._tree.node_cache
+        if node_cache is not None and node_cache.max_nodes == 0:
+            # transient, nothing is kept
+            return self._create_child(dice)
+        if self._sampled_children is None:
+            self._sampled_children = {}
+        child = self._sampled_children.get(dice)
+        if child is None:
+            child = self._sampled_children[dice] = self._create_child(dice)
+            if node_cache is not None:
+                node_cache.keep_sampled(self)
+        elif node_cache is not None:
+            node_cache.touch(self)
+        return child
+
+    def sample_outcome(self):
+        """The rolls of this player and of every player still to roll, drawn
+        directly from the random generator."""
+        num_rolls = len(self._tree.players) - len(self._dice_states)
+        dice_per_player = self._tree.dice_per_player
+        return tuple(tuple(random.choices(_FACES, k=dice_per_player)) for _ in range(num_rolls))
+
+    def play_outcome(self, outcome):
+        """The state after the rolls of outcome (see sample_outcome), building
+        only the states on the way to it."""
+        state = self
+        for dice in outcome:
+            state = state._roll(dice)
+        return state
+
+    def chance_probability(self, outcome):
+        """Probability of a child's roll, or of the joint rolls of sample_outcome."""
+        num_rolls = len(outcome) if isinstance(outcome[0], tuple) else 1
+        return 1. / DIE_SIDES ** (self._tree.dice_per_player * num_rolls)
 
     def sample_one(self):
-        return random.choice(list(self.get_children().values()))
+        """The first betting state after a random roll of every player still to roll."""
+        return self.play_outcome(self.sample_outcome())
 
 class LDMoveGameState(LDGameStateBase):
+    """A betting state of one joint roll. The bet history is kept as its mask
+    (see encode_history), which also gives the player to move; the roll, its
+    face counts and the lists of legal actions are shared with other states."""
 
-    def __init__(self, parent, players, player_to_move, actions_history, dice_states, actions):
-        super().__init__(parent=parent, player_to_move=player_to_move,
-                         dice_states=dice_states, actions=actions)
+    __slots__ = ('actions', '_dice_states', 'face_counts', 'history_bits', '_information_set')
 
-        self.actions_history = actions_history
+    def __init__(self, tree, dice_states, actions, history_bits, counts):
+        super().__init__(tree)
+        self.actions = actions
         self._dice_states = dice_states
-        self._children = None
-        self._players = players
-        self._max_bet = len(dice_states) * len(dice_states[0])
+        # face counts of the joint roll, shared by all states after it
+        self.face_counts = counts
+        self.history_bits = history_bits
 
-        known_dice_states = dice_states[player_to_move.get_index()]
+        known_dice_states = dice_states[_history_length(history_bits) % len(dice_states)]
+        self._information_set = encode_information_set(hand_index(known_dice_states), history_bits, len(known_dice_states))
 
-        self._information_set = get_information_set_features(known_dice_states, self.actions_history, len(self._players))
+    @property
+    def actions_history(self):
+        return decode_history(self.history_bits, self._tree.max_bet)
 
     def _create_children(self):
-        next_player = self.get_player_to_move().get_next()
-        self._children = {
-            a: LDMoveGameState(
-                self,
-                self._players,
-                next_player,
-                self.actions_history + [a],
-                self._dice_states,
-                self._actions_after(a)
-            ) for a in self.actions
-        }
+        return {a: self._create_child(a) for a in self.actions}
+
+    def _is_child_key(self, action):
+        return action in self.actions
+
+    def _create_child(self, action):
+        max_bet = self._tree.max_bet
+        return LDMoveGameState(self._tree, self._dice_states, self._actions_after(action),
+                               self.history_bits | 1 << _action_bit(action, max_bet), self.face_counts)
 
     def _actions_after(self, action):
         if action.is_call() or action.is_spot_on():
-            return []
-        return _get_ld_actions(action, self._max_bet)
+            return _NO_ACTIONS
+        return _get_ld_actions(action, self._tree.max_bet)
+
+    def is_chance(self):
+        return False
+
+    def get_player_to_move(self):
+        players = self._tree.players
+        return players[_history_length(self.history_bits) % len(players)]
 
     def inf_set(self):
         return self._information_set
 
+    def information_set_features(self, tabular_info=True):
+        """The feature form of the information set, for learning based solvers."""
+        known_dice_states = self._dice_states[self.get_player_to_move().get_index()]
+        return get_information_set_features(known_dice_states, self.actions_history, len(self._tree.players), tabular_info)
+
     def is_terminal(self):
-        return self.actions == []
+        return not self.actions
 
     def play_bet(self, count, die):
         return self.play(LDAction(False, False, die, count))
 
     def is_ones_valid(self):
-        # is first bet a 1?
-        return self.actions_history[0].get_die() != 1
-
-    def _raw_number_of_dice(self, value):
-        return sum([dice_set.count(value) for dice_set in self._dice_states])
+        # is first bet a 1? bets only increase, so the first is the lowest bit
+        bits = self.history_bits
+        return ((bits & -bits).bit_length() - 1) % DIE_SIDES != 0
 
     def _number_of_dice(self, value):
         if self.is_ones_valid():
-            return self._raw_number_of_dice(1) + self._raw_number_of_dice(value)
-        return self._raw_number_of_dice(value)
+            return self.face_counts[0] + self.face_counts[value - 1]
+        return self.face_counts[value - 1]
 
     def evaluation(self):
+        """Utilities of the terminal state. The returned vector is shared and
+        read only."""
         if not self.is_terminal():
             raise RuntimeError("trying to evaluate non-terminal node")
 
-        result_vector = np.zeros(len(self._players))
-
-        challenged_bet = self.actions_history[-2]
-        challenged_player_index = (len(self.actions_history) - 2) % len(self._players)
-        challenger_bet = self.actions_history[-1]
-        challenger_player_index = (len(self.actions_history) - 1) % len(self._players)
-
-        if challenger_bet.is_call():
-            if self._number_of_dice(challenged_bet.get_die()) >= challenged_bet.get_count():
-                result_vector[challenger_player_index] = -1
-            else:
-                result_vector[challenged_player_index] = -1
-
-        if challenged_bet.is_spot_on():
-            if self._number_of_dice(challenged_bet.get_die()) == challenged_bet.get_count():
-                result_vector[challenger_player_index] = 1
-            else:
-                result_vector[challenger_player_index] = -1
-
-        # l1 norm
-        return result_vector - (sum(result_vector) / len(result_vector))
+        bits, max_bet = self.history_bits, self._tree.max_bet
+        num_players = len(self._tree.players)
+        num_actions = _history_length(bits)
+        challenged_player_index = (num_actions - 2) % num_players
+        challenger_player_index = (num_actions - 1) % num_players
+        # the challenged bet is the highest one
+        bet_bit = (bits & ((1 << DIE_SIDES * max_bet) - 1)).bit_length() - 1
+        die, count = bet_bit % DIE_SIDES + 1, bet_bit // DIE_SIDES + 1
+
+        call, spot_on = _payoff_tables(num_players)
+        number_of_dice = self._number_of_dice(die)
+        if bits >> (DIE_SIDES * max_bet) & 1:
+            if number_of_dice >= count:
+                return call[challenger_player_index]
+            return call[challenged_player_index]
+        return spot_on[challenger_player_index][int(number_of_dice == count)]
 
     def __repr__(self):
         return self.__str__()
 
     def __str__(self):
         return str(self.actions_history)
+
+# the classes of game states, whose methods optimizer.instrumentation times
+STATE_CLASSES = (RollDieGameState, LDMoveGameState)
@@ -1,11 +1,12 @@
 from game.kuhn import KuhnGame
 from game.player import create_player_set
 import pydealer
-from tqdm import tqdm
 from game.poker import PokerActions
 from ld.liarsdice import LDGame
 
 from optimizer.cfr import ChanceSamplingCFR, VanillaCFR, ExternalSamplingCFR
+from optimizer.exploitability import BestResponse
+from optimizer.training import AnytimeTrainer
 
 
 def run_game():
@@ -23,12 +24,12 @@ def run_game():
     #root = ldgame.create_root_node()
 
     cfr = ExternalSamplingCFR(root, players)
-    for i in tqdm(range(1000)):
-        cfr.run(iterations=1)
-        #if i % 100 == 0:
-        #    print(vanilla_cfr.compute_nash_equilibrium())
+    trainer = AnytimeTrainer(cfr, time_budget=10., target_exploitability=1e-3, best_response=BestResponse(game, players),
+                             on_check=lambda check: print(check['iteration'], "exploitability", check['exploitability']))
+    result = trainer.train()
+    print("Stopped by", result['stopped_by'], "after", result['iterations'], "iterations")
     print("Approx Value", cfr.approximate_value_of_game(1000))
-    print(cfr._learned_strategy)
+    print(cfr.learned_strategy())
 
 if __name__ == "__main__":
     run_game()
\ No newline at end of file
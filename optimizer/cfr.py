@@ -1,91 +1,137 @@
 import numpy as np
-from collections import defaultdict
-from game.poker import PokerActions
-import random
-
-def init_empty_node_maps(players, node, output = None):
-    level_1 = lambda: defaultdict(int)
-    level_2 = lambda: defaultdict(level_1)
-    output = defaultdict(level_2)
-    def init_empty_node_maps_recursive(node):
-        if node.is_chance():
-            for player in players:
-                output[player.get_index()][node.inf_set()] = {action: 0. for action in node.actions}
-        else:
-            player = node.get_player_to_move()
-            output[player.get_index()][node.inf_set()] = {action: 0. for action in node.actions}
-        for k in node.get_children():
-            init_empty_node_maps_recursive(node.get_children()[k])
-    #init_empty_node_maps_recursive(node)
-    return output
-
-class MultiplayerCFRMBase:
-    def __init__(self, root, players, chance_sampling=False):
-        self.root = root
-        self.cumulative_regrets = init_empty_node_maps(players, root)
-        self.cumulative_sigma = init_empty_node_maps(players, root)
-        self.nash_equilibrium = init_empty_node_maps(players, root)
-        self.chance_sampling = chance_sampling
-        self._players = players
+from optimizer.compiled import CompiledGameTree, compile_game_tree, TERMINAL, CHANCE, DECISION
+from optimizer.infoset import InfoSetTable
+from optimizer.parallel import ShardedCFRPool, SharedSamplingPool
+from optimizer.public import PublicGameTree, compile_public_tree, contract_reaches
+from optimizer.sampling import Sampler
+from optimizer.simulation import BatchedSimulator
+
 
 class CounterfactualRegretMinimizationBase:
+    # solver attributes saved with a checkpoint besides the information set rows
+    _checkpoint_attributes = ('iteration',)
 
     def __init__(self, root, players, chance_sampling=False):
+        # root is either a game state or a CompiledGameTree, in which case all
+        # traversals run over node ids of the compiled tree instead of state objects
         self.root = root
-        self.cumulative_regrets = init_empty_node_maps(players, root)
-        self.cumulative_sigma = init_empty_node_maps(players, root)
-        self.nash_equilibrium = init_empty_node_maps(players, root)
-        self._learned_strategy = init_empty_node_maps(players, root)
+        self.tree = root if isinstance(root, CompiledGameTree) else None
+        # regrets and strategy sums for every information set, see InfoSetTable
+        self.infosets = self.tree.infosets.empty_like() if self.tree is not None else InfoSetTable()
+        # when set, an InfoSetTable laid out like self.infosets that collects regret and
+        # strategy sum updates instead of applying them, see optimizer.parallel
+        self._pending = None
+        # worker pool of the parallel modes, see optimizer.parallel
+        self._pool = None
+        # regret updates of the current CFR traversal and the rows they touch, see _end_traversal
+        self._regret_deltas = np.zeros((0, 0))
+        self._delta_rows = []
+        # number of iterations run so far
+        self.iteration = 0
+        # called with the solver after every iteration, see add_iteration_callback
+        self._iteration_callbacks = []
+        # average strategy snapshot, filled by compute_nash_equilibrium
+        self.nash_equilibrium = None
         self.chance_sampling = chance_sampling
         self._players = players
+        # draws sampled actions and compiled chance outcomes; chance nodes of game
+        # states sample themselves with the random module
+        self.sampler = Sampler()
+
+    def _info_set_id(self, state):
+        return self.infosets.index(state.inf_set(), state.actions)
 
     def get_strategy(self, state):
-        player_index = state.get_player_to_move().get_index()
-        info_set = state.inf_set()
-        actions = state.actions
-
-        normalizing_sum = 0
-        strategy = {}
-        for action in actions:
-            regret = max(self.cumulative_regrets[info_set][action], 0)
-            strategy[action] = regret
-            normalizing_sum += regret
-        for action in actions:
-            if normalizing_sum > 0:
-                strategy[action] /= normalizing_sum
-            else:
-                strategy[action] = 1. / len(actions)
-        self._learned_strategy[info_set] = strategy
-        return strategy
+        """Current (regret matching) strategy at state, aligned with state.actions."""
+        return self.infosets.current_strategy(self._info_set_id(state))
 
+    def learned_strategy(self):
+        """Current strategy of every information set seen so far, as {info_set: {action: probability}}."""
+        return self.infosets.as_dict(self.infosets.current_strategies())
 
     def compute_nash_equilibrium(self):
-        self.__compute_ne_rec(self.root)
-
-    def __compute_ne_rec(self, node):
-        if node.is_terminal():
-            return
-        i = node.inf_set()
-        if node.is_chance():
-            for player in self._players:
-                self.nash_equilibrium[player.get_index()][i] = {a: node.chance_prob() for a in node.actions}
-        else:
-            player_index = node.get_player_to_move().get_index()
-            sigma_sum = sum(self.cumulative_sigma[player_index][i].values())
-            self.nash_equilibrium[player_index][i] = {a: self.cumulative_sigma[player_index][i][a] / sigma_sum for a in node.actions}
-        # go to subtrees
-        for child in node.get_children().values():
-            self.__compute_ne_rec(child)
-
-    def _cumulate_sigma(self, player_index, information_set, action, prob):
-        #print('Update Sigma', information_set, '          ', action, prob)
-        #print('Cum Sigma', information_set, '          ', action, self.cumulative_sigma[information_set][action])
-        self.cumulative_sigma[player_index][information_set][action] += prob
+        self.nash_equilibrium = self.infosets.average_strategies()
+
+    def average_strategy(self):
+        """Average strategy of every information set seen so far, as {info_set: {action: probability}}."""
+        return self.infosets.as_dict(self.infosets.average_strategies())
+
+    def _add_regrets(self, information_set_id, regrets):
+        table = self.infosets if self._pending is None else self._pending
+        table.regrets[information_set_id, :len(regrets)] += regrets
+
+    def _defer_regrets(self, information_set_id, regrets):
+        # kept until the end of the traversal, see _end_traversal
+        deltas = self._regret_deltas
+        if information_set_id >= deltas.shape[0] or len(regrets) > deltas.shape[1]:
+            grown = np.zeros((self.infosets.capacity, self.infosets.width))
+            grown[:deltas.shape[0], :deltas.shape[1]] = deltas
+            deltas = self._regret_deltas = grown
+        deltas[information_set_id, :len(regrets)] += regrets
+        self._delta_rows.append(information_set_id)
+
+    def _end_traversal(self):
+        """Applies the regret updates collected during a traversal at once and
+        drops the strategies cached for it."""
+        if self._delta_rows:
+            rows = np.unique(self._delta_rows)
+            self._apply_regret_deltas(rows, self._regret_deltas[rows])
+            self._regret_deltas[rows] = 0.
+            self._delta_rows = []
+        self.infosets.invalidate_strategies()
+
+    def _apply_regret_deltas(self, rows, deltas):
+        table = self.infosets if self._pending is None else self._pending
+        table.regrets[rows, :deltas.shape[1]] += deltas
+
+    def _cumulate_sigma(self, information_set_id, strategy, prob):
+        n = len(strategy)
+        table = self.infosets if self._pending is None else self._pending
+        table.strategy_sum[information_set_id, :n] += prob * strategy
 
     def run(self, iterations):
         raise NotImplementedError("Please implement run method")
 
+    def add_iteration_callback(self, callback):
+        """Calls callback(solver) after every iteration run() completes. Sampled
+        iterations run in worker processes (processes > 1) call back once per
+        run() call, when all workers are done."""
+        self._iteration_callbacks.append(callback)
+
+    def remove_iteration_callback(self, callback):
+        self._iteration_callbacks.remove(callback)
+
+    def _end_iteration(self):
+        for callback in self._iteration_callbacks:
+            callback(self)
+
+    def _run_pool(self, iterations):
+        # the workers run the iterations, the solver counts them
+        utilities = self._pool.run(iterations, self.iteration)
+        self.iteration += iterations
+        self._end_iteration()
+        return utilities
+
+    def _checkpoint_rows(self):
+        """The solver's arrays with one row per information set id, by name. See
+        optimizer.checkpoint; the arrays are written in place when restoring."""
+        return {'regrets': self.infosets.regrets, 'strategy_sum': self.infosets.strategy_sum}
+
+    def close(self):
+        """Stops the worker processes of a parallel solver."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def value_of_the_game(self):
+        if self.tree is not None:
+            return self.__value_of_the_game_compiled(0)
         return self.__value_of_the_game_state_recursive(self.root)
 
     def repeat_value_for_players(self, value):
@@ -94,47 +140,89 @@ class CounterfactualRegretMinimizationBase:
             values[player] = value
         return values
 
+    def _counterfactual_reach(self, reach_vector, player_index):
+        # likelihood of arriving at this state given everyone's strategy except the player to move
+        return np.prod(reach_vector[:player_index]) * np.prod(reach_vector[player_index + 1:])
 
+    def _root_utility(self, reach_vector):
+        if self.tree is not None:
+            return self._cfr_utility_compiled(0, reach_vector)
+        return self._cfr_utility_recursive(self.root, reach_vector)
+
+    def _update_regrets(self, info_set, player_index, reach_vector, strategy, action_utilities, node_utilities):
+        counterfactual = self._counterfactual_reach(reach_vector, player_index)
+        regrets = action_utilities[:, player_index] - node_utilities[player_index]
+        self._defer_regrets(info_set, counterfactual * regrets)
+        self._cumulate_sigma(info_set, strategy, reach_vector[player_index])
 
     def _cfr_utility_recursive(self, state, reach_vector):
-        action_utilities = {}
-        node_utilities = np.zeros(len(self._players))
+        """One CFR traversal of the subtree below state: every information set
+        plays the strategy of its regrets at the start of the traversal, regret
+        updates are collected and applied when it is done."""
+        utilities = self._cfr_traverse_recursive(state, reach_vector)
+        self._end_traversal()
+        return utilities
+
+    def _cfr_traverse_recursive(self, state, reach_vector):
         if state.is_terminal():
             return state.evaluation()
         if state.is_chance():
             if self.chance_sampling:
                 # if node is a chance node, lets sample one child node and proceed normally
-                return self._cfr_utility_recursive(state.sample_one(), reach_vector)
+                return self._cfr_traverse_recursive(state.sample_one(), reach_vector)
             else:
-                chance_outcomes = {state.play(action) for action in state.actions}
-                shared_utility = state.chance_prob() * sum([self._cfr_utility_recursive(outcome, reach_vector) for outcome in chance_outcomes])
-                return shared_utility
+                return sum(state.chance_probability(outcome) * self._cfr_traverse_recursive(child, reach_vector)
+                           for outcome, child in state.get_children().items())
+
+        info_set = self._info_set_id(state)
+        strategy = self.infosets.cached_strategy(info_set)
+        player_index = state.get_player_to_move().get_index()
 
-        strategy = self.get_strategy(state)
         # sum up all utilities for playing actions in our game state
-        for action in state.actions:
+        action_utilities = np.zeros((len(state.actions), len(self._players)))
+        for slot, action in enumerate(state.actions):
             reach_vector_child = np.copy(reach_vector)
-            reach_vector_child[state.get_player_to_move().get_index()] *= strategy[action]
+            reach_vector_child[player_index] *= strategy[slot]
 
-            action_utilities[action] = self._cfr_utility_recursive(state.play(action), reach_vector_child)
+            action_utilities[slot] = self._cfr_traverse_recursive(state.play(action), reach_vector_child)
 
-            for player in self._players:
-                node_utilities[player.get_index()] += strategy[action] * action_utilities[action][player.get_index()]
+        node_utilities = strategy @ action_utilities
 
         # accumulate regret
-        for action in state.actions:
-            # likelihood of arriving at this state given our strategy
-            counterfactual = 1
-            for player in self._players:
-                if player != state.get_player_to_move():
-                    counterfactual *= reach_vector[player.get_index()]
+        self._update_regrets(info_set, player_index, reach_vector, strategy, action_utilities, node_utilities)
 
-            player_index = state.get_player_to_move().get_index()
-            regret = action_utilities[action][player_index] - node_utilities[player_index]
+        return node_utilities
 
-            info_set = state.inf_set()
-            self.cumulative_regrets[info_set][action] += counterfactual * regret
-            self.cumulative_sigma[info_set][action] += counterfactual * strategy[action]
+    def _cfr_utility_compiled(self, node, reach_vector):
+        """As _cfr_utility_recursive, below node of the compiled tree."""
+        utilities = self._cfr_traverse_compiled(node, reach_vector)
+        self._end_traversal()
+        return utilities
+
+    def _cfr_traverse_compiled(self, node, reach_vector):
+        tree = self.tree
+        node_type = tree.node_type[node]
+        if node_type == TERMINAL:
+            return tree.payoffs[node]
+        children = tree.children(node)
+        if node_type == CHANCE:
+            if self.chance_sampling:
+                return self._cfr_traverse_compiled(tree.sample_child(node, self.sampler), reach_vector)
+            return sum([tree.chance_prob[child] * self._cfr_traverse_compiled(child, reach_vector) for child in children])
+
+        info_set = tree.infoset[node]
+        strategy = self.infosets.cached_strategy(info_set)
+        player_index = tree.player[node]
+
+        action_utilities = np.zeros((len(children), len(self._players)))
+        for slot, child in enumerate(children):
+            reach_vector_child = np.copy(reach_vector)
+            reach_vector_child[player_index] *= strategy[slot]
+
+            action_utilities[slot] = self._cfr_traverse_compiled(child, reach_vector_child)
+
+        node_utilities = strategy @ action_utilities
+        self._update_regrets(info_set, player_index, reach_vector, strategy, action_utilities, node_utilities)
 
         return node_utilities
 
@@ -142,135 +230,630 @@ class CounterfactualRegretMinimizationBase:
         value = np.zeros(len(self._players))
         if node.is_terminal():
             return node.evaluation()
-        for action in node.actions:
-            if node.is_chance():
-                player_index = 0
-            else:
-                player_index = node.get_player_to_move().get_index()
-            value += self.nash_equilibrium[player_index][node.inf_set()][action] * self.__value_of_the_game_state_recursive(node.play(action))
+        if node.is_chance():
+            for outcome, child in node.get_children().items():
+                value += node.chance_probability(outcome) * self.__value_of_the_game_state_recursive(child)
+            return value
+        if node.inf_set() in self.infosets and self.nash_equilibrium is not None \
+                and self.infosets.get_id(node.inf_set()) < len(self.nash_equilibrium):
+            probabilities = self.nash_equilibrium[self.infosets.get_id(node.inf_set())]
+        else:
+            # never visited while training, play uniformly
+            probabilities = np.full(len(node.actions), 1. / len(node.actions))
+        for slot, action in enumerate(node.actions):
+            value += probabilities[slot] * self.__value_of_the_game_state_recursive(node.play(action))
+
+        return value
 
+    def __value_of_the_game_compiled(self, node):
+        tree = self.tree
+        if tree.node_type[node] == TERMINAL:
+            return tree.payoffs[node]
+        if tree.node_type[node] == CHANCE:
+            probabilities = tree.chance_prob[tree.children(node)]
+        elif self.nash_equilibrium is not None:
+            probabilities = self.nash_equilibrium[tree.infoset[node]]
+        else:
+            probabilities = np.full(tree.child_count[node], 1. / tree.child_count[node])
+        value = np.zeros(len(self._players))
+        for slot, child in enumerate(tree.children(node)):
+            value += probabilities[slot] * self.__value_of_the_game_compiled(child)
         return value
 
 
 class VanillaCFR(CounterfactualRegretMinimizationBase):
 
-    def __init__(self, root, players):
+    def __init__(self, root, players, processes=1):
+        if processes > 1 and not isinstance(root, CompiledGameTree):
+            # workers must agree on information set ids, so the parallel mode runs on the compiled tree
+            root = compile_game_tree(root, players)
         super().__init__(root=root, players=players, chance_sampling = False)
+        # with several processes every iteration is sharded by root chance outcome over a process pool
+        self._pool = ShardedCFRPool(self.tree, players, processes) if processes > 1 else None
 
     def run(self, iterations=1):
         utilities = np.zeros(len(self._players))
         for _ in range(0, iterations):
-            utilities += self._cfr_utility_recursive(self.root, np.ones(len(self._players)))
-
-        # since we do not update sigmas in each information set while traversing, we need to
-        # traverse the tree to perform to update it now
-        #self.__update_sigma_recursively(self.root)
-
-    def __update_sigma_recursively(self, node):
-        # stop traversal at terminal node
-        if node.is_terminal():
-            return
-        # omit chance
-        if not node.is_chance():
-            self.get_strategy(node)
-        # go to subtrees
-        for k in node.get_children():
-            self.__update_sigma_recursively(node.get_children()[k])
+            self.iteration += 1
+            if self._pool is not None:
+                utilities += self._pool.iteration(self.infosets)
+            else:
+                utilities += self._root_utility(np.ones(len(self._players)))
+            self._end_iteration()
+        return utilities
 
 class ChanceSamplingCFR(CounterfactualRegretMinimizationBase):
 
-    def __init__(self, root, players):
+    def __init__(self, root, players, processes=1, sync_every=None):
+        if processes > 1 and not isinstance(root, CompiledGameTree):
+            root = compile_game_tree(root, players)
         super().__init__(root=root, players=players, chance_sampling=True)
+        # with several processes, iterations run concurrently against shared tables
+        if processes > 1:
+            self._pool = SharedSamplingPool(type(self), self.tree, players, self.infosets, processes, sync_every,
+                                            seed=self.sampler.seed_sequence.spawn(1)[0])
 
     def run(self, iterations=1):
+        if self._pool is not None:
+            return self._run_pool(iterations)
         for _ in range(0, iterations):
-            self._cfr_utility_recursive(self.root, np.ones(len(self._players)))
+            self.iteration += 1
+            self._root_utility(np.ones(len(self._players)))
+            self._end_iteration()
 
 class ExternalSamplingCFR(CounterfactualRegretMinimizationBase):
-    def __init__(self, root, players):
+    def __init__(self, root, players, processes=1, sync_every=None):
+        if processes > 1 and not isinstance(root, CompiledGameTree):
+            root = compile_game_tree(root, players)
         super().__init__(root=root, players=players, chance_sampling=True)
+        # with several processes, iterations run concurrently against shared tables
+        if processes > 1:
+            self._pool = SharedSamplingPool(type(self), self.tree, players, self.infosets, processes, sync_every,
+                                            seed=self.sampler.seed_sequence.spawn(1)[0])
 
     def run(self, iterations=1):
+        if self._pool is not None:
+            return self._run_pool(iterations)
         utilities = np.zeros(len(self._players))
         for _ in range(0, iterations):
+            self.iteration += 1
             sampling_memory = {}
             for player in self._players:
-                utilities += self._perspective_cfr_utility_recursive(player, sampling_memory, self.root, np.ones(len(self._players)))
+                if self.tree is not None:
+                    utilities += self._perspective_cfr_utility_compiled(player.get_index(), 0, np.ones(len(self._players)))
+                else:
+                    utilities += self._perspective_cfr_utility_recursive(player, sampling_memory, self.root, np.ones(len(self._players)))
+            self._end_iteration()
         return utilities
 
     def _perspective_cfr_utility_recursive(self, perspective, sampling_memory, state, reach_vector):
-        action_utilities = {}
-        node_utilities = np.zeros(len(self._players))
-        info_set = state.inf_set()
-
         if state.is_terminal():
             return state.evaluation()
         if state.is_chance():
             return self._perspective_cfr_utility_recursive(perspective, sampling_memory, state.sample_one(), reach_vector)
 
-        strategy = self.get_strategy(state)
+        info_set = self._info_set_id(state)
+        strategy = self.infosets.current_strategy(info_set)
+        player_index = state.get_player_to_move().get_index()
 
         # if the player to move is not the player we're focused for perspective
         if state.get_player_to_move() != perspective:
             # sample a random action
-            weight_vector = [strategy[action] for action in state.actions]
-            #action_sampled = sampling_memory[info_set] if info_set in sampling_memory else np.random.choice(state.actions, p=weight_vector)
-            action_sampled = np.random.choice(state.actions, p=weight_vector)
-
-            # remember the action for future iterations on the same infoset
-            #sampling_memory[info_set] = action_sampled
+            slot_sampled = self.sampler.sample(strategy)
 
             # update reach vector for next iteration
             reach_vector_child = np.copy(reach_vector)
-            reach_vector_child[state.get_player_to_move().get_index()] *= strategy[action_sampled]
+            reach_vector_child[player_index] *= strategy[slot_sampled]
+
+            # the opponent's average strategy is accumulated along its sampled path
+            self._cumulate_sigma(info_set, strategy, 1.)
 
             # no update to regrets
             return self._perspective_cfr_utility_recursive(perspective, sampling_memory,
-                                                            state.play(action_sampled), reach_vector_child)
+                                                            state.play(state.actions[slot_sampled]), reach_vector_child)
 
         # if player to move IS player we're focused on for perspective
-        for action in state.actions:
+        action_utilities = np.zeros((len(state.actions), len(self._players)))
+        for slot, action in enumerate(state.actions):
             reach_vector_child = np.copy(reach_vector)
-            reach_vector_child[state.get_player_to_move().get_index()] *= strategy[action]
+            reach_vector_child[player_index] *= strategy[slot]
 
-            action_utilities[action] = self._perspective_cfr_utility_recursive(perspective, sampling_memory,
-                                                                               state.play(action), reach_vector_child)
+            action_utilities[slot] = self._perspective_cfr_utility_recursive(perspective, sampling_memory,
+                                                                             state.play(action), reach_vector_child)
 
-            node_utilities = strategy[action] * action_utilities[action]
+        node_utilities = strategy @ action_utilities
 
-        # accumulate regret
-        for action in state.actions:
-            # likelihood of arriving at this state given our strategy assuming our perspective player wanted to get there
-            perspective_index = perspective.get_index()
-            #print(reach_vector)
-            counterfactual = 1
-            for player in self._players:
-                if player != state.get_player_to_move():
-                    counterfactual *= reach_vector[player.get_index()]
+        # accumulate regret, the sampled opponents' reach is already accounted for by sampling
+        perspective_index = perspective.get_index()
+        regrets = action_utilities[:, perspective_index] - node_utilities[perspective_index]
+        self._add_regrets(info_set, regrets)
 
-            regret = action_utilities[action][perspective_index] - node_utilities[perspective_index]
+        return node_utilities
 
-            self.cumulative_regrets[info_set][action] += counterfactual * regret
-            #self.cumulative_sigma[perspective_index][info_set][action] += counterfactual * strategy[action]
+    def _perspective_cfr_utility_compiled(self, perspective_index, node, reach_vector):
+        tree = self.tree
+        node_type = tree.node_type[node]
+        if node_type == TERMINAL:
+            return tree.payoffs[node]
+        if node_type == CHANCE:
+            return self._perspective_cfr_utility_compiled(perspective_index, tree.sample_child(node, self.sampler), reach_vector)
+
+        info_set = tree.infoset[node]
+        strategy = self.infosets.current_strategy(info_set)
+        player_index = tree.player[node]
+        children = tree.children(node)
+
+        if player_index != perspective_index:
+            slot_sampled = self.sampler.sample(strategy)
+            reach_vector_child = np.copy(reach_vector)
+            reach_vector_child[player_index] *= strategy[slot_sampled]
+            self._cumulate_sigma(info_set, strategy, 1.)
+            return self._perspective_cfr_utility_compiled(perspective_index, children[slot_sampled], reach_vector_child)
 
-        return node_utilities
+        action_utilities = np.zeros((len(children), len(self._players)))
+        for slot, child in enumerate(children):
+            reach_vector_child = np.copy(reach_vector)
+            reach_vector_child[player_index] *= strategy[slot]
+            action_utilities[slot] = self._perspective_cfr_utility_compiled(perspective_index, child, reach_vector_child)
 
-    def compute_nash_equilibrium(self):
-        RuntimeError("Not Implemented for scability reasons")
+        node_utilities = strategy @ action_utilities
+        regrets = action_utilities[:, perspective_index] - node_utilities[perspective_index]
+        self._add_regrets(info_set, regrets)
+
+        return node_utilities
 
     def run_simulation(self):
+        if self.tree is not None:
+            return self.__run_simulation_compiled()
         curr_node = self.root
         while not curr_node.is_terminal():
             if curr_node.is_chance():
-                curr_node = curr_node.play(random.choice(curr_node.actions))
+                curr_node = curr_node.sample_one()
             else:
                 strategy = self.get_strategy(curr_node)
-                weight_vector = [strategy[action] for action in curr_node.actions]
-                curr_node = curr_node.play(np.random.choice(curr_node.actions, p=weight_vector))
+                curr_node = curr_node.play(curr_node.actions[self.sampler.sample(strategy)])
         return curr_node.evaluation()
 
+    def __run_simulation_compiled(self):
+        tree = self.tree
+        node = 0
+        while tree.node_type[node] != TERMINAL:
+            if tree.node_type[node] == CHANCE:
+                node = tree.sample_child(node, self.sampler)
+            else:
+                strategy = self.infosets.current_strategy(tree.infoset[node])
+                node = tree.child_start[node] + self.sampler.sample(strategy)
+        return tree.payoffs[node]
+
     def approximate_value_of_game(self, num_simulations=100):
+        if self.tree is not None:
+            # all games at once, see optimizer.simulation
+            simulator = BatchedSimulator(self.tree, self._players)
+            return simulator.simulate(self.infosets.current_strategies(), num_simulations, self.sampler).mean
         values = np.zeros(len(self._players))
         for i in range(num_simulations):
             values += self.run_simulation()
-        return values / num_simulations
\ No newline at end of file
+        return values / num_simulations
+
+class CFRPlusSolver(CounterfactualRegretMinimizationBase):
+    """Full-width CFR+.
+
+    Differs from VanillaCFR in three ways: cumulative regrets are floored at
+    zero after every update (regret-matching+), players are updated in turn
+    within an iteration (each traversal only updates the traversing player, who
+    already faces the opponents' strategies of this iteration) and the average
+    strategy weights iteration t by t.
+    """
+
+    def __init__(self, root, players):
+        super().__init__(root=root, players=players, chance_sampling=False)
+        self._traverser = None
+
+    def run(self, iterations=1):
+        utilities = np.zeros(len(self._players))
+        for _ in range(0, iterations):
+            self.iteration += 1
+            for player in self._players:
+                self._traverser = player.get_index()
+                utilities += self._root_utility(np.ones(len(self._players)))
+            self._end_iteration()
+        return utilities / len(self._players)
+
+    def _update_regrets(self, info_set, player_index, reach_vector, strategy, action_utilities, node_utilities):
+        if player_index != self._traverser:
+            return
+        counterfactual = self._counterfactual_reach(reach_vector, player_index)
+        regrets = counterfactual * (action_utilities[:, player_index] - node_utilities[player_index])
+        self._defer_regrets(info_set, regrets)
+        self._cumulate_sigma(info_set, strategy, self.iteration * reach_vector[player_index])
+
+    def _apply_regret_deltas(self, rows, deltas):
+        regrets = self.infosets.regrets
+        n = deltas.shape[1]
+        regrets[rows, :n] = np.maximum(regrets[rows, :n] + deltas, 0.)
+
+
+class OutcomeSamplingCFR(CounterfactualRegretMinimizationBase):
+    """Outcome sampling MCCFR with variance reduction baselines (VR-MCCFR).
+
+    Every iteration samples one trajectory per player: the traversing player
+    samples from an epsilon-exploring version of its strategy, opponents and
+    chance on-policy. At every node on the trajectory the sampled action's
+    value is importance corrected against a learned baseline of that action
+    (an exponentially decaying average of its past sampled values) and all
+    other actions take their baseline, which keeps the estimates unbiased with
+    much lower variance. The cost of an iteration is linear in the depth of the
+    game. baseline_rate=0 gives plain outcome sampling.
+    """
+
+    def __init__(self, root, players, exploration=0.6, baseline_rate=0.1):
+        super().__init__(root=root, players=players, chance_sampling=True)
+        self.exploration = exploration
+        self.baseline_rate = baseline_rate
+        # per information set and action, the baseline value for every player
+        self.baselines = np.zeros((self.infosets.capacity, self.infosets.width, len(players)))
+
+    def run(self, iterations=1):
+        utilities = np.zeros(len(self._players))
+        for _ in range(0, iterations):
+            self.iteration += 1
+            for player in self._players:
+                if self.tree is not None:
+                    utilities += self._outcome_sampling_compiled(player.get_index(), 0, 1., 1., 1.)
+                else:
+                    utilities += self._outcome_sampling_recursive(player.get_index(), self.root, 1., 1., 1.)
+            self._end_iteration()
+        return utilities / len(self._players)
+
+    def _grow_baselines(self):
+        if self.baselines.shape[0] < self.infosets.capacity or self.baselines.shape[1] < self.infosets.width:
+            grown = np.zeros((self.infosets.capacity, self.infosets.width, len(self._players)))
+            grown[:self.baselines.shape[0], :self.baselines.shape[1]] = self.baselines
+            self.baselines = grown
+
+    def _baseline(self, info_set):
+        self._grow_baselines()
+        return self.baselines[info_set]
+
+    def _checkpoint_rows(self):
+        self._grow_baselines()
+        return dict(super()._checkpoint_rows(), baselines=self.baselines)
+
+    def _sample(self, info_set, player_index, traverser):
+        strategy = self.infosets.current_strategy(info_set)
+        if player_index == traverser:
+            policy = self.exploration / len(strategy) + (1. - self.exploration) * strategy
+        else:
+            policy = strategy
+        return strategy, policy, self.sampler.sample(policy)
+
+    def _child_reaches(self, player_index, traverser, strategy, policy, slot, traverser_reach, opponent_reach, sample_reach):
+        if player_index == traverser:
+            return traverser_reach * strategy[slot], opponent_reach, sample_reach * policy[slot]
+        return traverser_reach, opponent_reach * strategy[slot], sample_reach * policy[slot]
+
+    def _baseline_corrected_value(self, info_set, player_index, traverser, strategy, policy, slot, child_value,
+                                  traverser_reach, opponent_reach, sample_reach):
+        baseline = self._baseline(info_set)[:len(strategy)]
+        action_values = np.copy(baseline)
+        action_values[slot] += (child_value - baseline[slot]) / policy[slot]
+        node_value = strategy @ action_values
+
+        if player_index == traverser:
+            regrets = action_values[:, traverser] - node_value[traverser]
+            self._add_regrets(info_set, opponent_reach / sample_reach * regrets)
+            self._cumulate_sigma(info_set, strategy, traverser_reach / sample_reach)
+        baseline[slot] += self.baseline_rate * (child_value - baseline[slot])
+        return node_value
+
+    def _outcome_sampling_recursive(self, traverser, state, traverser_reach, opponent_reach, sample_reach):
+        if state.is_terminal():
+            return state.evaluation()
+        if state.is_chance():
+            # chance is sampled on-policy, its probability enters both reaches and cancels
+            outcome = state.sample_outcome()
+            chance_prob = state.chance_probability(outcome)
+            return self._outcome_sampling_recursive(traverser, state.play_outcome(outcome), traverser_reach,
+                                                    opponent_reach * chance_prob, sample_reach * chance_prob)
+
+        info_set = self._info_set_id(state)
+        player_index = state.get_player_to_move().get_index()
+        strategy, policy, slot = self._sample(info_set, player_index, traverser)
+        child_value = self._outcome_sampling_recursive(
+            traverser, state.play(state.actions[slot]),
+            *self._child_reaches(player_index, traverser, strategy, policy, slot, traverser_reach, opponent_reach, sample_reach))
+        return self._baseline_corrected_value(info_set, player_index, traverser, strategy, policy, slot, child_value,
+                                              traverser_reach, opponent_reach, sample_reach)
+
+    def _outcome_sampling_compiled(self, traverser, node, traverser_reach, opponent_reach, sample_reach):
+        tree = self.tree
+        node_type = tree.node_type[node]
+        if node_type == TERMINAL:
+            return tree.payoffs[node]
+        if node_type == CHANCE:
+            child = tree.sample_child(node, self.sampler)
+            chance_prob = tree.chance_prob[child]
+            return self._outcome_sampling_compiled(traverser, child, traverser_reach,
+                                                   opponent_reach * chance_prob, sample_reach * chance_prob)
+
+        info_set = tree.infoset[node]
+        player_index = tree.player[node]
+        strategy, policy, slot = self._sample(info_set, player_index, traverser)
+        child_value = self._outcome_sampling_compiled(
+            traverser, tree.child_start[node] + slot,
+            *self._child_reaches(player_index, traverser, strategy, policy, slot, traverser_reach, opponent_reach, sample_reach))
+        return self._baseline_corrected_value(info_set, player_index, traverser, strategy, policy, slot, child_value,
+                                              traverser_reach, opponent_reach, sample_reach)
+
+
+class DiscountedRegretsMixin:
+    """Discounted CFR (DCFR) on top of any traversal of this module.
+
+    At the end of iteration t positive cumulative regrets are multiplied by
+    t^alpha / (t^alpha + 1), negative ones by t^beta / (t^beta + 1), and the
+    strategy sum by (t / (t + 1))^gamma. Linear CFR is alpha = beta = gamma = 1.
+
+    Discounting is lazy: every information set remembers through which
+    iteration its regrets are discounted and catches up (one multiplication,
+    from cumulative log discount factors) just before its next regret update.
+    A row's sign pattern cannot change while it is untouched and regret
+    matching ignores a common factor on the positive regrets, so strategies are
+    exactly those of eager discounting. The strategy sum discount is the same
+    for every information set, so iteration t is simply weighted by t^gamma.
+    Call flush_discounts() before reading the regret table directly.
+    """
+
+    def _init_discounting(self, alpha, beta, gamma):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self._discounted_through = np.zeros(self.infosets.capacity, dtype=np.int64)
+        # cumulative log discount factors of iterations 1..t, index t
+        self._log_positive_discount = [0.]
+        self._log_negative_discount = [0.]
+
+    def _log_discounts(self, t):
+        while len(self._log_positive_discount) <= t:
+            k = len(self._log_positive_discount)
+            self._log_positive_discount.append(self._log_positive_discount[-1] + np.log(k ** self.alpha / (k ** self.alpha + 1)))
+            self._log_negative_discount.append(self._log_negative_discount[-1] + np.log(k ** self.beta / (k ** self.beta + 1)))
+        return self._log_positive_discount, self._log_negative_discount
+
+    def _discount_rows(self, rows, through):
+        positive, negative = self._log_discounts(through)
+        since = self._discounted_through[rows]
+        positive_factor = np.exp(positive[through] - np.take(positive, since))
+        negative_factor = np.exp(negative[through] - np.take(negative, since))
+        regrets = self.infosets.regrets[rows]
+        self.infosets.regrets[rows] = np.where(regrets > 0, regrets * positive_factor[..., None],
+                                               regrets * negative_factor[..., None])
+        self._discounted_through[rows] = through
+
+    def _grow_discount_stamps(self):
+        if len(self._discounted_through) < self.infosets.capacity:
+            grown = np.zeros(self.infosets.capacity, dtype=np.int64)
+            grown[:len(self._discounted_through)] = self._discounted_through
+            self._discounted_through = grown
+
+    def _checkpoint_rows(self):
+        self._grow_discount_stamps()
+        return dict(super()._checkpoint_rows(), discounted_through=self._discounted_through)
+
+    def _add_regrets(self, information_set_id, regrets):
+        if information_set_id >= len(self._discounted_through):
+            self._grow_discount_stamps()
+        # bring the row up to the end of the previous iteration before adding this one's regrets
+        if self._discounted_through[information_set_id] < self.iteration - 1:
+            self._discount_rows(information_set_id, self.iteration - 1)
+        self.infosets.regrets[information_set_id, :len(regrets)] += regrets
+
+    def _apply_regret_deltas(self, rows, deltas):
+        self._grow_discount_stamps()
+        behind = rows[self._discounted_through[rows] < self.iteration - 1]
+        if len(behind):
+            self._discount_rows(behind, self.iteration - 1)
+        self.infosets.regrets[rows, :deltas.shape[1]] += deltas
+
+    def _cumulate_sigma(self, information_set_id, strategy, prob):
+        super()._cumulate_sigma(information_set_id, strategy, prob * self.iteration ** self.gamma)
+
+    def flush_discounts(self):
+        """Applies all pending discounts, through the last completed iteration."""
+        rows = np.arange(min(len(self.infosets), len(self._discounted_through)))
+        self._discount_rows(rows, self.iteration)
+
+
+class DiscountedCFR(DiscountedRegretsMixin, VanillaCFR):
+    """Full-width Discounted CFR, alpha=1.5, beta=0, gamma=2 by default."""
+
+    def __init__(self, root, players, alpha=1.5, beta=0., gamma=2.):
+        super().__init__(root=root, players=players)
+        self._init_discounting(alpha, beta, gamma)
+
+
+class LinearCFR(DiscountedCFR):
+    """Full-width Linear CFR: iteration t's regrets and strategy weighted by t."""
+
+    def __init__(self, root, players):
+        super().__init__(root=root, players=players, alpha=1., beta=1., gamma=1.)
+
+
+class DiscountedChanceSamplingCFR(DiscountedRegretsMixin, ChanceSamplingCFR):
+
+    def __init__(self, root, players, alpha=1.5, beta=0., gamma=2.):
+        super().__init__(root=root, players=players)
+        self._init_discounting(alpha, beta, gamma)
+
+
+class DiscountedExternalSamplingCFR(DiscountedRegretsMixin, ExternalSamplingCFR):
+
+    def __init__(self, root, players, alpha=1.5, beta=0., gamma=2.):
+        super().__init__(root=root, players=players)
+        self._init_discounting(alpha, beta, gamma)
+
+
+class VectorizedCFR(CounterfactualRegretMinimizationBase):
+    """Full-width CFR over a CompiledGameTree, one depth level at a time.
+
+    Each iteration regret-matches every information set at once, pushes reach
+    probabilities down the tree level by level, pulls expected values back up
+    level by level and scatters all regret and strategy sum updates into the
+    information set table with a single bincount each. Regrets are weighted
+    exactly like VanillaCFR: by the opponents' reach, with chance probabilities
+    entering through the values.
+    """
+
+    def __init__(self, root, players):
+        if not isinstance(root, CompiledGameTree):
+            root = compile_game_tree(root, players)
+        super().__init__(root=root, players=players, chance_sampling=False)
+        tree = self.tree
+        num_players = len(players)
+
+        parent = np.maximum(tree.parent, 0)
+        # edges into children of decision nodes, they carry the strategy of the parent's information set
+        decision_edge = (tree.node_type[parent] == DECISION) & (tree.parent >= 0)
+        self._decision_edges = np.nonzero(decision_edge)[0]
+        self._edge_parent = parent[self._decision_edges]
+        self._edge_mover = tree.player[self._edge_parent].astype(np.int64)
+        self._edge_slot_index = tree.infoset[self._edge_parent].astype(np.int64) * self.infosets.width \
+                                + tree.slot[self._decision_edges]
+        self._edge_prob = np.copy(tree.chance_prob)
+
+        # decision nodes, with the position of each decision edge's parent among them
+        self._decision_nodes, self._edge_decision = np.unique(self._edge_parent, return_inverse=True)
+        self._decision_rows = np.arange(len(self._decision_nodes))
+        self._decision_mover = tree.player[self._decision_nodes].astype(np.int64)
+
+        # per level: parent of every node, the column of the player whose probability the edge
+        # carries (num_players for chance), and reduceat offsets of the sibling groups in the level
+        self._levels = []
+        for depth in range(1, tree.num_levels):
+            start, end = tree.level(depth)
+            nodes = np.arange(start, end)
+            mover = np.where(decision_edge[start:end], tree.player[parent[start:end]], num_players)
+            parents = np.unique(parent[start:end])
+            offsets = tree.child_start[parents] - start
+            self._levels.append((start, end, parent[start:end], nodes, mover.astype(np.int64), parents, offsets))
+
+        self._reach = np.ones((tree.num_nodes, num_players + 1))
+        self._values = np.copy(tree.payoffs)
+
+    def run(self, iterations=1):
+        utilities = np.zeros(len(self._players))
+        for _ in range(0, iterations):
+            self.iteration += 1
+            utilities += self._iteration()
+            self._end_iteration()
+        return utilities
+
+    def _iteration(self):
+        tree = self.tree
+        infosets = self.infosets
+        num_infosets, width = len(infosets), infosets.width
+        num_players = len(self._players)
+
+        strategies = infosets.current_strategies()
+        edge_prob = self._edge_prob
+        edge_prob[self._decision_edges] = strategies.ravel()[self._edge_slot_index]
+
+        # push reach probabilities down, one level at a time
+        reach = self._reach
+        for start, end, parents, nodes, mover, _, _ in self._levels:
+            reach[start:end] = reach[parents]
+            reach[nodes, mover] *= edge_prob[start:end]
+
+        # pull expected values up, one level at a time; terminal values never change
+        values = self._values
+        for start, end, _, _, _, parents, offsets in reversed(self._levels):
+            values[parents] = np.add.reduceat(edge_prob[start:end, None] * values[start:end], offsets, axis=0)
+
+        # counterfactual regrets of every decision edge, scattered into the table
+        edges, edge_parent, edge_mover = self._decision_edges, self._edge_parent, self._edge_mover
+        opponents_reach = reach[self._decision_nodes, :num_players]
+        opponents_reach[self._decision_rows, self._decision_mover] = 1.
+        counterfactual = np.prod(opponents_reach, axis=1)[self._edge_decision]
+        regrets = counterfactual * (values[edges, edge_mover] - values[edge_parent, edge_mover])
+        size = num_infosets * width
+        infosets.regrets[:num_infosets] += np.bincount(self._edge_slot_index, regrets, size).reshape(num_infosets, width)
+        infosets.strategy_sum[:num_infosets] += np.bincount(self._edge_slot_index, reach[edges, edge_mover], size).reshape(num_infosets, width)
+
+        return np.copy(values[0])
+
+class VectorFormCFR(CounterfactualRegretMinimizationBase):
+    """Full-width CFR over the public tree of a game.
+
+    Every betting sequence is visited once per iteration, carrying a vector of
+    reach probabilities over each player's private hands; terminal values are
+    contractions of the hand-combination utility tables against the other
+    players' reach vectors (a matrix product with two players). Accepts any
+    game implementing the public tree interface (KuhnGame, LDGame) or an
+    already compiled PublicGameTree.
+    """
+
+    def __init__(self, game, players):
+        public_tree = game if isinstance(game, PublicGameTree) else compile_public_tree(game, players)
+        super().__init__(root=public_tree, players=players, chance_sampling=False)
+        self.public_tree = public_tree
+        self.infosets = public_tree.infosets.empty_like()
+        # chance weighted utilities, so terminal values only need the players' reach
+        self._weighted_utilities = {node: utilities * public_tree.deal_probabilities
+                                    for node, utilities in public_tree.utilities.items()}
+
+    def _initial_reaches(self):
+        return [np.ones(self.public_tree.num_hands) for _ in self._players]
+
+    def run(self, iterations=1):
+        utilities = np.zeros(len(self._players))
+        for _ in range(0, iterations):
+            self.iteration += 1
+            values = self._vector_cfr_recursive(0, self._initial_reaches())
+            utilities += [value.sum() for value in values]
+            self._end_iteration()
+        return utilities
+
+    def _vector_cfr_recursive(self, node, reaches, average=False):
+        """Counterfactual values of every player's hands below node. Updates regrets
+        and strategy sums unless average is set, in which case the average
+        strategy is played instead of the current one."""
+        tree = self.public_tree
+        num_players = len(self._players)
+        if tree.node_type[node] == TERMINAL:
+            utilities = self._weighted_utilities[node]
+            return [contract_reaches(utilities[i], reaches, i) for i in range(num_players)]
+
+        player_index = tree.player[node]
+        info_sets = tree.infoset[node]
+        num_actions = tree.child_count[node]
+        if average:
+            strategy = self.infosets.average_strategies(info_sets)[:, :num_actions]
+        else:
+            strategy = self.infosets.current_strategies(info_sets)[:, :num_actions]
+
+        node_values = [np.zeros(tree.num_hands) for _ in range(num_players)]
+        action_values = np.zeros((num_actions, tree.num_hands))
+        for slot, child in enumerate(tree.children(node)):
+            reaches_child = list(reaches)
+            reaches_child[player_index] = reaches[player_index] * strategy[:, slot]
+            child_values = self._vector_cfr_recursive(child, reaches_child, average)
+
+            action_values[slot] = child_values[player_index]
+            for i in range(num_players):
+                if i == player_index:
+                    node_values[i] += strategy[:, slot] * child_values[i]
+                else:
+                    node_values[i] += child_values[i]
+
+        if not average:
+            # values are counterfactual already, opponents' reach and chance are folded into them
+            self.infosets.regrets[info_sets, :num_actions] += (action_values - node_values[player_index]).T
+            self.infosets.strategy_sum[info_sets, :num_actions] += reaches[player_index][:, None] * strategy
+
+        return node_values
+
+    def compute_nash_equilibrium(self):
+        self.nash_equilibrium = self.infosets.average_strategies()
+
+    def value_of_the_game(self):
+        values = self._vector_cfr_recursive(0, self._initial_reaches(), average=True)
+        return np.array([value.sum() for value in values])
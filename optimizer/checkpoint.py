@@ -0,0 +1,179 @@
+import os
+import pickle
+import random
+import uuid
+
+import numpy as np
+
+
+class Checkpointer:
+    """Saves a solver's state to ``path`` and resumes it, incrementally.
+
+    A checkpoint holds the rows of every information set (regrets, strategy
+    sums and whatever else the solver declares in ``_checkpoint_rows``), the
+    information set keys and actions, the iteration counter and the states of
+    the ``random`` and ``np.random`` generators and of the solver's sampler, so
+    a resumed run continues
+    exactly as the original would have. Files are NumPy ``.npz`` archives,
+    written to a temporary file and renamed into place, so a crash never
+    leaves a partial checkpoint behind.
+
+    The first save and every ``full_every``-th save after it write the whole
+    table to ``path``; the saves in between write delta checkpoints
+    (``path.delta-000001``, ...) holding only the information sets added or
+    changed since the previous save. Changed rows are found by comparing
+    against a copy of the rows made at the last save, which costs one extra
+    copy of the solver's tables in memory. Save between calls to run, not
+    during a parallel run.
+    """
+
+    def __init__(self, path, full_every=10):
+        self.path = path
+        self.full_every = full_every
+        self._generation = None
+        self._sequence = 0
+        self._snapshot = None
+        self._num_infosets = 0
+
+    def delta_path(self, sequence):
+        return '{}.delta-{:06d}'.format(self.path, sequence)
+
+    def save(self, solver):
+        """Writes a full or a delta checkpoint of solver and returns its path."""
+        if self._generation is None or self._sequence + 1 >= self.full_every:
+            return self._save_full(solver)
+        return self._save_delta(solver)
+
+    def _save_full(self, solver):
+        infosets = solver.infosets
+        num_infosets = len(infosets)
+        rows = {name: array[:num_infosets] for name, array in solver._checkpoint_rows().items()}
+        self._generation = uuid.uuid4().hex
+        self._sequence = 0
+        header = self._header(solver, range(num_infosets))
+        _write_atomic(self.path, header, np.arange(num_infosets), rows)
+        self._remove_deltas()
+        self._take_snapshot(solver)
+        return self.path
+
+    def _save_delta(self, solver):
+        num_infosets = len(solver.infosets)
+        previous = self._num_infosets
+        current = solver._checkpoint_rows()
+        changed = np.zeros(previous, dtype=bool)
+        for name, snapshot in self._snapshot.items():
+            changed |= np.any((current[name][:previous] != snapshot).reshape(previous, -1), axis=1)
+        ids = np.concatenate([np.nonzero(changed)[0], np.arange(previous, num_infosets)])
+        rows = {name: array[ids] for name, array in current.items()}
+
+        self._sequence += 1
+        header = self._header(solver, range(previous, num_infosets))
+        path = self.delta_path(self._sequence)
+        _write_atomic(path, header, ids, rows)
+        self._take_snapshot(solver)
+        return path
+
+    def _header(self, solver, new_ids):
+        infosets = solver.infosets
+        return {
+            'generation': self._generation,
+            'sequence': self._sequence,
+            'solver': type(solver).__name__,
+            'first_new_id': new_ids.start,
+            'keys': [infosets.key(iid) for iid in new_ids],
+            'actions': [infosets.actions(iid) for iid in new_ids],
+            'attributes': {name: getattr(solver, name) for name in solver._checkpoint_attributes},
+            'rng': (random.getstate(), np.random.get_state()),
+            'sampler': solver.sampler.getstate(),
+        }
+
+    def _take_snapshot(self, solver):
+        num_infosets = len(solver.infosets)
+        self._num_infosets = num_infosets
+        self._snapshot = {name: np.copy(array[:num_infosets]) for name, array in solver._checkpoint_rows().items()}
+
+    def _remove_deltas(self):
+        directory, name = os.path.split(os.path.abspath(self.path))
+        for file_name in os.listdir(directory):
+            if file_name.startswith(name + '.delta-'):
+                os.remove(os.path.join(directory, file_name))
+
+    def resume(self, solver, game=None):
+        """Restores solver from the checkpoint at path and the delta checkpoints
+        saved after it. Returns False, leaving solver untouched, if there is no
+        checkpoint yet.
+
+        Information sets must keep their ids and actions. With game, the
+        actions of every saved information set are also checked against
+        game.information_set_actions, which catches checkpoints of another
+        game when the solver's table starts empty. Mismatches raise ValueError."""
+        if not os.path.exists(self.path):
+            return False
+        header, ids, rows = _read(self.path)
+        self._generation = header['generation']
+        self._sequence = 0
+        while True:
+            _restore(solver, header, ids, rows, game)
+            if not os.path.exists(self.delta_path(self._sequence + 1)):
+                break
+            delta = _read(self.delta_path(self._sequence + 1))
+            if delta[0]['generation'] != self._generation:
+                # left over from an earlier chain of checkpoints
+                break
+            header, ids, rows = delta
+            self._sequence += 1
+
+        random.setstate(header['rng'][0])
+        np.random.set_state(header['rng'][1])
+        solver.sampler.setstate(header['sampler'])
+        self._take_snapshot(solver)
+        return True
+
+
+def _restore(solver, header, ids, rows, game=None):
+    if header['solver'] != type(solver).__name__:
+        raise ValueError("checkpoint of a {} cannot be restored into a {}".format(header['solver'], type(solver).__name__))
+    if game is not None:
+        for key, actions in zip(header['keys'], header['actions']):
+            try:
+                legal = game.information_set_actions(key)
+            except (KeyError, TypeError):
+                legal = None
+            if legal is None or list(legal) != list(actions):
+                raise ValueError("checkpoint information set {!r} does not match the game's".format(key))
+    # check every information set before registering any, so that a rejected
+    # checkpoint leaves the solver's table as it was
+    infosets = solver.infosets
+    next_id = len(infosets)
+    for iid, (key, actions) in enumerate(zip(header['keys'], header['actions']), header['first_new_id']):
+        if key in infosets:
+            matches = infosets.get_id(key) == iid and list(infosets.actions(iid)) == list(actions)
+        else:
+            matches = iid == next_id
+            next_id += 1
+        if not matches:
+            raise ValueError("checkpoint information sets do not match the solver's")
+    for key, actions in zip(header['keys'], header['actions']):
+        infosets.index(key, actions)
+    for name, array in solver._checkpoint_rows().items():
+        saved = rows[name]
+        array[(ids,) + tuple(slice(0, size) for size in saved.shape[1:])] = saved
+    for name, value in header['attributes'].items():
+        setattr(solver, name, value)
+
+
+def _write_atomic(path, header, ids, rows):
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, header=np.frombuffer(pickle.dumps(header, pickle.HIGHEST_PROTOCOL), dtype=np.uint8),
+                 ids=ids, **{'rows.' + name: array for name, array in rows.items()})
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def _read(path):
+    with np.load(path) as data:
+        header = pickle.loads(data['header'].tobytes())
+        rows = {name[len('rows.'):]: data[name] for name in data.files if name.startswith('rows.')}
+        return header, data['ids'], rows
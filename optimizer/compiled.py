@@ -0,0 +1,160 @@
+from collections import deque
+import random
+
+import numpy as np
+
+from optimizer.infoset import InfoSetTable
+from optimizer.sampling import AliasTable
+
+TERMINAL = 0
+CHANCE = 1
+DECISION = 2
+
+
+class CompiledGameTree:
+    """Struct-of-arrays form of a fully expanded game tree.
+
+    Nodes are numbered breadth first, so every depth level is a contiguous
+    range (see ``level_offsets``) and the children of a node are the contiguous
+    range ``[child_start, child_start + child_count)``, ordered like the node's
+    actions (a child's position in that range is its action slot). Per node:
+
+    * ``node_type``: TERMINAL, CHANCE or DECISION
+    * ``player``: index of the player to move, -1 for chance and terminal nodes
+    * ``infoset``: information set id in ``infosets``, -1 unless a decision node
+    * ``parent``, ``slot``, ``depth``: position of the node in the tree
+    * ``chance_prob``: probability of the node given its parent, 1 unless the
+      parent is a chance node
+    * ``payoffs``: ``(num_nodes, num_players)`` terminal utilities, zero elsewhere
+    """
+
+    def __init__(self, node_type, player, infoset, parent, slot, depth, child_start, child_count,
+                 chance_prob, payoffs, infosets):
+        self.node_type = node_type
+        self.player = player
+        self.infoset = infoset
+        self.parent = parent
+        self.slot = slot
+        self.depth = depth
+        self.child_start = child_start
+        self.child_count = child_count
+        self.chance_prob = chance_prob
+        self.payoffs = payoffs
+        # information set ids, keys and action slots; regrets are never written here,
+        # solvers work on their own infosets.empty_like() copy
+        self.infosets = infosets
+        self.level_offsets = np.searchsorted(depth, np.arange(depth[-1] + 2)).astype(np.int64)
+        # alias tables of the chance nodes sampled so far, by node
+        self._alias_tables = {}
+
+    @property
+    def num_nodes(self):
+        return len(self.node_type)
+
+    @property
+    def num_players(self):
+        return self.payoffs.shape[1]
+
+    @property
+    def num_levels(self):
+        return len(self.level_offsets) - 1
+
+    def level(self, depth):
+        """Node id range ``(start, end)`` of a depth level."""
+        return self.level_offsets[depth], self.level_offsets[depth + 1]
+
+    def children(self, node):
+        start = self.child_start[node]
+        return range(start, start + self.child_count[node])
+
+    def is_terminal(self, node):
+        return self.node_type[node] == TERMINAL
+
+    def is_chance(self, node):
+        return self.node_type[node] == CHANCE
+
+    def sample_child(self, node, sampler=None):
+        """A random child of chance node, drawn with sampler (an
+        optimizer.sampling.Sampler) if given, else with the random module."""
+        start, count = self.child_start[node], self.child_count[node]
+        if sampler is None:
+            return random.choices(range(start, start + count), weights=self.chance_prob[start:start + count])[0]
+        table = self._alias_tables.get(node)
+        if table is None:
+            table = self._alias_tables[node] = AliasTable(self.chance_prob[start:start + count])
+        return start + sampler.sample_alias(table)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in (
+            self.node_type, self.player, self.infoset, self.parent, self.slot, self.depth,
+            self.child_start, self.child_count, self.chance_prob, self.payoffs, self.level_offsets))
+
+
+def _outcomes(state):
+    if state.is_terminal():
+        return []
+    if state.is_chance():
+        # Kuhn lists its deals as actions, Liar's dice rolls only exist as children
+        return [(child, state.chance_probability(outcome)) for outcome, child in state.get_children().items()]
+    return [(state.play(action), 1.) for action in state.actions]
+
+
+def compile_game_tree(root, players, infosets=None):
+    """Walks the whole tree under root once and returns its CompiledGameTree.
+
+    Information sets are registered in ``infosets`` (a new InfoSetTable by
+    default) in breadth first order."""
+    infosets = infosets if infosets is not None else InfoSetTable()
+    num_players = len(players)
+
+    node_type, player, infoset, parent, slot, depth = [], [], [], [], [], []
+    child_start, child_count, chance_prob, payoffs = [], [], [], {}
+
+    queue = deque([(root, -1, 0, 0, 1.)])
+    next_id = 1
+    while queue:
+        state, parent_id, node_slot, node_depth, probability = queue.popleft()
+        node_id = len(node_type)
+        parent.append(parent_id)
+        slot.append(node_slot)
+        depth.append(node_depth)
+        chance_prob.append(probability)
+
+        if state.is_terminal():
+            node_type.append(TERMINAL)
+            player.append(-1)
+            infoset.append(-1)
+            payoffs[node_id] = state.evaluation()
+        elif state.is_chance():
+            node_type.append(CHANCE)
+            player.append(-1)
+            infoset.append(-1)
+        else:
+            node_type.append(DECISION)
+            player.append(state.get_player_to_move().get_index())
+            infoset.append(infosets.index(state.inf_set(), state.actions))
+
+        outcomes = _outcomes(state)
+        child_start.append(next_id)
+        child_count.append(len(outcomes))
+        for child_slot, (child, child_probability) in enumerate(outcomes):
+            queue.append((child, node_id, child_slot, node_depth + 1, child_probability))
+        next_id += len(outcomes)
+
+    payoff_array = np.zeros((len(node_type), num_players))
+    for node_id, value in payoffs.items():
+        payoff_array[node_id] = value
+
+    return CompiledGameTree(
+        node_type=np.array(node_type, dtype=np.int8),
+        player=np.array(player, dtype=np.int16),
+        infoset=np.array(infoset, dtype=np.int32),
+        parent=np.array(parent, dtype=np.int32),
+        slot=np.array(slot, dtype=np.int16),
+        depth=np.array(depth, dtype=np.int16),
+        child_start=np.array(child_start, dtype=np.int32),
+        child_count=np.array(child_count, dtype=np.int32),
+        chance_prob=np.array(chance_prob),
+        payoffs=payoff_array,
+        infosets=infosets,
+    )
@@ -0,0 +1,123 @@
+import numpy as np
+
+from optimizer.compiled import TERMINAL
+from optimizer.public import PublicGameTree, compile_public_tree
+
+
+class BestResponse:
+    """Best response values and exploitability (NashConv) of strategy profiles.
+
+    Works on the public tree of a game, one depth level at a time, with every
+    player's reach and values held as vectors over private hands. A player's
+    counterfactual values never depend on its own reach, so the best responses
+    of all players come out of the same pass: at a node of player i, i's value
+    is the maximum over actions for every hand (a hand at a public node is one
+    information set), every other player's value the sum over actions of
+    values already weighted by i's strategy through its reach. The values of
+    the strategy profile itself are computed alongside.
+
+    Strategies are given as an InfoSetTable, e.g. ``solver.infosets`` of any
+    of the solvers, and are matched to the public tree by information set key,
+    so tables learned on the state tree, a compiled tree or the public tree all
+    work. Information sets missing from the table play uniformly.
+    """
+
+    def __init__(self, game, players):
+        tree = game if isinstance(game, PublicGameTree) else compile_public_tree(game, players)
+        self.public_tree = tree
+        self._players = players
+        num_players = len(players)
+
+        parent = np.maximum(tree.parent, 0)
+        self._edge_infoset = tree.infoset[parent].astype(np.int64)
+        self._edge_slot = tree.slot[:, None].astype(np.int64)
+
+        # terminal nodes and their chance weighted utilities, stacked
+        self._terminals = np.nonzero(tree.node_type == TERMINAL)[0]
+        self._terminal_utilities = np.array([tree.utilities[node] * tree.deal_probabilities
+                                             for node in self._terminals])
+
+        # per level: parent and mover of every node, the decision nodes above it with their
+        # movers and the reduceat offsets of their children in the level
+        self._levels = []
+        for depth in range(1, int(tree.depth.max()) + 1):
+            nodes = np.nonzero(tree.depth == depth)[0]
+            start, end = nodes[0], nodes[-1] + 1
+            parents = np.unique(parent[start:end])
+            offsets = tree.child_start[parents] - start
+            mover = tree.player[parent[start:end]].astype(np.int64)
+            self._levels.append((start, end, parent[start:end], np.arange(start, end), mover,
+                                 parents, tree.player[parents].astype(np.int64), offsets))
+
+        self._reach = np.ones((tree.num_nodes, num_players, tree.num_hands))
+        self._best_response = np.zeros((tree.num_nodes, num_players, tree.num_hands))
+        self._policy = np.zeros((tree.num_nodes, num_players, tree.num_hands))
+
+    def strategies(self, infosets):
+        """The average strategies of the InfoSetTable infosets, as a
+        ``(num_infosets, width)`` array indexed by the public tree's ids."""
+        public_infosets = self.public_tree.infosets
+        if infosets is public_infosets:
+            return infosets.average_strategies()
+        legal = public_infosets.legal[:len(public_infosets)]
+        strategies = legal / legal.sum(axis=1, keepdims=True)
+        average = infosets.average_strategies()
+        for public_id, key in enumerate(public_infosets.keys()):
+            if key in infosets:
+                iid = infosets.get_id(key)
+                num_actions = infosets.num_actions[iid]
+                strategies[public_id, :num_actions] = average[iid, :num_actions]
+        return strategies
+
+    def evaluate(self, infosets):
+        """Returns ``(best_response_values, policy_values)``, each a
+        ``(num_players,)`` array of expected utilities at the root."""
+        return self.evaluate_strategies(self.strategies(infosets))
+
+    def evaluate_strategies(self, strategies):
+        """As evaluate, for a strategy array indexed by the public tree's ids."""
+        num_players = len(self._players)
+        edge_prob = strategies[self._edge_infoset, self._edge_slot]
+
+        # push every player's reach over its hands down, one level at a time
+        reach = self._reach
+        for start, end, parents, nodes, mover, _, _, _ in self._levels:
+            reach[start:end] = reach[parents]
+            reach[nodes, mover] *= edge_prob[start:end]
+
+        # terminal values: contract the utilities against the other players' reach
+        best_response, policy = self._best_response, self._policy
+        terminal_reach = reach[self._terminals]
+        for i in range(num_players):
+            values = self._terminal_utilities[:, i]
+            for j in reversed(range(num_players)):
+                if j != i:
+                    shape = [1] * values.ndim
+                    shape[0], shape[j + 1] = -1, terminal_reach.shape[2]
+                    values = (values * terminal_reach[:, j].reshape(shape)).sum(axis=j + 1)
+            best_response[self._terminals, i] = values
+        policy[self._terminals] = best_response[self._terminals]
+
+        # pull values up: the mover maximizes (best response) or plays its strategy (policy)
+        for start, end, _, nodes, mover, parents, parent_mover, offsets in reversed(self._levels):
+            rows = np.arange(len(parents))
+            maximum = np.maximum.reduceat(best_response[start:end], offsets, axis=0)
+            best_response[parents] = np.add.reduceat(best_response[start:end], offsets, axis=0)
+            best_response[parents, parent_mover] = maximum[rows, parent_mover]
+
+            weighted = np.copy(policy[start:end])
+            weighted[nodes - start, mover] *= edge_prob[start:end]
+            policy[parents] = np.add.reduceat(weighted, offsets, axis=0)
+
+        return best_response[0].sum(axis=1), policy[0].sum(axis=1)
+
+    def nash_conv(self, infosets):
+        """Sum over players of how much each could gain by deviating to a best
+        response; zero exactly at a Nash equilibrium."""
+        best_response, policy = self.evaluate(infosets)
+        return float(np.sum(best_response - policy))
+
+    def exploitability(self, infosets):
+        """NashConv averaged over players. For two player zero sum games this is
+        the usual exploitability, the mean of the two best response values."""
+        return self.nash_conv(infosets) / len(self._players)
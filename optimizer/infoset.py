@@ -0,0 +1,170 @@
+import numpy as np
+
+
+class InfoSetTable:
+    """Dense, array-backed storage for per-information-set solver state.
+
+    Every information set is given an integer id the first time it is seen and
+    every legal action at it a slot in ``[0, num_actions)`` (the position of the
+    action in the node's ``actions`` list). Regrets and strategy sums live in
+    contiguous ``(capacity, width)`` float arrays; ``legal`` masks the slots
+    that correspond to real actions, so regret matching over the whole table is
+    a handful of NumPy operations.
+    """
+
+    def __init__(self, capacity=1024, width=2):
+        self._ids = {}
+        self._keys = []
+        self._actions = []
+        self.num_actions = np.zeros(capacity, dtype=np.int32)
+        self.legal = np.zeros((capacity, width), dtype=bool)
+        self.regrets = np.zeros((capacity, width))
+        self.strategy_sum = np.zeros((capacity, width))
+        # regret matching results of cached_strategy, valid while their stamp is the current generation
+        self._strategies = np.zeros((capacity, width))
+        self._strategy_stamps = np.full(capacity, -1, dtype=np.int64)
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    @property
+    def capacity(self):
+        return self.regrets.shape[0]
+
+    @property
+    def width(self):
+        return self.regrets.shape[1]
+
+    def index(self, key, actions):
+        """Returns the id of the information set ``key``, registering it with
+        ``actions`` if it has not been seen before."""
+        iid = self._ids.get(key)
+        if iid is not None:
+            return iid
+        iid = len(self._keys)
+        num_actions = len(actions)
+        if iid >= self.capacity or num_actions > self.width:
+            capacity = 2 * self.capacity if iid >= self.capacity else self.capacity
+            self._grow(capacity, max(self.width, num_actions))
+        self._ids[key] = iid
+        self._keys.append(key)
+        self._actions.append(actions)
+        self.num_actions[iid] = num_actions
+        self.legal[iid, :num_actions] = True
+        return iid
+
+    def empty_like(self):
+        """A table with the same information sets, ids and slots but zeroed
+        regrets and strategy sums."""
+        table = InfoSetTable(capacity=max(len(self), 1), width=self.width)
+        table._ids = dict(self._ids)
+        table._keys = list(self._keys)
+        table._actions = list(self._actions)
+        table.num_actions[:len(self)] = self.num_actions[:len(self)]
+        table.legal[:len(self)] = self.legal[:len(self)]
+        return table
+
+    def get_id(self, key):
+        return self._ids[key]
+
+    def key(self, iid):
+        return self._keys[iid]
+
+    def keys(self):
+        return list(self._keys)
+
+    def actions(self, iid):
+        return self._actions[iid]
+
+    def slot(self, iid, action):
+        return self._actions[iid].index(action)
+
+    def _grow(self, capacity, width):
+        def resized(array):
+            out = np.zeros((capacity, width), dtype=array.dtype)
+            out[:array.shape[0], :array.shape[1]] = array
+            return out
+
+        num_actions = np.zeros(capacity, dtype=np.int32)
+        num_actions[:len(self.num_actions)] = self.num_actions
+        self.num_actions = num_actions
+        self.legal = resized(self.legal)
+        self.regrets = resized(self.regrets)
+        self.strategy_sum = resized(self.strategy_sum)
+        self._strategies = resized(self._strategies)
+        strategy_stamps = np.full(capacity, -1, dtype=np.int64)
+        strategy_stamps[:len(self._strategy_stamps)] = self._strategy_stamps
+        self._strategy_stamps = strategy_stamps
+
+    def current_strategy(self, iid):
+        """Regret matching for a single information set, over its legal slots."""
+        n = self.num_actions[iid]
+        positive = np.maximum(self.regrets[iid, :n], 0.)
+        normalizing_sum = positive.sum()
+        if normalizing_sum > 0:
+            return positive / normalizing_sum
+        return np.full(n, 1. / n)
+
+    def cached_strategy(self, iid):
+        """As current_strategy, but computed at most once until the next
+        invalidate_strategies call. The returned row must not be modified."""
+        if self._strategy_stamps[iid] != self._generation:
+            n = self.num_actions[iid]
+            self._strategies[iid, :n] = self.current_strategy(iid)
+            self._strategy_stamps[iid] = self._generation
+        return self._strategies[iid, :self.num_actions[iid]]
+
+    def invalidate_strategies(self):
+        """Drops the strategies cached by cached_strategy, e.g. after the regrets changed."""
+        self._generation += 1
+
+    def current_strategies(self, ids=None):
+        """Regret matching for every registered information set at once, or for
+        the information sets in ``ids``.
+
+        Returns a ``(len(self), width)`` array that is zero on illegal slots."""
+        rows = slice(len(self)) if ids is None else ids
+        return _normalize_rows(np.maximum(self.regrets[rows], 0.), self.legal[rows])
+
+    def average_strategy(self, iid):
+        n = self.num_actions[iid]
+        sigma = self.strategy_sum[iid, :n]
+        normalizing_sum = sigma.sum()
+        if normalizing_sum > 0:
+            return sigma / normalizing_sum
+        return np.full(n, 1. / n)
+
+    def average_strategies(self, ids=None):
+        """Normalized strategy sums for every information set (or those in
+        ``ids``), uniform where an information set has not accumulated any
+        strategy weight yet."""
+        rows = slice(len(self)) if ids is None else ids
+        return _normalize_rows(self.strategy_sum[rows], self.legal[rows])
+
+    def as_dict(self, strategies):
+        """Converts a ``(len(self), width)`` strategy array into the nested
+        ``{info_set: {action: probability}}`` form, for inspection."""
+        return {
+            key: {action: strategies[iid, slot] for slot, action in enumerate(self._actions[iid])}
+            for iid, key in enumerate(self._keys)
+        }
+
+    def nbytes(self):
+        return (self.num_actions.nbytes + self.legal.nbytes + self.regrets.nbytes + self.strategy_sum.nbytes
+                + self._strategies.nbytes + self._strategy_stamps.nbytes)
+
+    def used_nbytes(self):
+        """As nbytes, but only for the rows of registered information sets, not the spare capacity."""
+        rows = len(self)
+        return sum(array[:rows].nbytes for array in (self.num_actions, self.legal, self.regrets, self.strategy_sum,
+                                                     self._strategies, self._strategy_stamps))
+
+
+def _normalize_rows(weights, legal):
+    totals = weights.sum(axis=1, keepdims=True)
+    uniform = legal / np.maximum(legal.sum(axis=1, keepdims=True), 1)
+    return np.where(totals > 0, weights / np.where(totals > 0, totals, 1.), uniform)
@@ -0,0 +1,294 @@
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+
+from optimizer.compiled import TERMINAL, CHANCE, DECISION
+
+_NODE_TYPES = {TERMINAL: 'terminal', CHANCE: 'chance', DECISION: 'decision'}
+
+# solver traversal -> position of its game state argument
+_STATE_TRAVERSALS = {
+    '_cfr_traverse_recursive': 0,
+    '_perspective_cfr_utility_recursive': 2,
+    '_outcome_sampling_recursive': 1,
+}
+# solver traversal -> position of its node id argument, a node of solver.tree
+_COMPILED_TRAVERSALS = {
+    '_cfr_traverse_compiled': 0,
+    '_perspective_cfr_utility_compiled': 1,
+    '_outcome_sampling_compiled': 1,
+}
+
+# method -> timed phase, of the solver, its InfoSetTable, its Sampler and the game states
+_SOLVER_PHASES = {
+    '_info_set_id': 'infoset_key',
+    '_add_regrets': 'regrets',
+    '_defer_regrets': 'regrets',
+    '_apply_regret_deltas': 'regrets',
+    '_cumulate_sigma': 'regrets',
+}
+_INFOSET_PHASES = {'current_strategy': 'strategy', 'cached_strategy': 'strategy', 'current_strategies': 'strategy'}
+_SAMPLER_PHASES = {'sample': 'sampling', 'sample_alias': 'sampling'}
+# game modules list their state classes in STATE_CLASSES
+_STATE_PHASES = {
+    '_create_children': 'children',
+    '_create_child': 'children',
+    'evaluation': 'evaluation',
+    'sample_outcome': 'sampling',
+}
+
+
+class Profiler:
+    """Opt-in counters and phase timers for one CFR solver.
+
+    While started, the profiler wraps the solver's traversals and hot methods
+    (and those of its InfoSetTable, Sampler, compiled tree and the game state
+    classes of the game it runs on) to count:
+
+    * ``nodes``: nodes visited, by 'terminal', 'chance' and 'decision'. The
+      vector form solver visits one node per betting sequence, the vectorized
+      solver every node of its tree each iteration
+    * ``counts['states_created']``: game states built, i.e. children created
+    * ``counts['strategy_lookups']`` and ``infosets_touched``: current
+      strategies looked up and the distinct information sets among them
+    * ``counts['regret_updates']``: information set rows whose regrets were
+      updated
+
+    ``seconds`` and ``calls`` time the phases 'children', 'infoset_key',
+    'strategy', 'sampling', 'evaluation' and 'regrets' (outermost calls only,
+    so a phase calling itself is not counted twice). ``iterations`` holds the
+    time and nodes of every iteration run() completes. With trace_memory,
+    tracemalloc traces allocations for memory_breakdown().
+
+    Stopping restores every wrapped method, so a solver that is not profiled
+    runs exactly the code it runs without this module. Profiled timings include
+    the wrappers' own cost; compare them with each other, not with unprofiled
+    runs. Work done in worker processes of the parallel modes is not seen::
+
+        with Profiler(cfr) as profile:
+            cfr.run(iterations=10)
+        print(profile.report())
+    """
+
+    def __init__(self, solver, trace_memory=False):
+        self.solver = solver
+        self.trace_memory = trace_memory
+        self.nodes = Counter()
+        self.counts = Counter()
+        self.seconds = Counter()
+        self.calls = Counter()
+        self.iterations = []
+        self._touched = set()
+        self._active = set()
+        # (object, name, whether the object held the attribute itself, its value) of every wrapped method
+        self._patches = []
+        self._snapshot = None
+        self._started_tracing = False
+        # time and number of nodes visited at the end of the last iteration
+        self._last_time = None
+        self._last_nodes = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def infosets_touched(self):
+        return len(self._touched)
+
+    def start(self):
+        solver = self.solver
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._snapshot = None
+
+        for name, position in _STATE_TRAVERSALS.items():
+            if hasattr(solver, name):
+                self._patch(solver, name, lambda function, position=position: self._counted_states(function, position))
+        if solver.tree is not None:
+            for name, position in _COMPILED_TRAVERSALS.items():
+                if hasattr(solver, name):
+                    self._patch(solver, name, lambda function, position=position: self._counted_nodes(function, position))
+            self._patch(solver.tree, 'sample_child', lambda function: self._timed('sampling', function))
+        if hasattr(solver, '_vector_cfr_recursive'):
+            self._patch(solver, '_vector_cfr_recursive', self._counted_public_nodes)
+        if hasattr(solver, '_iteration'):
+            self._patch(solver, '_iteration', self._counted_iteration)
+
+        for name, phase in _SOLVER_PHASES.items():
+            self._patch(solver, name, lambda function, phase=phase: self._timed(phase, function))
+        for name in ('_add_regrets', '_defer_regrets'):
+            self._patch(solver, name, lambda function: self._counted('regret_updates', function))
+        for name, phase in _INFOSET_PHASES.items():
+            self._patch(solver.infosets, name, lambda function, phase=phase: self._timed(phase, function))
+        for name in ('current_strategy', 'cached_strategy'):
+            self._patch(solver.infosets, name, self._counted_lookup)
+        self._patch(solver.infosets, 'current_strategies', self._counted_lookups)
+        for name, phase in _SAMPLER_PHASES.items():
+            self._patch(solver.sampler, name, lambda function, phase=phase: self._timed(phase, function))
+
+        for cls in self._state_classes():
+            for name, phase in _STATE_PHASES.items():
+                if name in vars(cls):
+                    self._patch(cls, name, lambda function, phase=phase: self._timed(phase, function))
+            self._patch(cls, '__init__', lambda function: self._counted('states_created', function))
+
+        self._last_time, self._last_nodes = time.perf_counter(), 0
+        solver.add_iteration_callback(self._record_iteration)
+
+    def stop(self):
+        self.solver.remove_iteration_callback(self._record_iteration)
+        for owner, name, owned, value in reversed(self._patches):
+            if owned:
+                setattr(owner, name, value)
+            else:
+                delattr(owner, name)
+        self._patches = []
+        if tracemalloc.is_tracing():
+            self._snapshot = tracemalloc.take_snapshot()
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def _state_classes(self):
+        # the state classes of the game module the solver's root comes from, if any
+        module = sys.modules.get(type(self.solver.root).__module__)
+        return getattr(module, 'STATE_CLASSES', ())
+
+    def _patch(self, owner, name, wrap):
+        owned = name in vars(owner)
+        value = vars(owner)[name] if owned else None
+        self._patches.append((owner, name, owned, value))
+        setattr(owner, name, wrap(getattr(owner, name) if not isinstance(owner, type) else vars(owner)[name]))
+
+    def _timed(self, phase, function):
+        seconds, calls, active = self.seconds, self.calls, self._active
+
+        def timed(*args, **kwargs):
+            if phase in active:
+                return function(*args, **kwargs)
+            active.add(phase)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds[phase] += time.perf_counter() - start
+                calls[phase] += 1
+                active.discard(phase)
+        return timed
+
+    def _counted(self, name, function):
+        counts = self.counts
+
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return function(*args, **kwargs)
+        return counted
+
+    def _counted_lookup(self, function):
+        counts, touched, active = self.counts, self._touched, self._active
+
+        def counted(iid):
+            # cached_strategy looks up current_strategy on a miss, count it once
+            if 'strategy' not in active:
+                counts['strategy_lookups'] += 1
+                touched.add(iid)
+            return function(iid)
+        return counted
+
+    def _counted_lookups(self, function):
+        counts, touched, infosets = self.counts, self._touched, self.solver.infosets
+
+        def counted(ids=None):
+            rows = range(len(infosets)) if ids is None else np.ravel(ids).tolist()
+            counts['strategy_lookups'] += len(rows)
+            touched.update(rows)
+            return function(ids)
+        return counted
+
+    def _counted_states(self, function, position):
+        nodes = self.nodes
+
+        def counted(*args):
+            state = args[position]
+            nodes['terminal' if state.is_terminal() else 'chance' if state.is_chance() else 'decision'] += 1
+            return function(*args)
+        return counted
+
+    def _counted_nodes(self, function, position):
+        nodes, node_type = self.nodes, self.solver.tree.node_type
+
+        def counted(*args):
+            nodes[_NODE_TYPES[node_type[args[position]]]] += 1
+            return function(*args)
+        return counted
+
+    def _counted_public_nodes(self, function):
+        nodes, counts, tree = self.nodes, self.counts, self.solver.public_tree
+
+        def counted(node, reaches, average=False):
+            node_type = tree.node_type[node]
+            nodes[_NODE_TYPES[node_type]] += 1
+            if node_type == DECISION and not average:
+                counts['regret_updates'] += len(tree.infoset[node])
+            return function(node, reaches, average)
+        return counted
+
+    def _counted_iteration(self, function):
+        nodes, counts, infosets = self.nodes, self.counts, self.solver.infosets
+        tree_nodes = np.bincount(self.solver.tree.node_type, minlength=len(_NODE_TYPES))
+
+        def counted():
+            for node_type, name in _NODE_TYPES.items():
+                nodes[name] += int(tree_nodes[node_type])
+            counts['regret_updates'] += len(infosets)
+            return function()
+        return counted
+
+    def _record_iteration(self, solver):
+        now, visited = time.perf_counter(), sum(self.nodes.values())
+        self.iterations.append({'iteration': solver.iteration, 'seconds': now - self._last_time,
+                                'nodes': visited - self._last_nodes})
+        self._last_time, self._last_nodes = now, visited
+
+    def memory_breakdown(self, limit=10):
+        """Sizes of the solver's tables and, with trace_memory, the bytes still
+        allocated at stop() (or now, while running) by each source file since
+        tracing started, largest first. Allocations are attributed to the line
+        that made them, so game states show up under their game module, the
+        information set table under optimizer/infoset.py."""
+        breakdown = {'infosets': self.solver.infosets.nbytes()}
+        if self.solver.tree is not None:
+            breakdown['tree'] = self.solver.tree.nbytes()
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else self._snapshot
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                               tracemalloc.Filter(False, __file__),
+                                               tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')])
+            breakdown['allocated'] = {os.path.join(*stat.traceback[0].filename.split(os.sep)[-2:]): stat.size
+                                      for stat in snapshot.statistics('filename')[:limit]}
+        return breakdown
+
+    def report(self):
+        """Everything measured so far as a dict of plain values."""
+        report = {
+            'nodes': dict(self.nodes),
+            'states_created': self.counts['states_created'],
+            'strategy_lookups': self.counts['strategy_lookups'],
+            'infosets_touched': self.infosets_touched,
+            'regret_updates': self.counts['regret_updates'],
+            'seconds': dict(self.seconds),
+            'calls': dict(self.calls),
+            'iterations': list(self.iterations),
+        }
+        if self.trace_memory:
+            report['memory'] = self.memory_breakdown()
+        return report
@@ -0,0 +1,251 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import random
+import time
+import weakref
+
+import numpy as np
+
+from optimizer.compiled import CHANCE
+from optimizer.sampling import Sampler
+
+# per worker process state, set up once by the pool initializer
+_worker = {}
+
+
+def chance_shards(tree):
+    """Decision or terminal nodes below the chance layers at the root of a
+    CompiledGameTree, with the product of the chance probabilities leading to
+    them. For Kuhn these are the deals, for Liar's dice the joint rolls."""
+    shards, weights = [], []
+    stack = [(0, 1.)]
+    while stack:
+        node, weight = stack.pop()
+        if tree.node_type[node] == CHANCE:
+            stack.extend((child, weight * tree.chance_prob[child]) for child in reversed(tree.children(node)))
+        else:
+            shards.append(node)
+            weights.append(weight)
+    return np.array(shards), np.array(weights)
+
+
+def _touched_rows(table, num_infosets):
+    changed = np.any(table.regrets[:num_infosets] != 0, axis=1) | np.any(table.strategy_sum[:num_infosets] != 0, axis=1)
+    rows = np.nonzero(changed)[0]
+    return rows, table.regrets[rows], table.strategy_sum[rows]
+
+
+def _init_sharded_worker(tree, players):
+    from optimizer.cfr import VanillaCFR
+    cfr = VanillaCFR(tree, players)
+    cfr._pending = cfr.infosets.empty_like()
+    _worker['cfr'] = cfr
+
+
+def _run_shards(task):
+    """Traverses the given root chance outcomes with the master's regrets frozen
+    and returns the touched rows of the regret and strategy sum deltas."""
+    nodes, weights, regrets = task
+    cfr = _worker['cfr']
+    num_infosets = len(cfr.infosets)
+    cfr.infosets.regrets[:num_infosets] = regrets
+    cfr.infosets.invalidate_strategies()
+    cfr._pending.regrets[:num_infosets] = 0.
+    cfr._pending.strategy_sum[:num_infosets] = 0.
+
+    utilities = np.zeros(len(cfr._players))
+    for node, weight in zip(nodes, weights):
+        utilities += weight * cfr._cfr_utility_compiled(node, np.ones(len(cfr._players)))
+    return utilities, _touched_rows(cfr._pending, num_infosets)
+
+
+class ShardedCFRPool:
+    """Runs full-width CFR iterations over a process pool.
+
+    The subtrees below the root chance outcomes are independent during an
+    iteration, so they are split into one group per process. Every worker
+    traverses its group against the regrets of the iteration start and returns
+    regret and strategy sum deltas, which are added to the master table once
+    all workers are done. Every information set therefore plays one strategy
+    per iteration, as in VectorizedCFR.
+    """
+
+    def __init__(self, tree, players, processes):
+        self._players = players
+        shards, weights = chance_shards(tree)
+        groups = np.array_split(np.arange(len(shards)), min(processes, len(shards)))
+        self._groups = [(shards[group], weights[group]) for group in groups]
+        self._pool = multiprocessing.Pool(processes, initializer=_init_sharded_worker, initargs=(tree, players))
+        # stops the workers even if close is never called
+        self._finalizer = weakref.finalize(self, _stop_pool, self._pool)
+
+    def iteration(self, infosets):
+        num_infosets = len(infosets)
+        regrets = infosets.regrets[:num_infosets]
+        results = self._pool.map(_run_shards, [(nodes, weights, regrets) for nodes, weights in self._groups])
+
+        utilities = np.zeros(len(self._players))
+        for group_utilities, (rows, regret_deltas, sigma_deltas) in results:
+            utilities += group_utilities
+            infosets.regrets[rows] += regret_deltas
+            infosets.strategy_sum[rows] += sigma_deltas
+        return utilities
+
+    def close(self):
+        self._finalizer.detach()
+        self._pool.close()
+        self._pool.join()
+
+
+def _stop_pool(pool):
+    pool.terminate()
+    pool.join()
+
+
+def _release_shared(pool, memory):
+    _stop_pool(pool)
+    for segment in memory:
+        segment.unlink()
+        try:
+            segment.close()
+        except BufferError:
+            # arrays still view the segment, its mapping goes away with them
+            pass
+
+
+def _init_sampling_worker(solver_class, tree, players, regrets_memory, sigma_memory, lock, barrier, sync_every):
+    cfr = solver_class(tree, players)
+    shape = (len(cfr.infosets), cfr.infosets.width)
+    shared_regrets = np.ndarray(shape, buffer=regrets_memory.buf)
+    shared_sigma = np.ndarray(shape, buffer=sigma_memory.buf)
+    if sync_every is None:
+        # hogwild: every worker updates the shared tables in place, without locks
+        cfr.infosets.regrets = shared_regrets
+        cfr.infosets.strategy_sum = shared_sigma
+    _worker.update(cfr=cfr, shared=(shared_regrets, shared_sigma), memory=(regrets_memory, sigma_memory),
+                   lock=lock, barrier=barrier, sync_every=sync_every)
+
+
+def _sync_sampling_worker(snapshot):
+    """Adds the updates made since the last sync to the shared tables and
+    continues from their merged state."""
+    cfr, (shared_regrets, shared_sigma), lock = _worker['cfr'], _worker['shared'], _worker['lock']
+    snapshot_regrets, snapshot_sigma = snapshot
+    with lock:
+        shared_regrets += cfr.infosets.regrets - snapshot_regrets
+        shared_sigma += cfr.infosets.strategy_sum - snapshot_sigma
+        cfr.infosets.regrets[:] = shared_regrets
+        cfr.infosets.strategy_sum[:] = shared_sigma
+    return np.copy(cfr.infosets.regrets), np.copy(cfr.infosets.strategy_sum)
+
+
+def _run_sampled_iterations(task):
+    iterations, first_iteration, seed_sequence = task
+    cfr, sync_every = _worker['cfr'], _worker['sync_every']
+    # iteration weighted solvers see the iteration numbers of the whole run
+    cfr.iteration = first_iteration
+    # every task gets its own stream, reproducible from the pool's seed
+    seed = int(seed_sequence.generate_state(1)[0])
+    np.random.seed(seed)
+    random.seed(seed)
+    cfr.sampler = Sampler(seed_sequence.spawn(1)[0])
+
+    utilities = np.zeros(len(cfr._players))
+    if sync_every is None:
+        _worker['barrier'].wait()
+        for _ in range(iterations):
+            utilities += _as_utilities(cfr.run(iterations=1), len(cfr._players))
+        return utilities
+
+    shared_regrets, shared_sigma = _worker['shared']
+    cfr.infosets.regrets[:] = shared_regrets
+    cfr.infosets.strategy_sum[:] = shared_sigma
+    snapshot = np.copy(cfr.infosets.regrets), np.copy(cfr.infosets.strategy_sum)
+    # every task runs in its own worker and starts from the same shared state
+    _worker['barrier'].wait()
+    for i in range(iterations):
+        utilities += _as_utilities(cfr.run(iterations=1), len(cfr._players))
+        if (i + 1) % sync_every == 0 or i + 1 == iterations:
+            snapshot = _sync_sampling_worker(snapshot)
+    return utilities
+
+
+def _as_utilities(result, num_players):
+    return np.zeros(num_players) if result is None else result
+
+
+class SharedSamplingPool:
+    """Runs sampled CFR iterations in several processes at the same time.
+
+    Regrets and strategy sums live in shared memory. Without sync_every the
+    workers update them in place with no locking at all, Hogwild style: a
+    sampled iteration touches few information sets, so lost updates are rare
+    and only add noise. With sync_every=k every worker runs k iterations on a
+    private copy and then adds its deltas to the shared tables under one lock.
+    The solver's own table is backed by the same shared memory, so it sees the
+    merged state once run returns.
+
+    Every run gives each worker its own stream, spawned from seed (an int or
+    a SeedSequence, by default drawn from np.random like an unseeded Sampler).
+    With sync_every at least the iterations of a worker, workers only merge
+    at the end of a run, and seeded runs give the same tables up to the order
+    of the final additions.
+
+    The workers and the shared memory are released by close, or when the pool
+    is garbage collected or the interpreter exits without it.
+    """
+
+    def __init__(self, solver_class, tree, players, infosets, processes, sync_every=None, seed=None):
+        shape = (len(infosets), infosets.width)
+        nbytes = max(int(np.prod(shape)) * np.dtype(np.float64).itemsize, 1)
+        self._memory = [shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(2)]
+        shared_regrets, shared_sigma = [np.ndarray(shape, buffer=memory.buf) for memory in self._memory]
+        shared_regrets[:] = infosets.regrets[:shape[0]]
+        shared_sigma[:] = infosets.strategy_sum[:shape[0]]
+        infosets.regrets, infosets.strategy_sum = shared_regrets, shared_sigma
+        self._infosets = infosets
+
+        self._processes = processes
+        if seed is None:
+            seed = np.random.randint(2 ** 32, size=4, dtype=np.uint64)
+        self._seeds = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self._pool = multiprocessing.Pool(
+            processes, initializer=_init_sampling_worker,
+            initargs=(solver_class, tree, players, self._memory[0], self._memory[1], multiprocessing.Lock(),
+                      multiprocessing.Barrier(processes), sync_every))
+        self._finalizer = weakref.finalize(self, _release_shared, self._pool, self._memory)
+
+    def run(self, iterations, first_iteration=0):
+        """Runs iterations split evenly over the workers, numbered from
+        first_iteration + 1 in the order of the split."""
+        seeds = self._seeds.spawn(self._processes)
+        shares = np.array_split(np.arange(first_iteration, first_iteration + iterations), self._processes)
+        tasks = [(len(share), int(share[0]) if len(share) else first_iteration, seed) for share, seed in zip(shares, seeds)]
+        # one task per worker, see the barrier in _run_sampled_iterations
+        return sum(self._pool.map(_run_sampled_iterations, tasks, chunksize=1))
+
+    def close(self):
+        """Stops the workers and moves the solver's table back to private memory."""
+        self._finalizer.detach()
+        self._pool.close()
+        self._pool.join()
+        infosets = self._infosets
+        infosets.regrets = np.copy(infosets.regrets)
+        infosets.strategy_sum = np.copy(infosets.strategy_sum)
+        for memory in self._memory:
+            memory.close()
+            memory.unlink()
+
+
+def measure_throughput(solver_class, tree, players, worker_counts=(1, 2, 4), iterations=1000, sync_every=None):
+    """Sampled iterations per second of solver_class on a compiled tree, for each
+    number of worker processes. Returns one dict per worker count."""
+    report = []
+    for workers in worker_counts:
+        with solver_class(tree, players, processes=workers, sync_every=sync_every) as cfr:
+            start = time.perf_counter()
+            cfr.run(iterations=iterations)
+            elapsed = time.perf_counter() - start
+        report.append({'workers': workers, 'iterations': iterations, 'seconds': elapsed,
+                       'iterations_per_sec': iterations / elapsed})
+    return report
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+
+import numpy as np
+
+MAGIC = b'CFRPOLICY\x00\x01'
+ALIGNMENT = 16
+DTYPES = ('float32', 'float16', 'uint8')
+
+
+def key_hash(key):
+    """64 bit hash of an information set key: an integer (Kuhn and Liar's
+    dice), a tuple of numbers (Liar's dice features) or a string, e.g. the
+    "." of chance nodes. Numbers are hashed by value, so the hash is the same
+    across Python and NumPy versions."""
+    if isinstance(key, str):
+        data = b's' + key.encode('utf-8')
+    elif isinstance(key, (int, np.integer)):
+        data = b'i' + int(key).to_bytes(16, 'little', signed=True)
+    else:
+        data = b'f' + np.asarray(key, dtype='<f8').tobytes()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def export_policy(path, infosets, strategies=None, dtype='float32', min_probability=0.):
+    """Writes a policy file for the information sets of an InfoSetTable.
+
+    strategies defaults to the table's average strategy. Probabilities are
+    stored as float32, float16 or uint8 (multiples of 1/255, renormalized when
+    read); actions below min_probability are left out, except for the most
+    likely action of each information set, and the rest renormalized. Returns
+    the size of the file in bytes.
+    """
+    if dtype not in DTYPES:
+        raise ValueError("dtype must be one of {}".format(', '.join(DTYPES)))
+    num_infosets = len(infosets)
+    strategies = infosets.average_strategies() if strategies is None else strategies[:num_infosets]
+
+    # drop unlikely actions and renormalize, always keeping each row's most likely action
+    kept = infosets.legal[:num_infosets] & (strategies >= min_probability)
+    kept[np.arange(num_infosets), np.argmax(strategies, axis=1)] = True
+    probabilities = np.where(kept, strategies, 0.)
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    if dtype == 'uint8':
+        probabilities = np.round(probabilities * 255)
+
+    # the action vocabulary, shared by all information sets with the same action list
+    vocabulary, vocabulary_ids, action_ids = [], {}, {}
+    slot_actions = np.zeros(kept.shape, dtype=np.uint16)
+    for iid in range(num_infosets):
+        actions = infosets.actions(iid)
+        if id(actions) not in action_ids:
+            for action in actions:
+                if repr(action) not in vocabulary_ids:
+                    vocabulary_ids[repr(action)] = len(vocabulary)
+                    vocabulary.append(action)
+            action_ids[id(actions)] = [vocabulary_ids[repr(action)] for action in actions]
+        ids = action_ids[id(actions)]
+        slot_actions[iid, :len(ids)] = ids
+
+    hashes = np.array([key_hash(key) for key in infosets.keys()], dtype=np.uint64)
+    order = np.argsort(hashes, kind='stable')
+    if np.any(hashes[order][1:] == hashes[order][:-1]):
+        raise ValueError("information set keys collide in the 64 bit index")
+    kept, probabilities, slot_actions = kept[order], probabilities[order], slot_actions[order]
+
+    offsets = np.zeros(num_infosets + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum(kept.sum(axis=1))
+    sections = [
+        ('hashes', hashes[order]),
+        ('offsets', offsets.astype(np.uint32) if offsets[-1] < 2 ** 32 else offsets),
+        ('actions', slot_actions[kept].astype(np.uint8) if len(vocabulary) <= 256 else slot_actions[kept]),
+        ('probabilities', probabilities[kept].astype(dtype)),
+        ('vocabulary', np.frombuffer(pickle.dumps(vocabulary, pickle.HIGHEST_PROTOCOL), dtype=np.uint8)),
+    ]
+    return _write_sections(path, sections, {'num_infosets': num_infosets, 'dtype': dtype})
+
+
+def _write_sections(path, sections, header):
+    header = dict(header, sections={})
+    position = 0
+    for name, array in sections:
+        header['sections'][name] = [position, array.dtype.str, len(array)]
+        position += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    encoded = json.dumps(header).encode('utf-8')
+    start = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGNMENT) * ALIGNMENT
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(encoded)) + encoded)
+        for name, array in sections:
+            f.seek(start + header['sections'][name][0])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(start + position)
+    os.replace(temporary, path)
+    return start + position
+
+
+class PolicyFile:
+    """Read only view of a policy file written by export_policy.
+
+    The index, offsets and probabilities are memory mapped, so opening a file
+    only reads its header and action vocabulary; a lookup hashes the key,
+    binary searches the sorted hash index and decodes one row.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a policy file".format(path))
+            length, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(length).decode('utf-8'))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = -(-(len(MAGIC) + 8 + length) // ALIGNMENT) * ALIGNMENT
+
+        # plain arrays over the mapping, slicing them is much cheaper than slicing np.memmap
+        sections = {name: np.frombuffer(self._mmap, dtype=dtype, count=count, offset=start + offset)
+                    for name, (offset, dtype, count) in header['sections'].items()}
+        self.dtype = header['dtype']
+        self._hashes = sections['hashes']
+        self._offsets = sections['offsets']
+        self._actions = sections['actions']
+        self._probabilities = sections['probabilities']
+        self._vocabulary = pickle.loads(sections['vocabulary'].tobytes())
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, key):
+        return self._row(key) >= 0
+
+    def _row(self, key):
+        hashed = key_hash(key)
+        row = int(self._hashes.searchsorted(np.uint64(hashed)))
+        if row < len(self._hashes) and int(self._hashes[row]) == hashed:
+            return row
+        return -1
+
+    def policy(self, key):
+        """The stored action distribution of information set key, as
+        {action: probability}. Raises KeyError for unknown keys."""
+        row = self._row(key)
+        if row < 0:
+            raise KeyError(key)
+        return self._decode(row)
+
+    def get(self, key, default=None):
+        row = self._row(key)
+        return self._decode(row) if row >= 0 else default
+
+    def _decode(self, row):
+        start, end = self._offsets[row:row + 2].tolist()
+        probabilities = self._probabilities[start:end].tolist()
+        total = sum(probabilities) if self.dtype != 'float32' else 1.
+        return {self._vocabulary[action]: probability / total
+                for action, probability in zip(self._actions[start:end].tolist(), probabilities)}
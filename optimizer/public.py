@@ -0,0 +1,112 @@
+from collections import deque
+
+import numpy as np
+
+from optimizer.compiled import TERMINAL, DECISION
+from optimizer.infoset import InfoSetTable
+
+
+class PublicGameTree:
+    """The betting (public) tree of a game, shared by all private hands.
+
+    Nodes are numbered breadth first like a CompiledGameTree, but there is one
+    node per betting sequence instead of one per deal and betting sequence. Per
+    node ``infoset`` holds one information set id per private hand of the
+    player to move, ``(num_nodes, num_hands)``, and terminal nodes keep their
+    ``utilities`` for every combination of private hands. The chance
+    distribution over hand combinations is ``deal_probabilities``.
+    """
+
+    def __init__(self, node_type, player, infoset, parent, slot, depth, child_start, child_count,
+                 utilities, deal_probabilities, infosets):
+        self.node_type = node_type
+        self.player = player
+        self.infoset = infoset
+        self.parent = parent
+        self.slot = slot
+        self.depth = depth
+        self.child_start = child_start
+        self.child_count = child_count
+        # node id -> (num_players,) + (num_hands,) * num_players terminal utilities
+        self.utilities = utilities
+        self.deal_probabilities = deal_probabilities
+        self.infosets = infosets
+
+    @property
+    def num_nodes(self):
+        return len(self.node_type)
+
+    @property
+    def num_players(self):
+        return self.deal_probabilities.ndim
+
+    @property
+    def num_hands(self):
+        return self.deal_probabilities.shape[0]
+
+    def children(self, node):
+        start = self.child_start[node]
+        return range(start, start + self.child_count[node])
+
+
+def compile_public_tree(game, players, infosets=None):
+    """Builds the PublicGameTree of a game implementing the public tree interface
+    (private_hands, deal_probabilities, create_public_root, information_set and
+    terminal_utilities, see KuhnGame and LDGame)."""
+    infosets = infosets if infosets is not None else InfoSetTable()
+    num_hands = len(game.private_hands())
+
+    node_type, player, infoset, parent, slot, depth = [], [], [], [], [], []
+    child_start, child_count, utilities = [], [], {}
+
+    queue = deque([(game.create_public_root(), -1, 0, 0)])
+    next_id = 1
+    while queue:
+        state, parent_id, node_slot, node_depth = queue.popleft()
+        node_id = len(node_type)
+        parent.append(parent_id)
+        slot.append(node_slot)
+        depth.append(node_depth)
+
+        if state.is_terminal():
+            node_type.append(TERMINAL)
+            player.append(-1)
+            infoset.append(np.full(num_hands, -1))
+            utilities[node_id] = game.terminal_utilities(state)
+            children = []
+        else:
+            player_index = state.get_player_to_move().get_index()
+            node_type.append(DECISION)
+            player.append(player_index)
+            infoset.append(np.array([infosets.index(game.information_set(state, player_index, hand), state.actions)
+                                     for hand in range(num_hands)]))
+            children = [state.play(action) for action in state.actions]
+
+        child_start.append(next_id)
+        child_count.append(len(children))
+        for child_slot, child in enumerate(children):
+            queue.append((child, node_id, child_slot, node_depth + 1))
+        next_id += len(children)
+
+    return PublicGameTree(
+        node_type=np.array(node_type, dtype=np.int8),
+        player=np.array(player, dtype=np.int16),
+        infoset=np.array(infoset, dtype=np.int32).reshape(-1, num_hands),
+        parent=np.array(parent, dtype=np.int32),
+        slot=np.array(slot, dtype=np.int16),
+        depth=np.array(depth, dtype=np.int16),
+        child_start=np.array(child_start, dtype=np.int32),
+        child_count=np.array(child_count, dtype=np.int32),
+        utilities=utilities,
+        deal_probabilities=game.deal_probabilities(),
+        infosets=infosets,
+    )
+
+
+def contract_reaches(tensor, reaches, skip):
+    """Sums tensor, with one axis per player, against every player's reach vector
+    except player skip's; the result is indexed by player skip's hands."""
+    for j in reversed(range(len(reaches))):
+        if j != skip:
+            tensor = np.tensordot(tensor, reaches[j], axes=([j], [0]))
+    return tensor
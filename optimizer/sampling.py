@@ -0,0 +1,109 @@
+import numpy as np
+
+# above this many actions a cumulative sum search beats scanning the probabilities in Python
+_SCAN_LIMIT = 32
+
+
+class AliasTable:
+    """Walker's alias table of a fixed distribution: after O(n) setup every
+    sample costs one uniform and one comparison, whatever the size of the
+    distribution. Worth it for distributions sampled many times, like the
+    chance nodes of a compiled tree."""
+
+    def __init__(self, probabilities):
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        n = len(probabilities)
+        scaled = probabilities * (n / probabilities.sum())
+        threshold = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.]
+        large = [i for i in range(n) if scaled[i] >= 1.]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            threshold[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1. - scaled[less]
+            (small if scaled[more] < 1. else large).append(more)
+        # whatever is left is 1 up to rounding
+        self.size = n
+        self.threshold = threshold.tolist()
+        self.alias = alias.tolist()
+
+    def sample(self, uniform):
+        scaled = uniform * self.size
+        i = int(scaled)
+        return i if scaled - i < self.threshold[i] else self.alias[i]
+
+
+class Sampler:
+    """Samples actions and outcomes from a numpy Generator.
+
+    Uniforms are drawn in blocks of block_size and handed out one at a time,
+    so a sample costs a list lookup instead of a call into numpy. Without a
+    seed the generator is seeded from the global ``np.random`` state, so
+    ``np.random.seed`` keeps runs reproducible as before. ``spawn`` gives
+    independent streams, e.g. one per worker process.
+    """
+
+    def __init__(self, seed=None, block_size=4096):
+        if seed is None:
+            seed = np.random.randint(2 ** 32, size=4, dtype=np.uint64)
+        self._seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self._generator = np.random.Generator(np.random.PCG64(self._seed_sequence))
+        self.block_size = block_size
+        self._block = []
+        self._position = 0
+
+    @property
+    def seed_sequence(self):
+        """The SeedSequence of this sampler's stream, to derive other reproducible streams from."""
+        return self._seed_sequence
+
+    def spawn(self, n):
+        """n samplers with independent streams, reproducible from this sampler's seed."""
+        return [Sampler(child, self.block_size) for child in self._seed_sequence.spawn(n)]
+
+    def _refill(self):
+        self._block = self._generator.random(self.block_size).tolist()
+        self._position = 0
+
+    def uniform(self):
+        """A uniform float in [0, 1)."""
+        if self._position == len(self._block):
+            self._refill()
+        self._position += 1
+        return self._block[self._position - 1]
+
+    def random(self, size):
+        """An array of size uniforms, drawn straight from the generator."""
+        return self._generator.random(size)
+
+    def sample(self, probabilities):
+        """Index drawn from probabilities, an array summing to 1 (e.g. a strategy row)."""
+        if self._position == len(self._block):
+            self._refill()
+        u = self._block[self._position]
+        self._position += 1
+        if len(probabilities) > _SCAN_LIMIT:
+            cumulative = np.cumsum(probabilities)
+            return min(int(cumulative.searchsorted(u * cumulative[-1], 'right')), len(probabilities) - 1)
+        probabilities = probabilities.tolist()
+        for i, probability in enumerate(probabilities):
+            u -= probability
+            if u < 0.:
+                return i
+        # rounding left u just above the total, take the last possible outcome
+        return max(i for i, probability in enumerate(probabilities) if probability > 0.)
+
+    def sample_alias(self, table):
+        """Index drawn from the distribution of an AliasTable."""
+        return table.sample(self.uniform())
+
+    def getstate(self):
+        return self._generator.bit_generator.state, list(self._block), self._position
+
+    def setstate(self, state):
+        generator_state, block, position = state
+        self._generator.bit_generator.state = generator_state
+        self._block = list(block)
+        self._position = position
@@ -0,0 +1,118 @@
+from collections import namedtuple
+from statistics import NormalDist
+
+import numpy as np
+
+from optimizer.compiled import CompiledGameTree, DECISION, TERMINAL, compile_game_tree
+from optimizer.infoset import InfoSetTable
+from optimizer.sampling import Sampler
+
+SimulationResult = namedtuple('SimulationResult', ['games', 'mean', 'stderr', 'low', 'high'])
+SimulationResult.__doc__ = """Per player mean utility of the simulated games, its standard error and
+the bounds of its confidence interval, each a ``(num_players,)`` array."""
+
+
+class BatchedSimulator:
+    """Plays many games of a strategy profile at once over a CompiledGameTree.
+
+    The current node of every game is held in one array and all games take a
+    step together: one uniform per game and a single binary search over the
+    cumulative probabilities of all edges of the tree, laid out so the
+    children of node n cover ``[n, n + 1)``. Payoffs are looked up in the
+    tree's payoff table when every game has reached a terminal node.
+    """
+
+    def __init__(self, tree, players):
+        self.tree = tree if isinstance(tree, CompiledGameTree) else compile_game_tree(tree, players)
+        self._players = players
+        tree = self.tree
+
+        # edges are the nodes below the root, each identified by its child node
+        parent = tree.parent[1:].astype(np.int64)
+        self._edge_parent = parent
+        self._decision_edges = np.nonzero(tree.node_type[parent] == DECISION)[0]
+        self._decision_parents = parent[self._decision_edges]
+        self._decision_infosets = tree.infoset[self._decision_parents].astype(np.int64)
+        self._decision_slots = tree.slot[1:][self._decision_edges].astype(np.int64)
+        self._decision_movers = tree.player[self._decision_parents].astype(np.int64)
+        self._last_child = (tree.child_start + tree.child_count - 1).astype(np.int64)
+        self._max_depth = int(tree.depth[-1])
+
+    def strategies(self, infosets, average=True):
+        """The average (or current) strategies of the InfoSetTable infosets as a
+        ``(num_infosets, width)`` array indexed by the tree's ids. Information
+        sets are matched by key; those missing from infosets play uniformly."""
+        tree_infosets = self.tree.infosets
+        table = infosets.average_strategies() if average else infosets.current_strategies()
+        if infosets.keys() == tree_infosets.keys():
+            return table
+        legal = tree_infosets.legal[:len(tree_infosets)]
+        strategies = legal / legal.sum(axis=1, keepdims=True)
+        for tree_id, key in enumerate(tree_infosets.keys()):
+            if key in infosets:
+                iid = infosets.get_id(key)
+                num_actions = infosets.num_actions[iid]
+                strategies[tree_id, :num_actions] = table[iid, :num_actions]
+        return strategies
+
+    def _edge_keys(self, profile):
+        tree = self.tree
+        probabilities = np.array(tree.chance_prob[1:], dtype=np.float64)
+        if isinstance(profile, (list, tuple)):
+            for player, strategies in enumerate(profile):
+                edges = self._decision_movers == player
+                probabilities[self._decision_edges[edges]] = strategies[self._decision_infosets[edges],
+                                                                        self._decision_slots[edges]]
+        else:
+            probabilities[self._decision_edges] = profile[self._decision_infosets, self._decision_slots]
+
+        # cumulative probability within each node's children, normalized; the children of n
+        # are contiguous, so parent id + cumulative probability is sorted over all edges
+        cumulative = np.cumsum(probabilities)
+        first = tree.child_start[self._edge_parent] - 1
+        within = cumulative - cumulative[first] + probabilities[first]
+        totals = within[self._last_child[self._edge_parent] - 1]
+        return self._edge_parent + within / np.where(totals > 0, totals, 1.)
+
+    def simulate(self, profile, num_games, sampler=None, batch_size=65536, confidence=0.95):
+        """Plays num_games games and returns a SimulationResult.
+
+        profile is a strategy array indexed by the tree's information set ids
+        (e.g. ``solver.infosets.average_strategies()`` of a solver on this
+        tree), an InfoSetTable, whose average strategies are used, or a list
+        with one of either per player to pit different strategies against each
+        other. sampler defaults to a new optimizer.sampling.Sampler.
+        """
+        tree = self.tree
+        sampler = sampler if sampler is not None else Sampler()
+        if isinstance(profile, (list, tuple)):
+            profile = [self._as_array(strategies) for strategies in profile]
+        else:
+            profile = self._as_array(profile)
+        keys = self._edge_keys(profile)
+        not_terminal = tree.node_type != TERMINAL
+
+        num_players = tree.num_players
+        total, squares = np.zeros(num_players), np.zeros(num_players)
+        for start in range(0, num_games, batch_size):
+            nodes = np.zeros(min(batch_size, num_games - start), dtype=np.int64)
+            for _ in range(self._max_depth):
+                playing = np.nonzero(not_terminal[nodes])[0]
+                if len(playing) == 0:
+                    break
+                current = nodes[playing]
+                # edge index + 1 is the child's node id
+                children = keys.searchsorted(current + sampler.random(len(playing)), 'right') + 1
+                nodes[playing] = np.minimum(children, self._last_child[current])
+            payoffs = tree.payoffs[nodes]
+            total += payoffs.sum(axis=0)
+            squares += (payoffs ** 2).sum(axis=0)
+
+        mean = total / num_games
+        variance = np.maximum(squares / num_games - mean ** 2, 0.) * num_games / max(num_games - 1, 1)
+        stderr = np.sqrt(variance / num_games)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2.)
+        return SimulationResult(num_games, mean, stderr, mean - z * stderr, mean + z * stderr)
+
+    def _as_array(self, strategies):
+        return self.strategies(strategies) if isinstance(strategies, InfoSetTable) else strategies
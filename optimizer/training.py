@@ -0,0 +1,131 @@
+import math
+import time
+
+import numpy as np
+
+
+class AnytimeTrainer:
+    """Runs a solver until a wall clock budget is spent or a convergence
+    target is met, whichever comes first.
+
+    Iterations run in chunks sized from the measured cost of an iteration, so
+    that a convergence check happens about every check_every seconds and the
+    last chunk ends close to the budget. Each check records:
+
+    * ``exploitability`` of the average strategy, when a best_response (an
+      optimizer.exploitability.BestResponse of the game) is given. Leave it
+      out where the best response is too large to compute
+    * ``strategy_change``: the mean total variation distance between the
+      average strategies of this check and of the previous one, over every
+      information set. Information sets first seen since the previous check
+      are compared to the uniform strategy
+
+    Training stops as soon as a check finds the exploitability at or below
+    target_exploitability, or the strategy change at or below
+    target_strategy_change. It also stops when time_budget seconds or
+    max_iterations are used up. At least one of these must be given.
+
+    ``best`` holds a snapshot of the average strategy: the least exploitable
+    one checked, or the latest one without a best_response. Pass
+    ``best['strategies']`` to optimizer.policy.export_policy to ship it. A
+    checkpointer (optimizer.checkpoint.Checkpointer) saves the solver at every
+    check, so a run cut short by its compute slot can be resumed.
+    """
+
+    def __init__(self, solver, time_budget=None, target_exploitability=None, target_strategy_change=None,
+                 max_iterations=None, best_response=None, check_every=1., checkpointer=None, on_check=None):
+        if time_budget is None and max_iterations is None and target_strategy_change is None \
+                and (target_exploitability is None or best_response is None):
+            raise ValueError("give a time budget, an iteration limit or a convergence target that can be checked")
+        if target_exploitability is not None and best_response is None:
+            raise ValueError("target_exploitability needs a best_response to measure it")
+        self.solver = solver
+        self.time_budget = time_budget
+        self.target_exploitability = target_exploitability
+        self.target_strategy_change = target_strategy_change
+        self.max_iterations = max_iterations
+        self.best_response = best_response
+        self.check_every = check_every
+        self.checkpointer = checkpointer
+        # called with every check's record, e.g. to log progress
+        self.on_check = on_check
+        self.checks = []
+        # {'iteration', 'seconds', 'exploitability', 'strategies'} of the best average strategy checked
+        self.best = None
+        self._previous_strategies = None
+
+    def train(self):
+        """Trains and returns a summary: iterations run, seconds spent, why
+        training stopped ('exploitability', 'strategy_change', 'time' or
+        'iterations'), every check's record and the best snapshot."""
+        start = time.perf_counter()
+        deadline = start + self.time_budget if self.time_budget is not None else math.inf
+        next_check = start + self.check_every
+        iterations, seconds_per_iteration, stopped_by = 0, None, None
+
+        while stopped_by is None:
+            now = time.perf_counter()
+            chunk = 1
+            if seconds_per_iteration is not None:
+                chunk = max(1, int((min(next_check, deadline) - now) / seconds_per_iteration))
+            if self.max_iterations is not None:
+                chunk = min(chunk, self.max_iterations - iterations)
+            self.solver.run(iterations=chunk)
+            iterations += chunk
+            after = time.perf_counter()
+            seconds_per_iteration = max((after - now) / chunk, 1e-9)
+
+            out_of_time = after >= deadline
+            out_of_iterations = self.max_iterations is not None and iterations >= self.max_iterations
+            if after >= next_check or out_of_time or out_of_iterations:
+                stopped_by = self._converged(self._check(after - start))
+                next_check = time.perf_counter() + self.check_every
+            if stopped_by is None and out_of_time:
+                stopped_by = 'time'
+            elif stopped_by is None and out_of_iterations:
+                stopped_by = 'iterations'
+
+        return {
+            'iterations': iterations,
+            'seconds': time.perf_counter() - start,
+            'stopped_by': stopped_by,
+            'checks': self.checks,
+            'best': self.best,
+        }
+
+    def _check(self, seconds):
+        solver = self.solver
+        strategies = solver.infosets.average_strategies()
+        record = {'iteration': solver.iteration, 'seconds': seconds, 'exploitability': None,
+                  'strategy_change': self._strategy_change(strategies)}
+        if self.best_response is not None:
+            record['exploitability'] = self.best_response.exploitability(solver.infosets)
+        if self.best is None or record['exploitability'] is None \
+                or record['exploitability'] <= self.best['exploitability']:
+            self.best = dict(record, strategies=strategies)
+            del self.best['strategy_change']
+        self._previous_strategies = strategies
+        if self.checkpointer is not None:
+            self.checkpointer.save(solver)
+        self.checks.append(record)
+        if self.on_check is not None:
+            self.on_check(record)
+        return record
+
+    def _strategy_change(self, strategies):
+        previous = self._previous_strategies
+        if previous is None or len(strategies) == 0:
+            return None
+        legal = self.solver.infosets.legal[:len(strategies)]
+        # information sets seen since the previous check start from the uniform strategy
+        before = legal / np.maximum(legal.sum(axis=1, keepdims=True), 1)
+        before[:previous.shape[0], :previous.shape[1]] = previous
+        return float(np.abs(strategies - before).sum(axis=1).mean() / 2)
+
+    def _converged(self, record):
+        if self.target_exploitability is not None and record['exploitability'] <= self.target_exploitability:
+            return 'exploitability'
+        if self.target_strategy_change is not None and record['strategy_change'] is not None \
+                and record['strategy_change'] <= self.target_strategy_change:
+            return 'strategy_change'
+        return None
@@ -0,0 +1,40 @@
+import unittest
+
+from benchmark.runner import run_benchmarks, compare
+from benchmark.scenarios import scenario_names
+
+
+class TestBenchmarkMethods(unittest.TestCase):
+    def test_scenarios(self):
+        names = scenario_names()
+        self.assertIn('kuhn3/vectorized', names)
+        self.assertIn('ld2/outcome_sampling', names)
+        self.assertNotIn('ld2/vanilla', names)
+
+    def test_report(self):
+        report = run_benchmarks(['kuhn2/vanilla', 'kuhn2/vectorized', 'kuhn2/outcome_sampling'], 0.1, isolate=False)
+        for result in report['results']:
+            self.assertGreater(result['iterations'], 0)
+            self.assertGreater(result['nodes_per_sec'], 0)
+            self.assertGreater(result['bytes_per_infoset'], 0)
+            self.assertGreater(result['exploitability'], 0)
+        # memory of the information sets seen, not of the spare capacity
+        self.assertEqual(report['results'][0]['bytes_per_infoset'], report['results'][1]['bytes_per_infoset'])
+        # the vectorized solver counts every node of the compiled tree
+        self.assertGreater(report['results'][1]['nodes_per_iteration'], report['results'][0]['nodes_per_iteration'])
+
+    def test_compare(self):
+        baseline = {'results': [{'scenario': 'kuhn2/vanilla', 'iterations_per_sec': 100., 'peak_rss_bytes': 1000,
+                                 'exploitability': None}]}
+        report = {'results': [{'scenario': 'kuhn2/vanilla', 'iterations_per_sec': 80., 'peak_rss_bytes': 1050,
+                               'exploitability': 0.01},
+                              {'scenario': 'kuhn3/vanilla', 'iterations_per_sec': 1.}]}
+        comparison = {row['metric']: row for row in compare(report, baseline, tolerance=0.1)}
+        self.assertEqual(set(comparison), {'iterations_per_sec', 'peak_rss_bytes'})
+        self.assertTrue(comparison['iterations_per_sec']['regression'])
+        self.assertAlmostEqual(comparison['iterations_per_sec']['ratio'], 0.8)
+        self.assertFalse(comparison['peak_rss_bytes']['regression'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import os
+import random
+import tempfile
+
+import numpy as np
+
+from game.poker import PokerActions
+from optimizer.cfr import ExternalSamplingCFR, DiscountedExternalSamplingCFR, OutcomeSamplingCFR, VanillaCFR
+from optimizer.checkpoint import Checkpointer
+from optimizer.compiled import compile_game_tree
+from test.helpers import kuhn_game
+
+
+class TestCheckpointMethods(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, 'cfr.npz')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def assert_same_state(self, expected, actual):
+        self.assertEqual(expected.iteration, actual.iteration)
+        self.assertEqual(expected.infosets.keys(), actual.infosets.keys())
+        num_infosets = len(expected.infosets)
+        expected_rows, actual_rows = expected._checkpoint_rows(), actual._checkpoint_rows()
+        for name in expected_rows:
+            self.assertTrue(np.array_equal(expected_rows[name][:num_infosets], actual_rows[name][:num_infosets]))
+
+    def test_resume_is_exact(self):
+        game, players = kuhn_game(3)
+        solvers = [lambda game, players: ExternalSamplingCFR(game.create_root_node(), players),
+                   lambda game, players: DiscountedExternalSamplingCFR(game.create_root_node(), players),
+                   lambda game, players: OutcomeSamplingCFR(compile_game_tree(game.create_root_node(), players), players)]
+        for create_solver in solvers:
+            random.seed(0)
+            np.random.seed(0)
+            cfr = create_solver(game, players)
+            checkpointer = Checkpointer(self.path, full_every=3)
+            paths = []
+            for _ in range(4):
+                cfr.run(iterations=10)
+                paths.append(checkpointer.save(cfr))
+            self.assertEqual(paths, [self.path, checkpointer.delta_path(1), checkpointer.delta_path(2), self.path])
+            cfr.run(iterations=10)
+            checkpointer.save(cfr)
+            cfr.run(iterations=30)
+
+            # resume into a new game, which has seen other betting sequences first
+            new_game, new_players = kuhn_game(3)
+            new_game.create_root_node().play((3, 1, 0)).play(PokerActions.CHECK).play(PokerActions.RAISE_1) \
+                .play(PokerActions.CALL)
+            resumed = create_solver(new_game, new_players)
+            self.assertTrue(Checkpointer(self.path, full_every=3).resume(resumed, new_game))
+            self.assertEqual(resumed.iteration, 50)
+            resumed.run(iterations=30)
+            self.assert_same_state(cfr, resumed)
+
+    def test_delta_holds_changed_rows(self):
+        game, players = kuhn_game(2)
+        cfr = VanillaCFR(game.create_root_node(), players)
+        cfr.run(iterations=5)
+        checkpointer = Checkpointer(self.path)
+        checkpointer.save(cfr)
+
+        cfr.infosets.regrets[3, 0] += 1.
+        with np.load(checkpointer.save(cfr)) as delta:
+            self.assertEqual(list(delta['ids']), [3])
+        with np.load(checkpointer.save(cfr)) as delta:
+            self.assertEqual(len(delta['ids']), 0)
+
+    def test_stale_deltas_are_ignored(self):
+        game, players = kuhn_game(2)
+        cfr = VanillaCFR(game.create_root_node(), players)
+        checkpointer = Checkpointer(self.path)
+        for _ in range(3):
+            cfr.run(iterations=1)
+            checkpointer.save(cfr)
+
+        stale = {}
+        for sequence in [1, 2]:
+            with open(checkpointer.delta_path(sequence), 'rb') as f:
+                stale[sequence] = f.read()
+
+        # a new run saving to the same path starts a new chain; if it stops before the old
+        # chain's deltas are removed, they must not be applied to it
+        fresh = VanillaCFR(game.create_root_node(), players)
+        fresh.run(iterations=1)
+        Checkpointer(self.path).save(fresh)
+        for sequence, content in stale.items():
+            with open(checkpointer.delta_path(sequence), 'wb') as f:
+                f.write(content)
+
+        resumed = VanillaCFR(game.create_root_node(), players)
+        Checkpointer(self.path).resume(resumed)
+        self.assert_same_state(fresh, resumed)
+
+    def test_resume_into_other_solver(self):
+        game, players = kuhn_game(2)
+        cfr = VanillaCFR(game.create_root_node(), players)
+        cfr.run(iterations=1)
+        Checkpointer(self.path).save(cfr)
+        self.assertRaises(ValueError, Checkpointer(self.path).resume, ExternalSamplingCFR(game.create_root_node(), players))
+        self.assertFalse(Checkpointer(self.path + '.missing').resume(cfr))
+
+    def test_resume_into_other_game(self):
+        game, players = kuhn_game(3)
+        cfr = ExternalSamplingCFR(game.create_root_node(), players)
+        cfr.run(iterations=20)
+        Checkpointer(self.path).save(cfr)
+
+        other_game, other_players = kuhn_game(2)
+        resumed = ExternalSamplingCFR(other_game.create_root_node(), other_players)
+        self.assertRaises(ValueError, Checkpointer(self.path).resume, resumed, other_game)
+        self.assertEqual(len(resumed.infosets), 0)
+        self.assertTrue(Checkpointer(self.path).resume(ExternalSamplingCFR(game.create_root_node(), players), game))
+
+        # a rejected checkpoint leaves the solver's information sets alone, training goes on
+        resumed = ExternalSamplingCFR(game.create_root_node(), players)
+        key = cfr.infosets.key(5)
+        resumed.infosets.index(key, cfr.infosets.actions(5))
+        self.assertRaises(ValueError, Checkpointer(self.path).resume, resumed)
+        self.assertEqual(resumed.infosets.keys(), [key])
+        resumed.run(iterations=5)
+
+        # a compiled tree knows every information set already
+        tree = compile_game_tree(other_game.create_root_node(), other_players)
+        self.assertRaises(ValueError, Checkpointer(self.path).resume, ExternalSamplingCFR(tree, other_players))
+
+if __name__ == '__main__':
+    unittest.main()
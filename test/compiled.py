@@ -0,0 +1,177 @@
+import unittest
+import gc
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from game.poker import PokerActions
+from optimizer.cfr import VanillaCFR, ChanceSamplingCFR, ExternalSamplingCFR, VectorizedCFR
+from optimizer.compiled import compile_game_tree, TERMINAL, CHANCE, DECISION
+from optimizer.parallel import measure_throughput
+from test.helpers import kuhn_game
+
+
+class TestCompiledGameTreeMethods(unittest.TestCase):
+    def test_kuhn_layout(self):
+        game, players = kuhn_game(2)
+        tree = compile_game_tree(game.create_root_node(), players)
+
+        self.assertEqual(tree.node_type[0], CHANCE)
+        self.assertEqual(tree.child_count[0], 6)
+        self.assertTrue(np.allclose(tree.chance_prob[tree.children(0)], 1. / 6))
+        # 6 deals with 9 betting nodes each, 5 of them terminal
+        self.assertEqual(tree.num_nodes, 1 + 6 * 9)
+        self.assertEqual(np.sum(tree.node_type == TERMINAL), 6 * 5)
+        self.assertEqual(len(tree.infosets), 12)
+
+        # breadth first numbering: levels are contiguous and children follow their parent
+        self.assertTrue(np.all(np.diff(tree.depth) >= 0))
+        for node in range(1, tree.num_nodes):
+            parent = tree.parent[node]
+            self.assertEqual(tree.child_start[parent] + tree.slot[node], node)
+            self.assertEqual(tree.depth[parent] + 1, tree.depth[node])
+        for depth in range(tree.num_levels):
+            start, end = tree.level(depth)
+            self.assertTrue(np.all(tree.depth[start:end] == depth))
+
+    def test_decision_nodes_match_states(self):
+        game, players = kuhn_game(3)
+        root = game.create_root_node()
+        tree = compile_game_tree(root, players)
+        decisions = np.nonzero(tree.node_type == DECISION)[0]
+        self.assertTrue(np.all(tree.infoset[decisions] >= 0))
+        self.assertTrue(np.all(tree.player[decisions] >= 0))
+
+        # the first deal's subtree is identical to the state objects
+        deal = list(root.get_children().values())[0]
+        node = tree.child_start[0]
+        self.assertEqual(tree.infosets.key(tree.infoset[node]), deal.inf_set())
+        terminal = deal.play(PokerActions.RAISE_1).play(PokerActions.FOLD).play(PokerActions.FOLD)
+        node = tree.child_start[tree.child_start[tree.child_start[node]]]
+        self.assertTrue(np.allclose(tree.payoffs[node], terminal.evaluation()))
+
+    def test_vanilla_cfr_on_compiled_tree(self):
+        for num_players in [2, 3]:
+            game, players = kuhn_game(num_players)
+            cfr = VanillaCFR(game.create_root_node(), players)
+            compiled_cfr = VanillaCFR(compile_game_tree(game.create_root_node(), players), players)
+            cfr.run(iterations=20)
+            compiled_cfr.run(iterations=20)
+
+            expected = cfr.average_strategy()
+            actual = compiled_cfr.average_strategy()
+            for info_set in expected:
+                for action in expected[info_set]:
+                    self.assertAlmostEqual(expected[info_set][action], actual[info_set][action])
+
+            cfr.compute_nash_equilibrium()
+            compiled_cfr.compute_nash_equilibrium()
+            self.assertTrue(np.allclose(cfr.value_of_the_game(), compiled_cfr.value_of_the_game()))
+
+    def test_external_sampling_on_compiled_tree(self):
+        game, players = kuhn_game(2)
+        cfr = ExternalSamplingCFR(compile_game_tree(game.create_root_node(), players), players)
+        cfr.run(iterations=10)
+        self.assertEqual(len(cfr.approximate_value_of_game(10)), 2)
+
+    def test_vectorized_cfr_matches_recursion(self):
+        for num_players in [2, 3]:
+            game, players = kuhn_game(num_players)
+            tree = compile_game_tree(game.create_root_node(), players)
+            cfr = VanillaCFR(tree, players)
+            vectorized_cfr = VectorizedCFR(tree, players)
+            # both apply every iteration's regret updates once it is done
+            cfr.run(iterations=30)
+            vectorized_cfr.run(iterations=30)
+            self.assertTrue(np.allclose(cfr.infosets.regrets, vectorized_cfr.infosets.regrets))
+            self.assertTrue(np.allclose(cfr.infosets.average_strategies(), vectorized_cfr.infosets.average_strategies()))
+
+    def test_vectorized_cfr_game_value(self):
+        game, players = kuhn_game(2)
+        cfr = VectorizedCFR(game.create_root_node(), players)
+        cfr.run(iterations=1000)
+        cfr.compute_nash_equilibrium()
+        self.assertTrue(np.allclose(cfr.value_of_the_game(), [-1. / 18, 1. / 18], atol=1E-3))
+
+    def test_parallel_vanilla_cfr(self):
+        for num_players in [2, 3]:
+            game, players = kuhn_game(num_players)
+            tree = compile_game_tree(game.create_root_node(), players)
+            vectorized_cfr = VectorizedCFR(tree, players)
+            parallel_cfr = VanillaCFR(tree, players, processes=2)
+            try:
+                expected = vectorized_cfr.run(iterations=20)
+                actual = parallel_cfr.run(iterations=20)
+            finally:
+                parallel_cfr.close()
+            self.assertTrue(np.allclose(expected, actual))
+            self.assertTrue(np.allclose(vectorized_cfr.infosets.regrets, parallel_cfr.infosets.regrets))
+            self.assertTrue(np.allclose(vectorized_cfr.infosets.strategy_sum, parallel_cfr.infosets.strategy_sum))
+
+    def test_shared_memory_sampling_converges(self):
+        game, players = kuhn_game(2)
+        tree = compile_game_tree(game.create_root_node(), players)
+        for solver_class, sync_every in [(ExternalSamplingCFR, None), (ChanceSamplingCFR, 50)]:
+            cfr = solver_class(tree, players, processes=2, sync_every=sync_every)
+            try:
+                cfr.run(iterations=4000)
+            finally:
+                cfr.close()
+            cfr.compute_nash_equilibrium()
+            self.assertTrue(np.allclose(cfr.value_of_the_game(), [-1. / 18, 1. / 18], atol=2E-2))
+
+    def test_seeded_parallel_sampling_is_reproducible(self):
+        game, players = kuhn_game(2)
+        tree = compile_game_tree(game.create_root_node(), players)
+        tables = []
+        for seed in [0, 0, 1]:
+            np.random.seed(seed)
+            with ExternalSamplingCFR(tree, players, processes=2, sync_every=100) as cfr:
+                for _ in range(3):
+                    cfr.run(iterations=100)
+                tables.append(np.copy(cfr.infosets.regrets))
+        self.assertTrue(np.allclose(tables[0], tables[1], rtol=0., atol=1e-9))
+        self.assertFalse(np.allclose(tables[0], tables[2]))
+
+    def test_parallel_sampling_counts_iterations(self):
+        game, players = kuhn_game(2)
+        tree = compile_game_tree(game.create_root_node(), players)
+        for solver_class in [ChanceSamplingCFR, ExternalSamplingCFR]:
+            iterations = []
+            with solver_class(tree, players, processes=2, sync_every=10) as cfr:
+                cfr.add_iteration_callback(lambda solver: iterations.append(solver.iteration))
+                cfr.run(iterations=100)
+                cfr.run(iterations=50)
+            self.assertEqual(cfr.iteration, 150)
+            self.assertEqual(iterations, [100, 150])
+
+    def test_parallel_pool_is_released(self):
+        game, players = kuhn_game(2)
+        tree = compile_game_tree(game.create_root_node(), players)
+        with self.assertRaises(ZeroDivisionError):
+            with ExternalSamplingCFR(tree, players, processes=2) as cfr:
+                names = [memory.name for memory in cfr._pool._memory]
+                1 / 0
+        self.assertIsNone(cfr._pool)
+
+        # without close, the shared memory goes away with the solver
+        cfr = ExternalSamplingCFR(tree, players, processes=2)
+        names += [memory.name for memory in cfr._pool._memory]
+        del cfr
+        gc.collect()
+        for name in names:
+            with self.assertRaises(FileNotFoundError):
+                shared_memory.SharedMemory(name)
+
+    def test_measure_throughput(self):
+        game, players = kuhn_game(2)
+        tree = compile_game_tree(game.create_root_node(), players)
+        report = measure_throughput(ExternalSamplingCFR, tree, players, worker_counts=(1, 2), iterations=200)
+        self.assertEqual([row['workers'] for row in report], [1, 2])
+        for row in report:
+            self.assertEqual(row['iterations'], 200)
+            self.assertGreater(row['iterations_per_sec'], 0)
+            self.assertAlmostEqual(row['iterations_per_sec'], 200 / row['seconds'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import itertools
+
+import numpy as np
+
+from optimizer.cfr import VanillaCFR, VectorFormCFR, ExternalSamplingCFR
+from optimizer.compiled import DECISION
+from optimizer.exploitability import BestResponse
+from test.helpers import kuhn_game
+
+
+class TestBestResponseMethods(unittest.TestCase):
+    def test_matches_best_pure_strategy(self):
+        game, players = kuhn_game(2)
+        cfr = VanillaCFR(game.create_root_node(), players)
+        cfr.run(iterations=30)
+        best_response = BestResponse(game, players)
+        best_response_values, policy_values = best_response.evaluate(cfr.infosets)
+
+        cfr.compute_nash_equilibrium()
+        self.assertTrue(np.allclose(policy_values, cfr.value_of_the_game()))
+
+        # enumerate every pure strategy of each player against the other's average strategy
+        tree = best_response.public_tree
+        strategies = best_response.strategies(cfr.infosets)
+        for player in range(2):
+            info_sets = sorted({int(iid) for node in range(tree.num_nodes)
+                                if tree.node_type[node] == DECISION and tree.player[node] == player
+                                for iid in tree.infoset[node]})
+            best = -np.inf
+            for pure in itertools.product([0, 1], repeat=len(info_sets)):
+                deviation = np.copy(strategies)
+                deviation[info_sets] = np.eye(2)[list(pure)]
+                best = max(best, best_response.evaluate_strategies(deviation)[1][player])
+            self.assertAlmostEqual(best, best_response_values[player])
+
+    def test_nash_conv_decreases(self):
+        for num_players in [2, 3]:
+            game, players = kuhn_game(num_players)
+            cfr = VectorFormCFR(game, players)
+            best_response = BestResponse(cfr.public_tree, players)
+            nash_conv = [best_response.nash_conv(cfr.infosets)]
+            for _ in range(3):
+                cfr.run(iterations=100)
+                nash_conv.append(best_response.nash_conv(cfr.infosets))
+            self.assertTrue(all(value >= -1E-12 for value in nash_conv))
+            self.assertTrue(nash_conv[-1] < nash_conv[0] / 4)
+
+    def test_exploitability_of_sampled_solver(self):
+        game, players = kuhn_game(2)
+        best_response = BestResponse(game, players)
+        cfr = ExternalSamplingCFR(game.create_root_node(), players)
+        uniform = best_response.exploitability(cfr.infosets)
+        cfr.run(iterations=2000)
+        self.assertTrue(best_response.exploitability(cfr.infosets) < uniform / 4)
+        self.assertAlmostEqual(best_response.exploitability(cfr.infosets), best_response.nash_conv(cfr.infosets) / 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1 @@
+from benchmark.games import kuhn_game
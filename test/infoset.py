@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+
+from optimizer.infoset import InfoSetTable
+
+
+class TestInfoSetTableMethods(unittest.TestCase):
+    def test_dense_ids(self):
+        table = InfoSetTable(capacity=1, width=1)
+        self.assertEqual(table.index('a', ['x', 'y']), 0)
+        self.assertEqual(table.index('b', ['x', 'y', 'z']), 1)
+        self.assertEqual(table.index('a', ['x', 'y']), 0)
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.slot(1, 'z'), 2)
+        self.assertTrue(np.array_equal(table.legal[0, :3], [True, True, False]))
+
+    def test_grow_keeps_values(self):
+        table = InfoSetTable(capacity=1, width=2)
+        iid = table.index('a', ['x', 'y'])
+        table.regrets[iid, :2] = [1., 3.]
+        for i in range(10):
+            table.index(i, ['x', 'y', 'z', 'w'])
+        self.assertGreaterEqual(table.capacity, 11)
+        self.assertTrue(np.allclose(table.regrets[iid, :2], [1., 3.]))
+
+    def test_used_nbytes(self):
+        table = InfoSetTable(capacity=1024, width=2)
+        self.assertEqual(table.used_nbytes(), 0)
+        table.index('a', ['x', 'y'])
+        table.index('b', ['x', 'y'])
+        self.assertEqual(table.used_nbytes(), 2 * table.nbytes() // table.capacity)
+
+    def test_regret_matching(self):
+        table = InfoSetTable()
+        a = table.index('a', ['x', 'y', 'z'])
+        b = table.index('b', ['x', 'y'])
+        table.regrets[a, :3] = [1., -2., 3.]
+        table.regrets[b, :2] = [-1., -1.]
+        self.assertTrue(np.allclose(table.current_strategy(a), [0.25, 0., 0.75]))
+        self.assertTrue(np.allclose(table.current_strategy(b), [0.5, 0.5]))
+
+        strategies = table.current_strategies()
+        self.assertTrue(np.allclose(strategies[a, :3], table.current_strategy(a)))
+        self.assertTrue(np.allclose(strategies[b, :2], table.current_strategy(b)))
+        self.assertTrue(np.allclose(strategies[b, 2:], 0.))
+
+    def test_cached_strategy(self):
+        table = InfoSetTable(capacity=1, width=2)
+        a = table.index('a', ['x', 'y'])
+        table.regrets[a, :2] = [1., 3.]
+        self.assertTrue(np.allclose(table.cached_strategy(a), [0.25, 0.75]))
+
+        # regret changes only show once the cache is invalidated, growing keeps it
+        table.regrets[a, :2] = [1., 0.]
+        table.index('b', ['x', 'y', 'z'])
+        self.assertTrue(np.allclose(table.cached_strategy(a), [0.25, 0.75]))
+        self.assertTrue(np.allclose(table.cached_strategy(1), [1. / 3] * 3))
+        table.invalidate_strategies()
+        self.assertTrue(np.allclose(table.cached_strategy(a), [1., 0.]))
+
+    def test_average_strategy(self):
+        table = InfoSetTable()
+        a = table.index('a', ['x', 'y'])
+        table.strategy_sum[a, :2] = [3., 1.]
+        self.assertTrue(np.allclose(table.average_strategy(a), [0.75, 0.25]))
+        self.assertEqual(table.as_dict(table.average_strategies())['a']['y'], 0.25)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+
+from game.player import create_player_set
+from ld.liarsdice import LDGame, LDMoveGameState
+from optimizer.cfr import VanillaCFR, VectorizedCFR, ExternalSamplingCFR
+from optimizer.compiled import compile_game_tree, TERMINAL, CHANCE, DECISION
+from optimizer.instrumentation import Profiler
+from test.helpers import kuhn_game
+
+
+class TestInstrumentationMethods(unittest.TestCase):
+    def test_full_width_visits_every_node(self):
+        game, players = kuhn_game(3)
+        tree = compile_game_tree(game.create_root_node(), players)
+        expected = {name: 2 * int(np.sum(tree.node_type == node_type))
+                    for name, node_type in [('terminal', TERMINAL), ('chance', CHANCE), ('decision', DECISION)]}
+        for cfr in [VanillaCFR(game.create_root_node(), players), VanillaCFR(tree, players), VectorizedCFR(tree, players)]:
+            with Profiler(cfr) as profile:
+                cfr.run(iterations=2)
+            self.assertEqual(dict(profile.nodes), expected)
+            self.assertEqual(profile.infosets_touched, len(cfr.infosets))
+
+        # a state tree is built on the first iteration, strategies are looked up once per decision node visit
+        cfr = VanillaCFR(game.create_root_node(), players)
+        with Profiler(cfr) as profile:
+            cfr.run(iterations=2)
+        report = profile.report()
+        self.assertEqual(report['states_created'], tree.num_nodes - 1)
+        self.assertEqual(report['strategy_lookups'], expected['decision'])
+        self.assertEqual(report['regret_updates'], expected['decision'])
+        self.assertEqual(report['calls']['evaluation'], expected['terminal'])
+        self.assertEqual(set(report['seconds']), {'children', 'infoset_key', 'strategy', 'evaluation', 'regrets'})
+
+    def test_stop_restores_methods(self):
+        players = create_player_set(2)
+        cfr = ExternalSamplingCFR(LDGame(players, 1, max_cached_nodes=0).create_root_node(), players)
+        solver_attributes, infoset_attributes = set(vars(cfr)), set(vars(cfr.infosets))
+        state_init = LDMoveGameState.__init__
+        with Profiler(cfr) as profile:
+            cfr.run(iterations=2)
+        self.assertGreater(profile.calls['sampling'], 0)
+        self.assertGreater(profile.report()['states_created'], 0)
+        self.assertEqual(set(vars(cfr)), solver_attributes)
+        self.assertEqual(set(vars(cfr.infosets)), infoset_attributes)
+        self.assertIs(LDMoveGameState.__init__, state_init)
+
+        # nothing is counted once stopped
+        cfr.run(iterations=2)
+        self.assertEqual(len(profile.iterations), 2)
+
+    def test_iterations_and_memory(self):
+        game, players = kuhn_game(2)
+        cfr = VanillaCFR(game.create_root_node(), players)
+        seen = []
+        cfr.add_iteration_callback(lambda solver: seen.append(solver.iteration))
+        with Profiler(cfr, trace_memory=True) as profile:
+            cfr.run(iterations=3)
+        self.assertEqual(seen, [1, 2, 3])
+        self.assertEqual([record['iteration'] for record in profile.iterations], [1, 2, 3])
+        self.assertEqual(sum(record['nodes'] for record in profile.iterations), sum(profile.nodes.values()))
+
+        memory = profile.report()['memory']
+        self.assertEqual(memory['infosets'], cfr.infosets.nbytes())
+        self.assertIn('game/kuhn.py', memory['allocated'])
+
+
+if __name__ == '__main__':
+    unittest.main()
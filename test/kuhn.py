@@ -11,7 +11,9 @@ import random
 import itertools
 
 from game.poker import PokerActions
-from optimizer.cfr import VanillaCFR, ChanceSamplingCFR, ExternalSamplingCFR
+from optimizer.cfr import VanillaCFR, ChanceSamplingCFR, ExternalSamplingCFR, CFRPlusSolver, DiscountedCFR, LinearCFR, \
+    DiscountedExternalSamplingCFR, OutcomeSamplingCFR
+from optimizer.compiled import compile_game_tree
 
 
 class TestKuhnMethods(unittest.TestCase):
@@ -94,6 +96,59 @@ class TestKuhnMethods(unittest.TestCase):
         with self.assertRaises(KeyError):
             root.play(PokerActions.CHECK).play(PokerActions.CALL)
 
+    def test_sampled_deals(self):
+        root = self.get_chance_node()
+        deal = root.sample_outcome()
+        self.assertIn(deal, root.actions)
+        self.assertAlmostEqual(root.chance_probability(deal), 1. / 6)
+        self.assertIs(root.play_outcome(deal), root.play(deal))
+        # playing a deal builds only that deal's state, expanding later keeps it
+        self.assertIsNone(root._children)
+        child = root.play(deal)
+        self.assertIs(root.get_children()[deal], child)
+        self.assertEqual(len(root.get_children()), 6)
+
+    def test_card_ranks(self):
+        deck = pydealer.Deck()
+        cards = deck.get_list(['King of Spades', 'Jack of Spades', 'Queen of Spades'])
+        k, j, q = cards
+        game = KuhnGame(create_player_set(2), cards, 1)
+        root = game.create_root_node()
+        self.assertEqual(sorted(root.get_children()), sorted(itertools.permutations(range(3), 2)))
+        self.assertEqual(game.ranks_of((k, j)), (2, 0))
+        self.assertIs(root.play_cards((k, j)), root.play((2, 0)))
+        self.assertIs(root.play((np.int64(2), np.int64(0))), root.play((2, 0)))
+        self.assertEqual(root.play_cards((q, k)).cards, (1, 2))
+        self.assertEqual(game.card(2), k)
+        with self.assertRaises(KeyError):
+            root.play_cards((k, k))
+        with self.assertRaises(KeyError):
+            root.play((k, j))
+
+        # plain integers work as cards too
+        game = KuhnGame(create_player_set(2), [0, 1, 2], 1)
+        state = game.create_root_node().play_cards((1, 2)).play(PokerActions.RAISE_1).play(PokerActions.CALL)
+        self.assertTrue(np.array_equal(state.evaluation(), [-2, 2]))
+
+        # deal actions are ranks, also when the cards are integers
+        game = KuhnGame(create_player_set(2), [1, 2, 3], 1)
+        root = game.create_root_node()
+        self.assertEqual(root.play((1, 2)).cards, (1, 2))
+        self.assertEqual(root.play_cards((1, 2)).cards, (0, 1))
+        self.assertEqual(root.play_cards((3, 1)).cards, (2, 0))
+        with self.assertRaises(KeyError):
+            root.play_cards((0, 1))
+        deal = root.sample_outcome()
+        self.assertEqual(root.play_outcome(deal).cards, deal)
+        self.assertEqual(root.play_cards(tuple(game.card(rank) for rank in deal)).cards, deal)
+
+    def test_deal_actions_round_trip(self):
+        for card_set in [[1, 2, 3], [0, 1, 2, 3], pydealer.Deck().get_list(['Jack of Spades', 'Queen of Spades', 'King of Spades'])]:
+            for num_players in [2, 3]:
+                root = KuhnGame(create_player_set(num_players), card_set, 1).create_root_node()
+                for deal in root.actions:
+                    self.assertEqual(root.play(deal).cards, deal)
+                self.assertEqual(sorted(root.get_children()), sorted(root.actions))
 
     def test_inf_sets(self):
 
@@ -106,16 +161,64 @@ class TestKuhnMethods(unittest.TestCase):
 
         root = game.create_root_node()
 
-        KQ_node = root.get_children()[(k, q)]
-        QJ_node = root.get_children()[(q, j)]
-        KJ_node = root.get_children()[(k, j)]
-        QK_node = root.get_children()[(q, k)]
-        JQ_node = root.get_children()[(j, q)]
-        JK_node = root.get_children()[(j, k)]
+        KQ_node = root.play_cards((k, q))
+        QJ_node = root.play_cards((q, j))
+        KJ_node = root.play_cards((k, j))
+        QK_node = root.play_cards((q, k))
+        JQ_node = root.play_cards((j, q))
+        JK_node = root.play_cards((j, k))
 
         assert root.inf_set() == "."
-        self.assertTrue('King of Spades' in KQ_node.inf_set())
-        self.assertTrue('Queen of Spades' in KQ_node.play(PokerActions.RAISE_1).inf_set())
+        self.assertTrue('King of Spades' in game.decode_information_set(KQ_node.inf_set()))
+        self.assertTrue('Queen of Spades' in game.decode_information_set(KQ_node.play(PokerActions.RAISE_1).inf_set()))
+        self.assertEqual(game.decode_information_set(KQ_node.play(PokerActions.CHECK).play(PokerActions.RAISE_1).inf_set()),
+                         'King of Spades.CHECK.RAISE_1')
+
+        # the same card and betting sequence in another deal is the same information set
+        self.assertEqual(KQ_node.play(PokerActions.CHECK).inf_set(), JQ_node.play(PokerActions.CHECK).inf_set())
+        self.assertNotEqual(KQ_node.inf_set(), KJ_node.play(PokerActions.RAISE_1).inf_set())
+
+        for state in [KQ_node, KQ_node.play(PokerActions.CHECK), QJ_node.play(PokerActions.RAISE_1)]:
+            self.assertEqual(game.information_set_actions(state.inf_set()), state.actions)
+        self.assertRaises(KeyError, game.information_set_actions, 1000)
+
+    def test_inf_sets_do_not_depend_on_play_order(self):
+        deck = pydealer.Deck()
+        cards = deck.get_list(['10 of Spades', 'Jack of Spades', 'Queen of Spades', 'King of Spades'])
+        players = create_player_set(3)
+        sequences = [[PokerActions.CHECK, PokerActions.RAISE_1, PokerActions.CALL],
+                     [PokerActions.RAISE_1, PokerActions.FOLD], [PokerActions.CHECK, PokerActions.CHECK]]
+
+        keys = []
+        for order in [sequences, sequences[::-1]]:
+            root = KuhnGame(players, cards, 1).create_root_node()
+            keys.append({})
+            for sequence in order:
+                state = root.play((0, 1, 2))
+                for action in sequence:
+                    state = state.play(action)
+                    keys[-1][tuple(sequence), state.history.length] = state.inf_set()
+        self.assertEqual(keys[0], keys[1])
+
+    def test_shared_histories(self):
+        deck = pydealer.Deck()
+        cards = deck.get_list(['10 of Spades', 'Jack of Spades', 'Queen of Spades', 'King of Spades'])
+        t, j, q, k = cards
+        players = create_player_set(3)
+        root = KuhnGame(players, cards, 1).create_root_node()
+
+        TKQ_node = root.play_cards((t, k, q))
+        state = TKQ_node.play(PokerActions.CHECK).play(PokerActions.RAISE_1).play(PokerActions.CALL)
+        self.assertIs(state.history, root.play_cards((j, q, k)).play(PokerActions.CHECK).play(PokerActions.RAISE_1).play(PokerActions.CALL).history)
+        self.assertEqual(state.actions_history, [(players[0], PokerActions.CHECK), (players[1], PokerActions.RAISE_1),
+                                                 (players[2], PokerActions.CALL)])
+        self.assertEqual(state.pot_size(), 5)
+        self.assertEqual([state.pot_contribution(player) for player in players], [1, 2, 2])
+
+        state = state.play(PokerActions.FOLD)
+        self.assertTrue(state.is_terminal())
+        self.assertEqual(state.history.folded, {0})
+        self.assertTrue(np.array_equal(state.evaluation(), [-1, 3, -2]))
 
     '''
     def test_termination():
@@ -142,12 +245,12 @@ class TestKuhnMethods(unittest.TestCase):
 
         root = game.create_root_node()
 
-        KQ_node = root.get_children()[(k, q)]
-        QJ_node = root.get_children()[(q, j)]
-        KJ_node = root.get_children()[(k, j)]
-        QK_node = root.get_children()[(q, k)]
-        JQ_node = root.get_children()[(j, q)]
-        JK_node = root.get_children()[(j, k)]
+        KQ_node = root.play_cards((k, q))
+        QJ_node = root.play_cards((q, j))
+        KJ_node = root.play_cards((k, j))
+        QK_node = root.play_cards((q, k))
+        JQ_node = root.play_cards((j, q))
+        JK_node = root.play_cards((j, k))
 
         for node in [KQ_node, QJ_node, KJ_node]:
             self.assertTrue(np.allclose(node.play(PokerActions.RAISE_1).play(PokerActions.FOLD).evaluation(), np.array([1, -1])))
@@ -174,7 +277,7 @@ class TestKuhnMethods(unittest.TestCase):
         vanilla_cfr = VanillaCFR(root, players)
         t, j, q, k = cards
 
-        TKQ_node = root.get_children()[(t, k, q)]
+        TKQ_node = root.play_cards((t, k, q))
         return vanilla_cfr, TKQ_node
 
     def test_tkq_1(self):
@@ -270,8 +373,8 @@ class TestKuhnMethods(unittest.TestCase):
         vanilla_cfr = VanillaCFR(root, players)
         t, j, q, k = cards
 
-        TJQ_node = root.get_children()[(t, j, q)]
-        TJK_node = root.get_children()[(t, j, k)]
+        TJQ_node = root.play_cards((t, j, q))
+        TJK_node = root.play_cards((t, j, k))
 
         starting_reach = np.ones(3)
         vanilla_cfr._cfr_utility_recursive(TJQ_node, starting_reach)
@@ -293,7 +396,7 @@ class TestKuhnMethods(unittest.TestCase):
 
         val = np.zeros(3)
         for permutation in itertools.permutations(cards, 3):
-            one_val = vanilla_cfr._cfr_utility_recursive(root.get_children()[permutation], np.ones(3))
+            one_val = vanilla_cfr._cfr_utility_recursive(root.play_cards(permutation), np.ones(3))
             val += one_val
 
         self.assertTrue(np.allclose(val, np.array([-0.61, 0.26, 0.35]), atol=1E-1))
@@ -308,8 +411,10 @@ class TestKuhnMethods(unittest.TestCase):
 
         root = game.create_root_node()
 
+        random.seed(0)
+        np.random.seed(0)
         chance_cfr = ChanceSamplingCFR(root, players)
-        chance_cfr.run(iterations=200)
+        chance_cfr.run(iterations=1000)
         chance_cfr.compute_nash_equilibrium()
 
         game_value = chance_cfr.value_of_the_game()
@@ -327,9 +432,13 @@ class TestKuhnMethods(unittest.TestCase):
 
         root = game.create_root_node()
 
+        random.seed(0)
+        np.random.seed(0)
         chance_cfr = ExternalSamplingCFR(root, players)
         chance_cfr.run(iterations=1000)
-        game_value = chance_cfr.approximate_value_of_game(1000)
+        # the average strategy converges, the current one need not
+        chance_cfr.compute_nash_equilibrium()
+        game_value = chance_cfr.value_of_the_game()
 
         epsilon = 0.01
 
@@ -346,15 +455,93 @@ class TestKuhnMethods(unittest.TestCase):
 
         root = game.create_root_node()
 
+        random.seed(0)
+        np.random.seed(0)
         chance_cfr = ExternalSamplingCFR(root, players)
         chance_cfr.run(iterations=2000)
         chance_cfr.compute_nash_equilibrium()
 
-        game_value = chance_cfr.approximate_value_of_game(1000)
+        game_value = chance_cfr.value_of_the_game()
         self.assertTrue(game_value[0] > -3. / 48)
         self.assertTrue(game_value[0] < -1. / 48)
         self.assertTrue(4. / 48 > game_value[2] > 2. / 48)
 
+    def test_cfr_plus(self):
+        deck = pydealer.Deck()
+
+        cards = deck.get_list(['Jack of Spades', 'Queen of Spades', 'King of Spades'])
+        players = create_player_set(2)
+
+        game = KuhnGame(players, cards, num_deal=1)
+
+        for root in [game.create_root_node(), compile_game_tree(game.create_root_node(), players)]:
+            cfr_plus = CFRPlusSolver(root, players)
+            cfr_plus.run(iterations=100)
+            cfr_plus.compute_nash_equilibrium()
+
+            game_value = cfr_plus.value_of_the_game()
+            self.assertTrue(np.allclose(game_value, np.array([-1. / 18, 1. / 18]), atol=1E-4))
+            self.assertTrue(np.all(cfr_plus.infosets.regrets >= 0))
+
+    def test_discounted_cfr_lazy_discounting(self):
+        deck = pydealer.Deck()
+
+        cards = deck.get_list(['10 of Spades', 'Jack of Spades', 'Queen of Spades', 'King of Spades'])
+        players = create_player_set(3)
+
+        game = KuhnGame(players, cards, num_deal=1)
+        tree = compile_game_tree(game.create_root_node(), players)
+
+        # reference: discount the whole table at the end of every iteration
+        eager_cfr = VanillaCFR(tree, players)
+        alpha, beta, gamma = 1.5, 0., 2.
+        for t in range(1, 31):
+            eager_cfr.run(iterations=1)
+            regrets = eager_cfr.infosets.regrets
+            regrets[:] = np.where(regrets > 0, regrets * t ** alpha / (t ** alpha + 1), regrets * t ** beta / (t ** beta + 1))
+            eager_cfr.infosets.strategy_sum *= (t / (t + 1.)) ** gamma
+
+        discounted_cfr = DiscountedCFR(tree, players, alpha, beta, gamma)
+        discounted_cfr.run(iterations=30)
+        discounted_cfr.flush_discounts()
+
+        self.assertTrue(np.allclose(discounted_cfr.infosets.regrets, eager_cfr.infosets.regrets))
+        self.assertTrue(np.allclose(discounted_cfr.infosets.average_strategies(), eager_cfr.infosets.average_strategies()))
+
+    def test_discounted_cfr(self):
+        deck = pydealer.Deck()
+
+        cards = deck.get_list(['Jack of Spades', 'Queen of Spades', 'King of Spades'])
+        players = create_player_set(2)
+
+        game = KuhnGame(players, cards, num_deal=1)
+
+        for cfr, iterations, tolerance in [(DiscountedCFR(game.create_root_node(), players), 200, 1E-3),
+                                           (LinearCFR(game.create_root_node(), players), 200, 1E-3),
+                                           (DiscountedExternalSamplingCFR(game.create_root_node(), players), 3000, 1E-2)]:
+            cfr.run(iterations=iterations)
+            cfr.compute_nash_equilibrium()
+            self.assertTrue(np.allclose(cfr.value_of_the_game(), np.array([-1. / 18, 1. / 18]), atol=tolerance))
+
+    def test_outcome_sampling(self):
+        deck = pydealer.Deck()
+
+        cards = deck.get_list(['Jack of Spades', 'Queen of Spades', 'King of Spades'])
+        players = create_player_set(2)
+
+        game = KuhnGame(players, cards, num_deal=1)
+
+        random.seed(0)
+        np.random.seed(0)
+        outcome_cfr = OutcomeSamplingCFR(compile_game_tree(game.create_root_node(), players), players)
+        outcome_cfr.run(iterations=10000)
+        outcome_cfr.compute_nash_equilibrium()
+        self.assertTrue(np.allclose(outcome_cfr.value_of_the_game(), np.array([-1. / 18, 1. / 18]), atol=2E-2))
+
+        outcome_cfr = OutcomeSamplingCFR(game.create_root_node(), players)
+        outcome_cfr.run(iterations=100)
+        self.assertEqual(len(outcome_cfr.infosets), 12)
+
     def test_tkq_terminals(self):
         vanilla_cfr, TKQ_node = self.fresh_tkq_node()
         self.assertTrue(TKQ_node.play(PokerActions.RAISE_1).play(PokerActions.CALL).play(PokerActions.CALL).is_terminal())
@@ -372,7 +559,7 @@ class TestKuhnMethods(unittest.TestCase):
         vanilla_cfr = VanillaCFR(root, players)
         j, q, k = cards
 
-        KQ_node = root.get_children()[(k, q)]
+        KQ_node = root.play_cards((k, q))
         return vanilla_cfr, KQ_node
 
     def test_kq_1(self):
@@ -405,8 +592,8 @@ class TestKuhnMethods(unittest.TestCase):
 
         root = game.create_root_node()
 
-        TKQ_node = root.get_children()[(t, k, q)]
-        JKQ_node = root.get_children()[(j, k, q)]
+        TKQ_node = root.play_cards((t, k, q))
+        JKQ_node = root.play_cards((j, k, q))
 
         for node in [TKQ_node, JKQ_node]:
             self.assertTrue(np.allclose(node.play(PokerActions.RAISE_1).play(PokerActions.FOLD).play(PokerActions.FOLD).evaluation(), np.array([2, -1, -1])))
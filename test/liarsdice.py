@@ -1,14 +1,17 @@
 import unittest
 
-from liarsdice.liarsdice import LDGame, _get_ld_actions, LDAction, CALL, SPOT_ON
+from ld.liarsdice import LDGame, _get_ld_actions, LDAction, CALL, SPOT_ON, get_information_set_features, hand_index, \
+    face_counts, terminal_payoffs
 from game.player import create_player_set
+from optimizer.cfr import ExternalSamplingCFR
 import numpy as np
+import itertools
 import random
 
 class TestLDMethods(unittest.TestCase):
 
     def test_ld_actions(self):
-        actions = _get_ld_actions((3, 3), 5)
+        actions = _get_ld_actions(LDAction(False, False, 3, 3), 5)
         self.assertEqual(str(actions[0]), 'CALL')
         self.assertEqual(len(actions), 2 + 3 + 6 + 6)
 
@@ -53,5 +56,163 @@ class TestLDMethods(unittest.TestCase):
         with self.assertRaises(KeyError):
             root.play((3, 4, 1)).play((5, 1, 1)).play((6, 6, 3)).play_bet(2, 1).play_bet(1, 1)
 
+    def test_information_set_keys(self):
+        players = create_player_set(3)
+        ldgame = LDGame(players, 2)
+        root = ldgame.create_root_node()
+        state = root.play((4, 1)).play((5, 1)).play((1, 4)).play_bet(2, 1).play_bet(2, 6)
+        self.assertIsInstance(state.inf_set(), int)
+        self.assertTrue(state.inf_set() < 2 ** 64)
+
+        # the third player holds the same dice as the first, in another order
+        self.assertEqual(state.play_bet(3, 6).inf_set(), root.play((1, 4)).play((5, 1)).play((4, 1)).play_bet(2, 1).play_bet(2, 6).play_bet(3, 6).inf_set())
+        self.assertNotEqual(state.inf_set(), state.play_bet(3, 6).inf_set())
+
+        dice, history = ldgame.decode_information_set(state.play(CALL).inf_set())
+        self.assertEqual(dice, (1, 4))
+        self.assertEqual(history, [LDAction(False, False, 1, 2), LDAction(False, False, 6, 2), CALL])
+
+        for actions_state in [state, state.play_bet(3, 6), root.play((1, 1)).play((2, 2)).play((3, 3))]:
+            self.assertEqual(ldgame.information_set_actions(actions_state.inf_set()), actions_state.actions)
+        self.assertEqual(ldgame.information_set_actions(state.play(CALL).inf_set()), [])
+
+        public_state = ldgame.create_public_root().play_bet(2, 1).play_bet(2, 6)
+        self.assertEqual(ldgame.information_set(public_state, 2, hand_index((4, 1))), state.inf_set())
+
+    def test_information_set_features(self):
+        players = create_player_set(2)
+        state = LDGame(players, 2).create_root_node().play((3, 4)).play((5, 1)).play_bet(3, 2)
+        self.assertEqual(state.information_set_features(),
+                         get_information_set_features((5, 1), state.actions_history, 2))
+
+    def test_face_counts(self):
+        players = create_player_set(2)
+        state = LDGame(players, 2).create_root_node().play((3, 4)).play((4, 1)).play_bet(3, 2)
+        self.assertEqual(list(state.face_counts), [1, 0, 1, 2, 0, 0])
+        self.assertIs(state.play_bet(3, 3).face_counts, state.face_counts)
+        self.assertEqual(list(face_counts([(6, 6, 1)])), [1, 0, 0, 0, 0, 2])
+
+        counts = LDGame(players, 2).joint_face_counts()
+        self.assertEqual(counts.shape, (21, 21, 6))
+        self.assertTrue(np.all(counts.sum(axis=-1) == 4))
+
+    def test_terminal_payoffs(self):
+        counts = np.array([face_counts([(3, 4), (4, 1)]), face_counts([(4, 4), (5, 5)]), face_counts([(2, 2), (1, 6)])])
+        bet = LDAction(False, False, 4, 3)
+        # ones are wild: 3, 2 and 1 fours
+        self.assertTrue(np.allclose(terminal_payoffs(counts, bet, CALL, True, 2, 0, 1), [[.5, -.5], [-.5, .5], [-.5, .5]]))
+        self.assertTrue(np.allclose(terminal_payoffs(counts, bet, CALL, False, 2, 0, 1), [[-.5, .5], [-.5, .5], [-.5, .5]]))
+        self.assertTrue(np.allclose(terminal_payoffs(counts, bet, SPOT_ON, True, 2, 0, 1), [[-.5, .5], [.5, -.5], [.5, -.5]]))
+
+        # the same kernel evaluates single terminal states
+        root = LDGame(create_player_set(3), 2).create_root_node()
+        state = root.play((3, 4)).play((4, 1)).play((2, 6)).play_bet(2, 2).play_bet(3, 4)
+        for challenge in [CALL, SPOT_ON]:
+            expected = terminal_payoffs(state.face_counts, LDAction(False, False, 4, 3), challenge, True, 3, 1, 2)
+            self.assertTrue(np.allclose(state.play(challenge).evaluation(), expected))
+
+    def test_transient_states(self):
+        players = create_player_set(3)
+        root = LDGame(players, 3, max_cached_nodes=0).create_root_node()
+        state = root.play((3, 4, 1)).play((5, 1, 1)).play((6, 6, 3))
+        self.assertTrue(np.allclose(state.play_bet(2, 1).play_bet(2, 6).play(CALL).evaluation(), np.array([1./3, 1./3, -2./3])))
+        self.assertIsNone(root._children)
+        self.assertIsNone(state._children)
+        self.assertEqual(len(state.get_children()), 54)
+        self.assertIsNone(state._children)
+        with self.assertRaises(KeyError):
+            state.play_bet(2, 1).play_bet(1, 1)
+        with self.assertRaises(KeyError):
+            root.play((7, 1, 1))
+
+    def test_sampled_rolls(self):
+        players = create_player_set(3)
+        root = LDGame(players, 2).create_root_node()
+        outcome = root.sample_outcome()
+        self.assertEqual(len(outcome), 3)
+        self.assertTrue(all(len(dice) == 2 and all(1 <= die <= 6 for die in dice) for dice in outcome))
+        self.assertAlmostEqual(root.chance_probability(outcome), 1. / 6 ** 6)
+        self.assertAlmostEqual(root.chance_probability(outcome[0]), 1. / 6 ** 2)
+
+        # only the path to the first betting state is built
+        state = root.play_outcome(outcome)
+        self.assertFalse(state.is_chance())
+        self.assertIsNone(root._children)
+        self.assertEqual(len(root._sampled_children), 1)
+        self.assertIs(root.play(outcome[0]).play(outcome[1]).play(outcome[2]), state)
+        self.assertEqual(len(root.get_children()), 36)
+        self.assertIsNone(root._sampled_children)
+        self.assertIs(root.play_outcome(outcome), state)
+        self.assertFalse(root.sample_one().is_chance())
+
+    def test_node_cache_budget(self):
+        players = create_player_set(2)
+        root = LDGame(players, 2, max_cached_nodes=100).create_root_node()
+        for dice in [(3, 4), (1, 1), (6, 2)]:
+            state = root.play(dice).play((5, 1)).play_bet(1, 2)
+            self.assertIs(state.get_children(), state.get_children())
+            state.play_bet(2, 6).play(CALL)
+        cache = root._node_cache
+        self.assertTrue(cache.num_nodes <= 100)
+        self.assertEqual(cache.num_nodes, sum(len(node._children) for node in cache._expanded))
+        # the root's children were evicted long ago, they are built again when needed
+        self.assertIsNone(root._children)
+        self.assertEqual(len(root.get_children()), 36)
+
+    def test_sampled_rolls_are_cached(self):
+        players = create_player_set(2)
+        root = LDGame(players, 1, max_cached_nodes=30).create_root_node()
+        state = root.play_outcome(((3,), (5,)))
+        self.assertIs(root.play_outcome(((3,), (5,))), state)
+        bet = state.play_bet(1, 2)
+        self.assertIs(root.play_outcome(((3,), (5,))).play_bet(1, 2), bet)
+        self.assertIsNone(root._children)
+
+        # sampled children count against the budget and are evicted like expanded ones
+        cache = root._node_cache
+        first = root.play_outcome(((1,), (1,)))
+        for dice in itertools.product(range(1, 7), repeat=2):
+            root.play_outcome(((dice[0],), (dice[1],)))
+            self.assertTrue(cache.num_nodes <= 30)
+        self.assertEqual(cache.num_nodes, sum(cache._expanded.values()))
+        self.assertIsNot(root.play_outcome(((1,), (1,))), first)
+
+        # transient states are built for every sample
+        root = LDGame(players, 1, max_cached_nodes=0).create_root_node()
+        self.assertIsNot(root.play_outcome(((3,), (5,))), root.play_outcome(((3,), (5,))))
+
+    def test_terminal_children_are_kept(self):
+        players = create_player_set(2)
+        state = LDGame(players, 1).create_root_node().play((3,)).play((5,)).play_bet(1, 2).play(CALL)
+        self.assertEqual(state.get_children(), {})
+        self.assertIs(state.get_children(), state.get_children())
+
+    def test_compact_states(self):
+        players = create_player_set(3)
+        root = LDGame(players, 2).create_root_node()
+        first = root.play((3, 4)).play((5, 1)).play((6, 6))
+        state = first.play_bet(2, 3).play_bet(3, 1)
+        for node in [root, first, state]:
+            self.assertFalse(hasattr(node, '__dict__'))
+        # states of one roll share its face counts, and states of one bet their legal actions
+        self.assertIs(state.face_counts, first.face_counts)
+        self.assertIs(state.actions, root.play((1, 1)).play((2, 2)).play((3, 3)).play_bet(2, 3).play_bet(3, 1).actions)
+        self.assertEqual(state.actions_history, [LDAction(False, False, 3, 2), LDAction(False, False, 1, 3)])
+        self.assertIs(state.get_player_to_move(), players[2])
+        self.assertTrue(state.is_ones_valid())
+        self.assertFalse(first.play_bet(1, 1).play_bet(2, 5).is_ones_valid())
+
+    def test_external_sampling_with_node_cache(self):
+        players = create_player_set(2)
+        regrets = []
+        for max_cached_nodes in [None, 0, 50]:
+            random.seed(0)
+            np.random.seed(0)
+            cfr = ExternalSamplingCFR(LDGame(players, 1, max_cached_nodes).create_root_node(), players)
+            cfr.run(iterations=20)
+            regrets.append(cfr.infosets.regrets[:len(cfr.infosets)])
+        self.assertTrue(np.array_equal(regrets[0], regrets[1]))
+        self.assertTrue(np.array_equal(regrets[0], regrets[2]))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,73 @@
+import unittest
+import os
+import tempfile
+
+import numpy as np
+
+from ld.liarsdice import LDAction, get_information_set_features
+from optimizer.cfr import VanillaCFR
+from optimizer.infoset import InfoSetTable
+from optimizer.policy import export_policy, key_hash, PolicyFile
+from test.helpers import kuhn_game
+
+
+class TestPolicyMethods(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, 'policy.bin')
+        game, players = kuhn_game(3)
+        self.cfr = VanillaCFR(game.create_root_node(), players)
+        self.cfr.run(iterations=50)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_round_trip(self):
+        expected = self.cfr.average_strategy()
+        for dtype, places in [('float32', 6), ('float16', 3), ('uint8', 2)]:
+            export_policy(self.path, self.cfr.infosets, dtype=dtype)
+            policy = PolicyFile(self.path)
+            self.assertEqual(len(policy), len(expected))
+            for info_set, strategy in expected.items():
+                actual = policy.policy(info_set)
+                self.assertEqual(list(actual), list(strategy))
+                self.assertAlmostEqual(sum(actual.values()), 1.)
+                for action in strategy:
+                    self.assertAlmostEqual(actual[action], strategy[action], places=places)
+
+    def test_min_probability(self):
+        expected = self.cfr.average_strategy()
+        export_policy(self.path, self.cfr.infosets, min_probability=0.1)
+        policy = PolicyFile(self.path)
+        for info_set, strategy in expected.items():
+            kept = {action: p for action, p in strategy.items() if p >= 0.1}
+            actual = policy.policy(info_set)
+            self.assertEqual(set(actual), set(kept))
+            for action in kept:
+                self.assertAlmostEqual(actual[action], kept[action] / sum(kept.values()), places=6)
+
+    def test_unknown_keys(self):
+        export_policy(self.path, self.cfr.infosets)
+        policy = PolicyFile(self.path)
+        self.assertRaises(KeyError, policy.policy, 'no such information set')
+        self.assertIsNone(policy.get('no such information set'))
+        self.assertFalse('no such information set' in policy)
+
+    def test_feature_keys(self):
+        infosets = InfoSetTable()
+        history = [LDAction(False, False, 3, 1), LDAction(False, False, 3, 2)]
+        actions = [LDAction(True, False, 0, 0), LDAction(False, True, 0, 0), LDAction(False, False, 4, 2)]
+        for dice in [(1, 4), (2, 2), (6, 6)]:
+            iid = infosets.index(get_information_set_features(dice, history, 2), actions)
+            infosets.strategy_sum[iid, :3] = dice[0], dice[1], 1.
+        export_policy(self.path, infosets)
+        policy = PolicyFile(self.path)
+
+        key = get_information_set_features((2, 2), history, 2)
+        self.assertEqual(key_hash(key), key_hash(tuple(float(feature) for feature in key)))
+        actual = policy.policy(key)
+        self.assertEqual([str(action) for action in actual], ['CALL', 'SPOT_ON', "(2 4's)"])
+        self.assertTrue(np.allclose(list(actual.values()), [.4, .4, .2]))
+
+if __name__ == '__main__':
+    unittest.main()
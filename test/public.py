@@ -0,0 +1,81 @@
+import unittest
+import itertools
+
+import numpy as np
+
+from game.player import create_player_set
+from ld.liarsdice import LDGame, CALL, SPOT_ON
+from optimizer.cfr import VectorizedCFR, VectorFormCFR
+from optimizer.public import compile_public_tree
+from test.helpers import kuhn_game
+
+
+class TestPublicTreeMethods(unittest.TestCase):
+    def test_kuhn_public_tree(self):
+        game, players = kuhn_game(2)
+        tree = compile_public_tree(game, players)
+        # one node per betting sequence instead of one per deal
+        self.assertEqual(tree.num_nodes, 9)
+        self.assertEqual(len(tree.infosets), 12)
+        self.assertTrue(np.isclose(tree.deal_probabilities.sum(), 1.))
+        self.assertEqual(tree.deal_probabilities[0, 0], 0.)
+
+    def test_kuhn_terminal_utilities(self):
+        for num_players in [2, 3]:
+            game, players = kuhn_game(num_players)
+            root = game.create_root_node()
+            public_root = game.create_public_root()
+            cards = game.private_hands()
+            for deal, state in root.get_children().items():
+                hands = tuple(cards.index(card) for card in deal)
+                self.assert_terminals_match(game, state, public_root, hands)
+
+    def test_ld_terminal_utilities(self):
+        players = create_player_set(2)
+        game = LDGame(players, 2)
+        root = game.create_root_node()
+        hands = game.private_hands()
+        for first_roll, second_roll in [((3, 4), (5, 1)), ((1, 1), (2, 6)), ((6, 6), (6, 1))]:
+            state = root.play(first_roll).play(second_roll)
+            deal = tuple(hands.index(tuple(sorted(roll))) for roll in [first_roll, second_roll])
+            for count, die in itertools.product(range(1, 5), range(1, 7)):
+                for challenge in [CALL, SPOT_ON]:
+                    terminal = state.play_bet(count, die).play(challenge)
+                    public_terminal = game.create_public_root().play_bet(count, die).play(challenge)
+                    utilities = game.terminal_utilities(public_terminal)
+                    self.assertTrue(np.allclose(utilities[(slice(None),) + deal], terminal.evaluation()))
+
+    def assert_terminals_match(self, game, state, public_state, hands):
+        if state.is_terminal():
+            utilities = game.terminal_utilities(public_state)
+            self.assertTrue(np.allclose(utilities[(slice(None),) + hands], state.evaluation()))
+            return
+        for action in state.actions:
+            self.assert_terminals_match(game, state.play(action), public_state.play(action), hands)
+
+    def test_vector_form_matches_full_tree(self):
+        for num_players in [2, 3]:
+            game, players = kuhn_game(num_players)
+            cfr = VectorizedCFR(game.create_root_node(), players)
+            vector_cfr = VectorFormCFR(game, players)
+            cfr.run(iterations=50)
+            vector_cfr.run(iterations=50)
+
+            expected = cfr.average_strategy()
+            actual = vector_cfr.average_strategy()
+            self.assertEqual(expected.keys(), actual.keys())
+            for info_set in expected:
+                for action in expected[info_set]:
+                    self.assertAlmostEqual(expected[info_set][action], actual[info_set][action])
+
+            cfr.compute_nash_equilibrium()
+            self.assertTrue(np.allclose(cfr.value_of_the_game(), vector_cfr.value_of_the_game()))
+
+    def test_vector_form_game_value(self):
+        game, players = kuhn_game(2)
+        vector_cfr = VectorFormCFR(game, players)
+        vector_cfr.run(iterations=1000)
+        self.assertTrue(np.allclose(vector_cfr.value_of_the_game(), [-1. / 18, 1. / 18], atol=1E-3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+import numpy as np
+
+from optimizer.sampling import AliasTable, Sampler
+
+
+class TestSamplingMethods(unittest.TestCase):
+    def assert_frequencies(self, draw, probabilities, samples=40000):
+        counts = np.bincount([draw() for _ in range(samples)], minlength=len(probabilities))
+        self.assertTrue(np.allclose(counts / samples, probabilities, atol=0.01))
+
+    def test_sample(self):
+        sampler = Sampler(0)
+        for probabilities in [np.array([0.2, 0.3, 0.5]), np.array([0., 1., 0.]), np.random.dirichlet(np.ones(40))]:
+            self.assert_frequencies(lambda: sampler.sample(probabilities), probabilities)
+
+    def test_alias_table(self):
+        sampler = Sampler(0)
+        probabilities = np.array([0.05, 0.5, 0., 0.3, 0.15])
+        table = AliasTable(probabilities)
+        self.assert_frequencies(lambda: sampler.sample_alias(table), probabilities)
+        self.assertEqual(AliasTable([0., 0., 1.]).sample(0.1), 2)
+
+    def test_streams_are_reproducible(self):
+        draws = lambda sampler: [sampler.uniform() for _ in range(10000)]
+        self.assertEqual(draws(Sampler(1, block_size=100)), draws(Sampler(1, block_size=4096)))
+        first, second = Sampler(1).spawn(2)
+        self.assertEqual(draws(first), draws(Sampler(1).spawn(2)[0]))
+        self.assertNotEqual(draws(first), draws(second))
+
+        # unseeded samplers follow np.random.seed
+        np.random.seed(3)
+        expected = draws(Sampler())
+        np.random.seed(3)
+        self.assertEqual(draws(Sampler()), expected)
+
+    def test_state(self):
+        sampler = Sampler(0, block_size=16)
+        for _ in range(10):
+            sampler.uniform()
+        state = sampler.getstate()
+        expected = [sampler.uniform() for _ in range(40)]
+        sampler.setstate(state)
+        self.assertEqual([sampler.uniform() for _ in range(40)], expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+from optimizer.cfr import VanillaCFR, ExternalSamplingCFR
+from optimizer.compiled import compile_game_tree
+from optimizer.sampling import Sampler
+from optimizer.simulation import BatchedSimulator
+from test.helpers import kuhn_game
+
+
+def kuhn_tree(num_players):
+    game, players = kuhn_game(num_players)
+    return compile_game_tree(game.create_root_node(), players), players
+
+
+class TestSimulationMethods(unittest.TestCase):
+    def test_matches_game_value(self):
+        for num_players in [2, 3]:
+            tree, players = kuhn_tree(num_players)
+            cfr = VanillaCFR(tree, players)
+            cfr.run(iterations=100)
+            cfr.compute_nash_equilibrium()
+            expected = cfr.value_of_the_game()
+
+            result = BatchedSimulator(tree, players).simulate(cfr.infosets, 200000, Sampler(0), batch_size=30000)
+            self.assertEqual(result.games, 200000)
+            self.assertTrue(np.all(result.stderr > 0))
+            self.assertTrue(np.all(np.abs(result.mean - expected) < 4 * result.stderr))
+            self.assertTrue(np.all((result.low < result.mean) & (result.mean < result.high)))
+            self.assertAlmostEqual(result.mean.sum(), 0.)
+
+    def test_reproducible(self):
+        tree, players = kuhn_tree(2)
+        simulator = BatchedSimulator(tree, players)
+        strategies = tree.infosets.average_strategies()
+        first = simulator.simulate(strategies, 5000, Sampler(7))
+        self.assertTrue(np.array_equal(first.mean, simulator.simulate(strategies, 5000, Sampler(7)).mean))
+
+    def test_profiles_per_player(self):
+        tree, players = kuhn_tree(2)
+        cfr = VanillaCFR(tree, players)
+        cfr.run(iterations=200)
+        trained = cfr.infosets.average_strategies()
+        # always betting or calling against the trained strategy
+        aggressive = np.zeros_like(trained)
+        aggressive[:, 0] = 1.
+        simulator = BatchedSimulator(tree, players)
+        result = simulator.simulate([aggressive, trained], 100000, Sampler(0))
+        self.assertTrue(result.high[0] < -0.05)
+
+    def test_approximate_value_of_game(self):
+        tree, players = kuhn_tree(3)
+        cfr = ExternalSamplingCFR(tree, players)
+        cfr.run(iterations=100)
+        expected = BatchedSimulator(tree, players).simulate(cfr.infosets.current_strategies(), 100000, Sampler(0))
+        value = cfr.approximate_value_of_game(100000)
+        self.assertEqual(value.shape, (3,))
+        self.assertTrue(np.all(np.abs(value - expected.mean) < 6 * expected.stderr))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+
+from optimizer.cfr import VanillaCFR, CFRPlusSolver
+from optimizer.exploitability import BestResponse
+from optimizer.training import AnytimeTrainer
+from test.helpers import kuhn_game
+
+
+class TestTrainingMethods(unittest.TestCase):
+    def test_time_budget(self):
+        game, players = kuhn_game(2)
+        trainer = AnytimeTrainer(VanillaCFR(game.create_root_node(), players), time_budget=0.5, check_every=0.1)
+        result = trainer.train()
+        self.assertEqual(result['stopped_by'], 'time')
+        self.assertLess(result['seconds'], 1.)
+        self.assertGreater(len(result['checks']), 1)
+        # without a best response the latest average strategy is the best one
+        self.assertEqual(result['best']['iteration'], result['iterations'])
+
+    def test_exploitability_target(self):
+        game, players = kuhn_game(2)
+        best_response = BestResponse(game, players)
+        cfr = CFRPlusSolver(game.create_root_node(), players)
+        result = AnytimeTrainer(cfr, time_budget=60., target_exploitability=0.005, best_response=best_response,
+                                check_every=0.).train()
+        self.assertEqual(result['stopped_by'], 'exploitability')
+        self.assertLessEqual(result['best']['exploitability'], 0.005)
+        self.assertLessEqual(best_response.exploitability(cfr.infosets), 0.005)
+        self.assertEqual(min(check['exploitability'] for check in result['checks']), result['best']['exploitability'])
+
+    def test_strategy_change_target(self):
+        game, players = kuhn_game(2)
+        cfr = VanillaCFR(game.create_root_node(), players)
+        result = AnytimeTrainer(cfr, target_strategy_change=1e-3, max_iterations=10000, check_every=0.).train()
+        self.assertEqual(result['stopped_by'], 'strategy_change')
+        self.assertLess(result['iterations'], 10000)
+        self.assertIsNone(result['checks'][0]['strategy_change'])
+        self.assertLessEqual(result['checks'][-1]['strategy_change'], 1e-3)
+
+    def test_iteration_limit(self):
+        game, players = kuhn_game(3)
+        checked = []
+        trainer = AnytimeTrainer(VanillaCFR(game.create_root_node(), players), max_iterations=5, check_every=0.,
+                                 on_check=checked.append)
+        result = trainer.train()
+        self.assertEqual(result['stopped_by'], 'iterations')
+        self.assertEqual([check['iteration'] for check in checked], [1, 2, 3, 4, 5])
+
+    def test_needs_stopping_rule(self):
+        game, players = kuhn_game(2)
+        cfr = VanillaCFR(game.create_root_node(), players)
+        with self.assertRaises(ValueError):
+            AnytimeTrainer(cfr)
+        with self.assertRaises(ValueError):
+            AnytimeTrainer(cfr, target_exploitability=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()